@@ -1,18 +1,26 @@
 
-import neologdn
 import csv
 import argparse
 import re
-from collections import defaultdict
 import unicodedata
 import difflib
 
+_neologdn = None
+
+def get_neologdn():
+    """neologdnを初回呼び出し時にimportして返す"""
+    global _neologdn
+    if _neologdn is None:
+        import neologdn
+        _neologdn = neologdn
+    return _neologdn
+
 def normalize_text(text, remove_symbols=True, normalize_numbers=True):
     """neologdnを使ってテキストを正規化する"""
     if not text or not isinstance(text, str):
         return ""
         
-    normalized = neologdn.normalize(text)
+    normalized = get_neologdn().normalize(text)
     
     normalized = normalized.lower()
     
@@ -0,0 +1,183 @@
+import heapq
+import math
+import time
+import zlib
+
+import numpy as np
+
+def key_features(key, ngram=3, key_name='normalized'):
+    """キーを特徴量の列にする（形態素キーは空白区切りの単語、正規化キーは文字n-gram）"""
+    if key_name == 'morphological':
+        return key.split()
+    if len(key) <= ngram:
+        return [key]
+    return [key[k:k + ngram] for k in range(len(key) - ngram + 1)]
+
+def embed(keys, dim=128, features=4096, ngram=3, seed=0, chunk_size=4096, key_name='normalized'):
+    """特徴量をハッシュで固定長に畳み込み、ランダム射影でdim次元の単位ベクトルにする
+
+    ハッシュにはプロセス間で値が変わらないcrc32を使い、並列実行時も同じベクトルを得る。
+    """
+    rng = np.random.default_rng(seed)
+    projection = (rng.standard_normal((features, dim)) / math.sqrt(dim)).astype(np.float32)
+    vectors = np.empty((len(keys), dim), dtype=np.float32)
+
+    for start in range(0, len(keys), chunk_size):
+        stop = min(len(keys), start + chunk_size)
+        rows, cols, signs = [], [], []
+        for row, key in enumerate(keys[start:stop]):
+            for feature in key_features(key, ngram, key_name):
+                h = zlib.crc32(feature.encode('utf-8'))
+                rows.append(row)
+                cols.append(h % features)
+                # 上位ビットで符号を決め、衝突による偏りを打ち消す
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        counts = np.zeros((stop - start, features), dtype=np.float32)
+        np.add.at(counts, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), np.array(signs, dtype=np.float32))
+        vectors[start:stop] = counts @ projection
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class HnswIndex:
+    """NumPyで実装した階層的近傍グラフ（HNSW）によるコサイン類似度の近似最近傍探索"""
+
+    def __init__(self, vectors, m=16, ef_construction=100, seed=0):
+        self.vectors = vectors
+        self.m = m
+        self.max_degree = [2 * m]
+        self.ef_construction = max(ef_construction, m)
+        self.level_mult = 1 / math.log(max(m, 2))
+        self.rng = np.random.default_rng(seed)
+        self.layers = []  # 層ごとに {ノード番号: 隣接ノード番号のリスト}
+        self.entry_point = None
+
+        for i in range(len(vectors)):
+            self.add(i)
+
+    def similarities(self, query, nodes):
+        return self.vectors[nodes] @ query
+
+    def search_layer(self, query, entry_points, ef, layer):
+        """1つの層で、queryに近いノードをef個まで貪欲に探索する"""
+        graph = self.layers[layer]
+        visited = set(entry_points)
+        scores = self.similarities(query, entry_points)
+        candidates = [(-score, node) for node, score in zip(entry_points, scores.tolist())]
+        heapq.heapify(candidates)
+        found = [(score, node) for node, score in zip(entry_points, scores.tolist())]
+        heapq.heapify(found)
+        while len(found) > ef:
+            heapq.heappop(found)
+
+        while candidates:
+            negative, node = heapq.heappop(candidates)
+            if -negative < found[0][0] and len(found) >= ef:
+                break
+            neighbours = [other for other in graph.get(node, ()) if other not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for other, score in zip(neighbours, self.similarities(query, neighbours).tolist()):
+                if len(found) < ef or score > found[0][0]:
+                    heapq.heappush(candidates, (-score, other))
+                    heapq.heappush(found, (score, other))
+                    if len(found) > ef:
+                        heapq.heappop(found)
+        return sorted(found, reverse=True)
+
+    def connect(self, node, neighbours, layer):
+        graph = self.layers[layer]
+        limit = self.max_degree[0] if layer == 0 else self.m
+        graph[node] = [other for _, other in neighbours[:self.m]]
+        for other in graph[node]:
+            links = graph.setdefault(other, [])
+            links.append(node)
+            if len(links) > limit:
+                # 次数の上限を超えたら類似度の高い順に残す
+                scores = self.similarities(self.vectors[other], links)
+                keep = np.argsort(-scores, kind='stable')[:limit]
+                graph[other] = [links[k] for k in keep.tolist()]
+
+    def add(self, node):
+        level = int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+        query = self.vectors[node]
+        if self.entry_point is None:
+            self.layers = [{node: []} for _ in range(level + 1)]
+            self.entry_point = node
+            return
+
+        entry_points = [self.entry_point]
+        top = len(self.layers) - 1
+        for layer in range(top, level, -1):
+            entry_points = [self.search_layer(query, entry_points, 1, layer)[0][1]]
+        for layer in range(min(level, top), -1, -1):
+            neighbours = self.search_layer(query, entry_points, self.ef_construction, layer)
+            self.connect(node, neighbours, layer)
+            entry_points = [other for _, other in neighbours]
+
+        if level > top:
+            for _ in range(top + 1, level + 1):
+                self.layers.append({node: []})
+            self.entry_point = node
+
+    def query(self, vector, k, ef=64):
+        """vectorに近い順に (類似度, ノード番号) をk個返す"""
+        if self.entry_point is None:
+            return []
+        entry_points = [self.entry_point]
+        for layer in range(len(self.layers) - 1, 0, -1):
+            entry_points = [self.search_layer(vector, entry_points, 1, layer)[0][1]]
+        return self.search_layer(vector, entry_points, max(ef, k), 0)[:k]
+
+def nearest_neighbours(vectors, k, ef=64, m=16, backend='auto', seed=0):
+    """各ベクトルの近傍 (類似度, 番号) のリストと使った実装名を返す"""
+    if backend in ('auto', 'hnswlib'):
+        try:
+            import hnswlib
+        except ImportError:
+            if backend == 'hnswlib':
+                raise
+        else:
+            index = hnswlib.Index(space='ip', dim=vectors.shape[1])
+            index.init_index(max_elements=len(vectors), ef_construction=max(ef, m), M=m, random_seed=seed)
+            index.add_items(vectors, np.arange(len(vectors)), num_threads=1)
+            index.set_ef(max(ef, k))
+            labels, distances = index.knn_query(vectors, k=min(k, len(vectors)), num_threads=1)
+            # 内積空間の距離は 1 - 内積
+            return [list(zip((1 - row).tolist(), label_row.tolist())) for row, label_row in zip(distances, labels)], 'hnswlib'
+
+    index = HnswIndex(vectors, m, ef, seed)
+    return [index.query(vectors[i], k, ef) for i in range(len(vectors))], 'numpy'
+
+def block_ann(unique_keys, scorer, threshold, k=10, dim=128, ef=64, m=16, ngram=3, min_cosine=0.0,
+              backend='auto', stats=None, key='normalized', **options):
+    """ハッシュ化したn-gramベクトルの近似最近傍（上位k件）を候補ペアにする"""
+    start_time = time.time()
+    vectors = embed(unique_keys, dim, ngram=ngram, key_name=key)
+    neighbours, used_backend = nearest_neighbours(vectors, k + 1, ef, m, backend)
+    elapsed = time.time() - start_time
+
+    # 近傍関係は対称でないため、どちらから見つかった組も番号の小さい側の候補にする
+    candidates = [set() for _ in unique_keys]
+    for i, found in enumerate(neighbours):
+        for score, j in found:
+            if j != i and score >= min_cosine:
+                candidates[min(i, j)].add(max(i, j))
+
+    if stats is not None:
+        n = len(unique_keys)
+        stats['ann_index'] = {
+            "backend": used_backend,
+            "dim": dim,
+            "k": k,
+            "ef": ef,
+            "m": m,
+            "ngram": ngram,
+            "min_cosine": min_cosine,
+            "seconds": round(elapsed, 3),
+            "candidate_pairs": sum(len(others) for others in candidates),
+            "all_pairs": n * (n - 1) // 2,
+        }
+    return lambda i: sorted(candidates[i])
@@ -0,0 +1,190 @@
+import random
+import time
+from array import array
+
+from idf_index import document_frequencies, key_tokens
+
+CHECK_INTERVAL = 1024
+RATE_SAMPLES = 1000
+# 出現率がmax_dfを超えてもこの文書数以下のトークンは除かない（小さな入力でポスティングが空にならないように）
+MIN_STOP_DF = 64
+# しきい値未満だった組の記録の上限（超えたら消去する。消去後に同じ組を再び採点しても結果は変わらない）
+MAX_REJECTED = 1 << 20
+
+def cluster_anytime(unique_keys, scorer, score_fn, threshold, deadline, max_df=0.5, max_rejected=MAX_REJECTED,
+                    key='normalized'):
+    """共有するトークンが珍しい組から順に採点し、deadline（time.time()の値）になったら打ち切って類似グループを返す
+
+    トークンを文書頻度の昇順に並べ、各トークンのポスティング内の組を順に調べる。グループは代表（組の
+    うち先に出現した方、または既存のグループの代表）と、代表との類似度がしきい値以上のメンバーからなり、
+    メンバー同士やグループ同士はまとめないため、途中で打ち切っても通常のグループ化と同じ条件を満たす。
+    打ち切った場合は、残りの組から無作為に抽出した組を採点して、まだまとめられる一致の数を推定する。
+
+    トークンはキーの種類（key）で決める（形態素キーは単語、正規化キーは文字bigram）。
+    出現率がmax_dfを超えるトークン（idfブロッカーのstopモードと同じストップトークン）のポスティングは
+    調べない。複数のトークンを共有する組を何度も採点しないよう、しきい値未満だった組を記録するが、
+    記録はmax_rejected件で消去するため、使うメモリは組の数によらない。
+
+    ポスティングを調べ終えても時間が残っていれば、ストップトークンや1件にしか出現しないトークンだけを
+    共有する組（またはトークンを共有しない組）も調べるため、長さのブロッカー（length）の候補のうち
+    ポスティングで調べていない組を採点する。最後まで調べられた場合だけcompleteをTrueにする。
+    """
+    n = len(unique_keys)
+    token_sets = [key_tokens(unique_key, key) for unique_key in unique_keys]
+    df = document_frequencies(token_sets)
+    limit = max(max_df * n, MIN_STOP_DF)
+    stop_tokens = sum(1 for count in df.values() if count > limit)
+    postings = {}
+    for i, tokens in enumerate(token_sets):
+        for token in tokens:
+            if 1 < df[token] <= limit:
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = array('i')
+                posting.append(i)
+    order = sorted(postings, key=lambda token: (df[token], token))
+    total_pairs = sum(df[token] * (df[token] - 1) // 2 for token in order)
+
+    size = scorer['size']
+    min_ratio = scorer['min_ratio'](threshold) if threshold > 0 else 0.0
+    sizes = [size(key) for key in unique_keys]
+
+    # leader[i]: 未割り当てなら-1、グループに属していればその代表の番号
+    leader = array('i', [-1]) * n
+
+    def attachable(a, b):
+        """一方を他方のグループに加えられる組か（メンバーは他のグループに移さず、グループ同士もまとめない）"""
+        la, lb = leader[a], leader[b]
+        if la >= 0 and lb >= 0 or la >= 0 and la != a or lb >= 0 and lb != b:
+            return False
+        small, large = sorted((sizes[a], sizes[b]))
+        return not (large and small < large * min_ratio)
+
+    clusters = {}
+    rejected = set()
+    rejected_resets = 0
+    processed = scored = matches = 0
+    stopped = False
+    tokens_done = 0
+
+    def score_pair(head, other):
+        """代表headとotherを採点し、しきい値以上ならotherをheadのグループに加える"""
+        nonlocal scored, matches
+        score = score_fn(unique_keys[head], unique_keys[other])
+        scored += 1
+        if score < threshold:
+            return False
+        if leader[head] < 0:
+            leader[head] = head
+            clusters[head] = [(head, 1.0)]
+        leader[other] = head
+        clusters[head].append((other, score))
+        matches += 1
+        return True
+
+    for token in order:
+        posting = postings[token]
+        for x in range(len(posting) - 1):
+            a = posting[x]
+            for y in range(x + 1, len(posting)):
+                b = posting[y]
+                processed += 1
+                if processed % CHECK_INTERVAL == 0 and time.time() >= deadline:
+                    stopped = True
+                    break
+
+                if not attachable(a, b):
+                    continue
+                pair = a * n + b
+                if pair in rejected:
+                    continue
+
+                # ポスティングは昇順なので、どちらも未割り当てなら先に出現したaが代表になる
+                if not score_pair(*((b, a) if leader[b] == b else (a, b))):
+                    if len(rejected) >= max_rejected:
+                        rejected.clear()
+                        rejected_resets += 1
+                    rejected.add(pair)
+            if stopped:
+                break
+        if stopped:
+            break
+        tokens_done += 1
+
+    estimated_remaining = 0.0
+    if stopped:
+        estimated_remaining = estimate_remaining(order[tokens_done:], postings, token_sets, df, unique_keys, score_fn,
+                                                 threshold, attachable, leader)
+
+    # 残りの組の最終パス: 索引したトークンを共有する組はポスティングで調べ済みなので除く
+    final = {"leaders_processed": 0, "processed_pairs": 0, "scored_pairs": 0, "matches": 0}
+    if not stopped:
+        from pipeline import block_length
+        candidates = block_length(unique_keys, scorer, threshold)
+        scored_before, matches_before = scored, matches
+        for a in range(n):
+            for b in candidates(a):
+                final["processed_pairs"] += 1
+                if final["processed_pairs"] % CHECK_INTERVAL == 0 and time.time() >= deadline:
+                    stopped = True
+                    break
+                if not attachable(a, b):
+                    continue
+                small, large = sorted((token_sets[a], token_sets[b]), key=len)
+                if any(token in large and token in postings for token in small):
+                    continue
+                score_pair(*((b, a) if leader[b] == b else (a, b)))
+            if stopped:
+                break
+            final["leaders_processed"] += 1
+        final["scored_pairs"] = scored - scored_before
+        final["matches"] = matches - matches_before
+        if stopped:
+            # 調べた代表テキストあたりの一致数から、残りの代表テキストでの一致数をおおまかに見積もる
+            done = max(1, final["leaders_processed"])
+            unassigned = sum(1 for value in leader if value < 0)
+            estimated_remaining = min(unassigned, final["matches"] * (n - done) / done)
+
+    stats = {
+        "complete": not stopped,
+        "stopped_early": stopped,
+        "tokens_processed": tokens_done,
+        "tokens_total": len(order),
+        "stop_tokens": stop_tokens,
+        "processed_pairs": processed,
+        "total_pairs": total_pairs,
+        "processed_fraction": round(processed / total_pairs, 4) if total_pairs else 1.0,
+        "scored_pairs": scored,
+        "rejected_resets": rejected_resets,
+        "final_pass": final,
+        "matches": matches,
+        "estimated_remaining_matches": round(estimated_remaining),
+        "estimated_recall": round(matches / (matches + estimated_remaining), 4) if matches + estimated_remaining else 1.0,
+    }
+    return [clusters[head] for head in sorted(clusters)], stats
+
+def estimate_remaining(remaining_tokens, postings, token_sets, df, unique_keys, score_fn, threshold, attachable, leader,
+                       samples=RATE_SAMPLES, seed=0):
+    """未処理のトークンのポスティングから組を無作為に抽出して採点し、まだまとめられる一致の数を推定する
+
+    組は共有するトークンの数だけ重複して数えられるため、抽出した組は共有する未処理のトークン数で割って数え、
+    すでに処理したトークンを共有する組（調べ済み）は数えない。推定値は未割り当ての代表テキスト数で頭打ちにする。
+    """
+    weights = [df[token] * (df[token] - 1) // 2 for token in remaining_tokens]
+    total = sum(weights)
+    if not total:
+        return 0.0
+    remaining = set(remaining_tokens)
+    rng = random.Random(seed)
+    found = 0.0
+    for token in rng.choices(remaining_tokens, weights, k=samples):
+        x, y = sorted(rng.sample(range(len(postings[token])), 2))
+        a, b = postings[token][x], postings[token][y]
+        shared = {shared_token for shared_token in token_sets[a] & token_sets[b] if shared_token in postings}
+        if not shared <= remaining or not attachable(a, b):
+            continue
+        head, other = (b, a) if leader[b] == b else (a, b)
+        if score_fn(unique_keys[head], unique_keys[other]) >= threshold:
+            found += 1 / len(shared)
+    unassigned = sum(1 for value in leader if value < 0)
+    return min(unassigned, total * found / samples)
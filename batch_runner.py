@@ -0,0 +1,307 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from checkpoint import input_fingerprint
+from compressed_io import open_text
+from dedupe_index import text_hash
+from pipeline import ANALYZERS, NORMALIZERS, PRESETS, resolve, run_pipeline
+
+MEMORY_CACHE_SIZE = 200000
+FLUSH_SIZE = 2000
+SQLITE_TIMEOUT = 300.0
+
+def connect(path):
+    """複数のプロセスから同時に使うSQLiteのファイルを開く（書き込み中も読み込みを止めないWALモード）"""
+    connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+class SharedTextCache:
+    """正規化・形態素解析の結果を原文のハッシュで引く、プロセス間で共有するSQLiteのキャッシュ
+
+    同じプロセス内ではmemory_size件まで辞書でも保持し、新しい結果はflush_size件ごとにまとめて書き込む。
+    """
+
+    def __init__(self, path, memory_size=MEMORY_CACHE_SIZE, flush_size=FLUSH_SIZE):
+        self.connection = connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS texts (stage TEXT, digest BLOB, value TEXT, "
+                                "PRIMARY KEY (stage, digest)) WITHOUT ROWID")
+        self.connection.commit()
+        self.memory_size = memory_size
+        self.flush_size = flush_size
+        self.memory = {}
+        self.pending = []
+        self.counts = {"memory_hits": 0, "store_hits": 0, "misses": 0}
+
+    def wrap(self, stage, function):
+        """functionの結果をstage（'normalize:neologdn'など）の名前でキャッシュする関数を返す"""
+        def cached(text):
+            digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+            value = self.memory.get((stage, digest))
+            if value is not None:
+                self.counts["memory_hits"] += 1
+                return value
+            row = self.connection.execute("SELECT value FROM texts WHERE stage = ? AND digest = ?",
+                                          (stage, digest)).fetchone()
+            if row is not None:
+                value = row[0]
+                self.counts["store_hits"] += 1
+            else:
+                value = function(text)
+                self.counts["misses"] += 1
+                self.pending.append((stage, digest, value))
+                if len(self.pending) >= self.flush_size:
+                    self.flush()
+            if len(self.memory) >= self.memory_size:
+                self.memory.clear()
+            self.memory[(stage, digest)] = value
+            return value
+        return cached
+
+    def flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO texts VALUES (?, ?, ?)", self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+class DigestStore:
+    """意見募集ごとの正規化テキストのハッシュと件数を保存し、複数の意見募集にまたがるテキストを集計する"""
+
+    def __init__(self, path):
+        self.connection = connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS consultations (
+                name TEXT PRIMARY KEY, input_file TEXT, output_file TEXT, config TEXT, rows INTEGER,
+                distinct_texts INTEGER, finished_at REAL);
+            CREATE TABLE IF NOT EXISTS digests (
+                digest TEXT, consultation TEXT, count INTEGER, example TEXT,
+                PRIMARY KEY (digest, consultation)) WITHOUT ROWID;
+        """)
+        self.connection.commit()
+
+    def config(self, name):
+        """前回処理したときの入力ファイルと設定（未処理ならNone）"""
+        row = self.connection.execute("SELECT config FROM consultations WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def replace(self, name, input_file, output_file, config, counts, examples):
+        """意見募集のハッシュを入れ替える（同じ名前の前回の結果は削除する）"""
+        with self.connection:
+            self.connection.execute("DELETE FROM digests WHERE consultation = ?", (name,))
+            self.connection.executemany("INSERT INTO digests VALUES (?, ?, ?, ?)",
+                                        ((digest, name, count, examples[digest]) for digest, count in counts.items()))
+            self.connection.execute("INSERT OR REPLACE INTO consultations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (name, input_file, output_file, json.dumps(config, ensure_ascii=False),
+                                     sum(counts.values()), len(counts), time.time()))
+
+    def cross_groups(self, min_consultations=2):
+        """min_consultations件以上の意見募集に現れる正規化テキストを (ハッシュ, 意見募集数, 件数, 内訳, 例) で順に返す"""
+        return self.connection.execute("""
+            SELECT digest, COUNT(*) AS consultations, SUM(count) AS total,
+                   GROUP_CONCAT(consultation || ':' || count, ';'), MIN(example)
+            FROM digests GROUP BY digest HAVING consultations >= ?
+            ORDER BY consultations DESC, total DESC""", (min_consultations,))
+
+    def close(self):
+        self.connection.close()
+
+class DigestCollector:
+    """正規化の結果を受け取り、正規化テキストのハッシュごとの件数と原文の例を数える"""
+
+    def __init__(self):
+        self.counts = {}
+        self.examples = {}
+
+    def tap(self, normalizer):
+        def normalize(text):
+            normalized = normalizer(text)
+            if normalized:
+                digest = text_hash(normalized)
+                if digest in self.counts:
+                    self.counts[digest] += 1
+                else:
+                    self.counts[digest] = 1
+                    self.examples[digest] = text
+            return normalized
+        return normalize
+
+def read_manifest(path, output_dir, preset):
+    """マニフェスト（CSVまたはJSONの配列）を読み込み、意見募集ごとの設定のリストを返す
+
+    各項目はinput_file（必須）、name、output_file、preset、similarity、id_col、text_colを持つ。
+    """
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        with open_text(path, 'r', newline='') as f:
+            entries = [{key: value for key, value in row.items() if value not in (None, '')}
+                       for row in csv.DictReader(f)]
+
+    consultations = []
+    names = set()
+    for entry in entries:
+        input_file = entry['input_file']
+        name = entry.get('name') or os.path.basename(input_file).split('.')[0]
+        if name in names:
+            raise ValueError(f"マニフェストで名前が重複しています: {name}")
+        names.add(name)
+        entry_preset = entry.get('preset') or preset
+        consultations.append({
+            "name": name,
+            "input_file": input_file,
+            "output_file": entry.get('output_file') or os.path.join(output_dir, f"{name}.csv"),
+            "preset": entry_preset,
+            "similarity": float(entry.get('similarity') or PRESETS[entry_preset]['similarity']),
+            "id_col": int(entry.get('id_col', 0)),
+            "text_col": int(entry.get('text_col', 1)),
+        })
+    return consultations
+
+def run_consultation(consultation, cache_path, store_path):
+    """1件の意見募集を共有キャッシュを使って処理し、正規化テキストのハッシュをストアに保存する（ワーカーで実行）"""
+    start_time = time.time()
+    cache = SharedTextCache(cache_path)
+    collector = DigestCollector()
+
+    options = dict(PRESETS[consultation['preset']])
+    options.pop('similarity')
+    analyzer = options.pop('analyzer')
+    # 共有キャッシュ付きのステージを、このプロセスのレジストリに登録して使う
+    NORMALIZERS['shared-neologdn'] = collector.tap(cache.wrap('normalize:neologdn', resolve(NORMALIZERS['neologdn'])))
+    if ANALYZERS[analyzer] is not None:
+        ANALYZERS['shared-' + analyzer] = cache.wrap('analyze:' + analyzer, resolve(ANALYZERS[analyzer]))
+        analyzer = 'shared-' + analyzer
+
+    output_dir = os.path.dirname(consultation['output_file'])
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    stats = run_pipeline(consultation['input_file'], consultation['output_file'], consultation['similarity'],
+                         consultation['id_col'], consultation['text_col'], normalizer='shared-neologdn',
+                         analyzer=analyzer, **options)
+    cache.close()
+
+    store = DigestStore(store_path)
+    store.replace(consultation['name'], consultation['input_file'], consultation['output_file'],
+                  consultation_config(consultation), collector.counts, collector.examples)
+    store.close()
+    return {
+        "name": consultation['name'],
+        "total_items": stats['total_items'],
+        "distinct_normalized": len(collector.counts),
+        "exact_match_groups": stats['exact_match_groups'],
+        "similar_match_groups": stats['similar_match_groups'],
+        "text_cache": cache.counts,
+        "seconds": round(time.time() - start_time, 3),
+    }
+
+def consultation_config(consultation):
+    """前回と同じ入力・設定かどうかを判定するための情報"""
+    config = {name: consultation[name] for name in ('preset', 'similarity', 'id_col', 'text_col', 'output_file')}
+    config['input'] = input_fingerprint(consultation['input_file'])
+    return config
+
+def write_cross_report(store, report_file, min_consultations=2):
+    """複数の意見募集にまたがる正規化テキストをCSVに書き出し、グループ数を返す"""
+    groups = 0
+    with open_text(report_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['digest', 'consultations', 'total_count', 'counts', 'example_text'])
+        for row in store.cross_groups(min_consultations):
+            writer.writerow(row)
+            groups += 1
+    return groups
+
+def run_batch(manifest, output_dir, jobs=1, preset='word', cache_path=None, store_path=None, report_file=None,
+              min_consultations=2, force=False):
+    """マニフェストの意見募集をワーカープールで処理し、意見募集をまたがる重複を集計する
+
+    入力ファイルと設定が前回と同じ意見募集は、force=Trueでなければ処理を省いてストアの結果を使う。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cache_path = cache_path or os.path.join(output_dir, 'text_cache.sqlite')
+    store_path = store_path or os.path.join(output_dir, 'digests.sqlite')
+    report_file = report_file or os.path.join(output_dir, 'cross_consultation.csv')
+
+    consultations = read_manifest(manifest, output_dir, preset)
+    store = DigestStore(store_path)
+    SharedTextCache(cache_path).close()  # ワーカーが同時に表を作らないよう先に作っておく
+    pending = []
+    skipped = []
+    for consultation in consultations:
+        if not force and store.config(consultation['name']) == consultation_config(consultation):
+            skipped.append(consultation['name'])
+        else:
+            pending.append(consultation)
+    # 大きいファイルから順に割り当てて、最後に長い処理が1つだけ残るのを避ける
+    pending.sort(key=lambda consultation: -os.path.getsize(consultation['input_file']))
+    print(f"{len(consultations)}件の意見募集のうち{len(pending)}件を{jobs}プロセスで処理します"
+          f"（前回と同じ{len(skipped)}件は省略）")
+
+    start_time = time.time()
+    results = []
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(run_consultation, consultation, cache_path, store_path)
+                       for consultation in pending]
+            for future in as_completed(futures):
+                results.append(future.result())
+                print(f"完了: {results[-1]['name']}（{results[-1]['total_items']}件、{results[-1]['seconds']}秒）")
+    else:
+        for consultation in pending:
+            results.append(run_consultation(consultation, cache_path, store_path))
+    results.sort(key=lambda result: result['name'])
+
+    groups = write_cross_report(store, report_file, min_consultations)
+    store.close()
+
+    text_cache = {field: sum(result['text_cache'][field] for result in results)
+                  for field in ("memory_hits", "store_hits", "misses")}
+    stats = {
+        "consultations": len(consultations),
+        "processed": len(results),
+        "skipped": skipped,
+        "jobs": jobs,
+        "cross_consultation_groups": groups,
+        "min_consultations": min_consultations,
+        "text_cache": text_cache,
+        "runs": results,
+        "seconds": round(time.time() - start_time, 3),
+    }
+    with open(report_file + ".stats.json", 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    print(f"処理が完了しました。意見募集をまたがる重複テキスト{groups}件を{report_file}に保存しました。")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='複数の意見募集のCSVをまとめて処理し、意見募集をまたがる重複を検出するツール')
+    parser.add_argument('manifest', help='入力ファイルの一覧（input_file, name, output_file, preset, similarity, '
+                                         'id_col, text_colの列を持つCSV、または同じキーを持つJSONの配列）')
+    parser.add_argument('output_dir', help='出力ディレクトリ（各意見募集の結果、キャッシュ、集計を保存する）')
+    parser.add_argument('--jobs', type=int, default=1, help='同時に処理する意見募集の数（プロセス数）')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='word', help='マニフェストで指定がない場合のプリセット')
+    parser.add_argument('--text-cache', default=None, help='正規化・形態素解析の共有キャッシュ（既定: 出力ディレクトリのtext_cache.sqlite）')
+    parser.add_argument('--digest-store', default=None, help='正規化テキストのハッシュのストア（既定: 出力ディレクトリのdigests.sqlite）')
+    parser.add_argument('--report', default=None, help='意見募集をまたがる重複の出力先（既定: 出力ディレクトリのcross_consultation.csv）')
+    parser.add_argument('--min-consultations', type=int, default=2, help='重複として報告する意見募集の数の下限')
+    parser.add_argument('--force', action='store_true', help='入力と設定が前回と同じ意見募集も処理し直す')
+
+    args = parser.parse_args()
+    start_time = time.time()
+    run_batch(args.manifest, args.output_dir, args.jobs, args.preset, args.text_cache, args.digest_store, args.report,
+              args.min_consultations, args.force)
+    print(f"処理時間: {time.time() - start_time:.2f}秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+WORDS = "著作権 学習 利用 開発 段階 生成 画像 文章 作家 声優 漫画 権利 保護 法律 改正 議論 必要 懸念 データ 収集 無断 許諾 対価 補償 海外 日本 産業 文化".split()
+
+TEMPLATES = [
+    "昨今のAI生成を用いたイラストに対して非常に不快に感じています。その理由は大きく2つあります。",
+    "好きな作家さんが生成AIに模倣されて筆を折られたらすごく悲しくなるから嫌です",
+    "生成AIは規制、もしくは免許制にして欲しい",
+]
+
+def write_synthetic(path, rows, seed=0):
+    """テンプレートの重複を含む合成コメントのCSVを作成する"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'text'])
+        for i in range(rows):
+            if rng.random() < 0.1:
+                text = rng.choice(TEMPLATES)
+            else:
+                text = ''.join(rng.choice(WORDS) + rng.choice('がをにはの') for _ in range(rng.randint(5, 40))) + 'と考えます。'
+            writer.writerow([str(185001345000000000 + i), text])
+
+def peak_rss_mb():
+    # Linuxではキロバイト単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_legacy(input_file, id_col, text_col, normalize, analyze):
+    """従来のprocess_fileと同じ形でコメントを保持する"""
+    texts = []
+    normalized_texts = {}
+    morphological_texts = {}
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)  # ヘッダーをスキップ
+        for row in reader:
+            if len(row) <= max(id_col, text_col):
+                continue
+            id_value = row[id_col]
+            text = row[text_col]
+            texts.append((id_value, text))
+            normalized_texts[id_value] = normalize(text)
+            if analyze:
+                morphological_texts[id_value] = analyze(text)
+
+    key_texts = morphological_texts if analyze else normalized_texts
+    exact_match_groups = defaultdict(list)
+    for id_value, text in texts:
+        key = key_texts[id_value]
+        if key:
+            exact_match_groups[key].append((id_value, text))
+    return texts, normalized_texts, morphological_texts, exact_match_groups
+
+def load_table(input_file, id_col, text_col, normalize, analyze):
+    """CommentTableと行番号のグループでコメントを保持する"""
+    from pipeline import read_batches, normalize_batches, analyze_batches, collect, group_exact
+
+    batches = read_batches(input_file, id_col, text_col)
+    batches = normalize_batches(batches, normalize)
+    batches = analyze_batches(batches, analyze)
+    table = collect(batches)
+    exact_match_groups = group_exact(table.keys('morphological' if analyze else 'normalized'))
+    return table, exact_match_groups
+
+def measure(mode, input_file, id_col, text_col, morph):
+    """子プロセス内で1つの保持方式を計測する"""
+    from optimized_processor import normalize_text
+    analyze = None
+    if morph:
+        from optimized_morphological_processor import morphological_analysis, get_tokenizer
+        get_tokenizer()
+        analyze = morphological_analysis
+    normalize_text("準備")
+
+    baseline = peak_rss_mb()
+    start_time = time.perf_counter()
+    loader = load_legacy if mode == 'legacy' else load_table
+    result = loader(input_file, id_col, text_col, normalize_text, analyze)
+    elapsed = time.perf_counter() - start_time
+    peak = peak_rss_mb()
+
+    print(json.dumps({"mode": mode, "baseline_mb": round(baseline, 1), "peak_mb": round(peak, 1),
+                      "delta_mb": round(peak - baseline, 1), "seconds": round(elapsed, 2)}))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='コメント保持方式ごとのピークRSSを比較するベンチマーク')
+    parser.add_argument('--input', default=None, help='計測に使う入力CSV（省略時は合成データ）')
+    parser.add_argument('--rows', type=int, default=1000000, help='合成データの行数')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+    parser.add_argument('--morph', action='store_true', help='形態素解析の結果も保持する')
+    parser.add_argument('--mode', choices=['legacy', 'table'], default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.input, args.id_col, args.text_col, args.morph)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = args.input
+        if input_file is None:
+            input_file = os.path.join(tmp_dir, 'synthetic.csv')
+            print(f"合成データを作成中: {args.rows}件")
+            write_synthetic(input_file, args.rows)
+
+        results = {}
+        for mode in ('legacy', 'table'):
+            command = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--input', input_file,
+                       '--id-col', str(args.id_col), '--text-col', str(args.text_col)]
+            if args.morph:
+                command.append('--morph')
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode}: ピークRSS {results[mode]['peak_mb']}MB（増分 {results[mode]['delta_mb']}MB、{results[mode]['seconds']}秒）")
+
+    legacy_delta = results['legacy']['delta_mb']
+    table_delta = results['table']['delta_mb']
+    if legacy_delta > 0:
+        print(f"増分の削減率: {(1 - table_delta / legacy_delta) * 100:.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ENTRY_POINTS = [
+    'optimized_processor.py',
+    'morphological_processor.py',
+    'optimized_morphological_processor.py',
+    'word_based_similarity_processor.py',
+    'enhanced_similarity_processor.py',
+    'advanced_name_processor.py',
+]
+
+HEAVY_MODULES = ['janome.tokenizer', 'neologdn', 'tqdm']
+
+def run_timed(args, repeat=3):
+    """コマンドを複数回実行し、最短の実行時間（秒）を返す"""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def check_lazy_imports(module_name):
+    """モジュールのimport時に重い依存が読み込まれないことを確認する"""
+    code = (
+        f"import sys; import {module_name}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    return [m for m in result.stdout.strip().split(',') if m]
+
+TOKENIZER_CODE = (
+    "import resource, time; start = time.perf_counter(); "
+    "from optimized_morphological_processor import get_tokenizer; "
+    "list(get_tokenizer().tokenize('生成AIに関する意見です。')); "
+    "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+def tokenizer_startup(artifact, repeat=3):
+    """Tokenizerの生成と最初の解析までの時間（秒）と最大RSS（MB）を返す（artifact=Falseなら辞書の成果物を使わない）"""
+    env = dict(os.environ)
+    if not artifact:
+        env['PUBCOM_JANOME_ARTIFACT'] = 'off'
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', TOKENIZER_CODE], check=True, capture_output=True, text=True,
+                                env=env)
+        elapsed, rss = result.stdout.split()
+        if best is None or float(elapsed) < best[0]:
+            best = (float(elapsed), int(rss) / 1024)
+    return best
+
+def write_sample(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'text'])
+        for i in range(rows):
+            writer.writerow([str(i), f"生成AIに関する意見その{i % 50}です。"])
+
+def main():
+    parser = argparse.ArgumentParser(description='CLIエントリポイントの起動時間を計測するベンチマーク')
+    parser.add_argument('--help-budget', type=float, default=0.5, help='--helpの許容時間（秒）')
+    parser.add_argument('--exact-budget', type=float, default=2.0, help='完全一致のみの実行の許容時間（秒）')
+    parser.add_argument('--tokenizer-budget', type=float, default=0.15,
+                        help='辞書の成果物を使ったTokenizerの生成の許容時間（秒）')
+    parser.add_argument('--rows', type=int, default=1000, help='完全一致のみの実行に使う行数')
+    parser.add_argument('--repeat', type=int, default=3, help='各計測の繰り返し回数')
+
+    args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    failures = []
+
+    for script in ENTRY_POINTS:
+        loaded = check_lazy_imports(script[:-3])
+        if loaded:
+            failures.append(f"{script}: import時に{', '.join(loaded)}が読み込まれています")
+
+        elapsed = run_timed([script, '--help'], args.repeat)
+        status = "OK" if elapsed <= args.help_budget else "NG"
+        print(f"[{status}] {script} --help: {elapsed:.3f}秒（上限 {args.help_budget}秒）")
+        if status == "NG":
+            failures.append(f"{script} --help が上限を超えました")
+
+    # 成果物がなければ最初の実行で作成される
+    tokenizer_startup(True, 1)
+    baseline, baseline_rss = tokenizer_startup(False, args.repeat)
+    elapsed, rss = tokenizer_startup(True, args.repeat)
+    status = "OK" if elapsed <= args.tokenizer_budget else "NG"
+    print(f"[{status}] Tokenizerの生成（辞書の成果物）: {elapsed:.3f}秒・{rss:.0f}MB"
+          f"（成果物なし {baseline:.3f}秒・{baseline_rss:.0f}MB、上限 {args.tokenizer_budget}秒）")
+    if status == "NG":
+        failures.append("Tokenizerの生成が上限を超えました")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = os.path.join(tmp_dir, 'input.csv')
+        output_file = os.path.join(tmp_dir, 'output.csv')
+        write_sample(input_file, args.rows)
+
+        elapsed = run_timed(['optimized_processor.py', input_file, output_file, '--exact-only'], args.repeat)
+        status = "OK" if elapsed <= args.exact_budget else "NG"
+        print(f"[{status}] optimized_processor.py --exact-only（{args.rows}件）: {elapsed:.3f}秒（上限 {args.exact_budget}秒）")
+        if status == "NG":
+            failures.append("完全一致のみの実行が上限を超えました")
+
+    if failures:
+        for failure in failures:
+            print(f"失敗: {failure}")
+        sys.exit(1)
+
+    print("すべての起動時間が上限内です")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import csv
+import sys
+import time
+import tracemalloc
+
+def load_texts(input_file, text_col, limit):
+    texts = []
+    with open(input_file, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)  # ヘッダーをスキップ
+        for row in reader:
+            if len(row) > text_col and row[text_col]:
+                texts.append(row[text_col])
+            if limit and len(texts) >= limit:
+                break
+    return texts
+
+def measure(name, fn, texts, repeat):
+    """処理速度と割り当て量を計測する"""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for text in texts:
+            fn(text)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    for text in texts:
+        fn(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"name": name, "seconds": best, "peak_kb": peak / 1024, "blocks": sys.getallocatedblocks() - blocks_before}
+
+def main():
+    parser = argparse.ArgumentParser(description='形態素解析の処理速度と割り当て量を比較するベンチマーク')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+    parser.add_argument('--limit', type=int, default=2000, help='計測に使う件数')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+
+    args = parser.parse_args()
+
+    from optimized_morphological_processor import morphological_analysis, get_tokenizer
+    from fast_morph import PosFilterAnalyzer
+
+    texts = load_texts(args.input_file, args.text_col, args.limit)
+    tokenizer = get_tokenizer()
+    analyzer = PosFilterAnalyzer(tokenizer, cache_size=0)
+    cached_analyzer = PosFilterAnalyzer(tokenizer)
+
+    mismatches = sum(1 for text in texts if analyzer.analyze(text) != morphological_analysis(text))
+    if mismatches:
+        print(f"警告: {mismatches}件で従来の結果と一致しません")
+
+    # 形態素の総数（全品詞）とフィルタ後の単語数
+    total_tokens = sum(1 for text in texts for _ in tokenizer.tokenize(text))
+    kept_tokens = sum(len(analyzer.token_ids(text)) for text in texts)
+    print(f"{len(texts)}件、形態素{total_tokens}個（抽出{kept_tokens}個）")
+
+    results = [
+        measure("morphological_analysis", morphological_analysis, texts, args.repeat),
+        measure("PosFilterAnalyzer.analyze", analyzer.analyze, texts, args.repeat),
+        measure("PosFilterAnalyzer.token_ids", analyzer.token_ids, texts, args.repeat),
+        measure("PosFilterAnalyzer（キャッシュあり）", cached_analyzer.analyze, texts, 1),
+    ]
+
+    baseline = results[0]["seconds"]
+    for result in results:
+        print(f"{result['name']:<30} {total_tokens / result['seconds']:>10.0f} tokens/秒  "
+              f"{baseline / result['seconds']:.2f}倍  ピーク{result['peak_kb']:.0f}KB  残存ブロック{result['blocks']}")
+
+if __name__ == "__main__":
+    main()
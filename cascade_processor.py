@@ -0,0 +1,293 @@
+import csv
+import argparse
+import json
+import time
+
+from comment_table import StringColumn, key_digest, row_array
+from compressed_io import open_text, rounded
+from pipeline import (SCORERS, BLOCKERS, resolve, read_batches, generate_candidates,
+                      score_candidates, cluster_greedy)
+
+# 安いステージから順に適用する完全一致ステージ
+EXACT_STAGES = [
+    ('raw', None),
+    ('normalized', 'optimized_processor:normalize_text'),
+    ('morphological', 'optimized_morphological_processor:morphological_analysis'),
+]
+
+def merge_units(units, keys):
+    """キーが一致するユニットをまとめ、[ユニット, キー, まとめた元のユニットの位置のリスト] のリストを返す
+
+    空のキーのユニットはまとめずにそのまま残す。
+    """
+    positions = {}
+    merged_units = []
+    for source, (unit, key) in enumerate(zip(units, keys)):
+        digest = key_digest(key)
+        position = positions.get(digest) if digest is not None else None
+        if position is None:
+            if digest is not None:
+                positions[digest] = len(merged_units)
+            merged_units.append([row_array(unit), key, [source]])
+        else:
+            merged_units[position][0].extend(unit)
+            merged_units[position][2].append(source)
+    return merged_units
+
+def add_group(groups, stage, rows, key, score, earlier):
+    """グループを追加し、その番号を返す
+
+    earlierはまとめた元のユニットがそれまでに属していたグループの番号（なければNone）のリストで、
+    それらのグループは出力せず、段階と件数を新しいグループの小グループとして記録する。
+    """
+    sub_groups = []
+    for index in earlier:
+        if index is not None:
+            stage_before, rows_before, _, _, sub_groups_before = groups[index]
+            sub_groups.extend(sub_groups_before)
+            sub_groups.append((stage_before, len(rows_before)))
+            groups[index] = None
+    groups.append((stage, rows, key, score, sub_groups))
+    return len(groups) - 1
+
+def template_stage(units, keys, matcher, min_coverage, ids, tags_file):
+    """正規化テキストを既知のテンプレートと照合し、被覆率がmin_coverage以上のユニットをテンプレートごとにまとめる
+
+    いずれかのテンプレートの文を含むコメントは、照合結果をtags_fileに1行ずつ書き出す。
+    戻り値は (残りのユニットの位置のリスト, テンプレートごとの (ユニットの位置のリスト, 被覆率のリスト), タグを付けた行数)。
+    """
+    remaining = []
+    matched = {}
+    tagged = 0
+    with open_text(tags_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'template_id', 'template_coverage', 'comment_coverage', 'matched_templates'])
+        for position, (unit, key) in enumerate(zip(units, keys)):
+            matches, comment_coverage = matcher.match(key) if key else ([], 0.0)
+            if matches:
+                template_id, coverage = matches[0]
+                others = ';'.join(f"template_{other}:{other_coverage:.4f}" for other, other_coverage in matches)
+                for row in unit:
+                    writer.writerow([ids[row], f"template_{template_id}", f"{coverage:.4f}", f"{comment_coverage:.4f}",
+                                     others])
+                tagged += len(unit)
+                if coverage >= min_coverage:
+                    positions, coverages = matched.setdefault(template_id, ([], []))
+                    positions.append(position)
+                    coverages.append(coverage)
+                    continue
+            remaining.append(position)
+    return remaining, matched, tagged
+
+def process_file(input_file, output_file, similarity_threshold=0.5, id_col=0, text_col=1, sample_size=None,
+                 scorer='jaccard', blocker='length', templates_file=None, template_coverage=0.8):
+    """完全一致（原文→正規化→形態素解析）と類似度の段階的な判定でテキストをグループ化する
+
+    templates_fileを指定した場合は、正規化の後に既知のテンプレートと照合し、テンプレートを
+    template_coverage以上の割合で含むコメントをテンプレートごとにまとめて以降の段階から除く。
+
+    各行は、その行を含む最後の段階のグループに1回だけ出力し、それより前の段階でまとめられていた
+    グループは段階と件数をsub_groups列に記録する。
+    """
+    print("テキストの読み込みを開始...")
+    ids = StringColumn()
+    texts = StringColumn()
+    io_stats = {"input": {}, "output": {}}
+    for batch in read_batches(input_file, id_col, text_col, sample_size, io_stats=io_stats['input']):
+        ids.extend(batch['ids'])
+        texts.extend(batch['texts'])
+    print(f"読み込み完了: {len(texts)}件のテキスト")
+
+    # 各ユニットは行番号の配列で、先頭の行を代表とする
+    units = [row_array([row]) for row in range(len(texts)) if texts.raw(row)]
+    # groups: (段階, 行番号の配列, キー, 類似度, 小グループ)、後の段階のグループに含まれたものはNone
+    # unit_groups: 各ユニットが属するグループの番号（なければNone）
+    groups = []
+    unit_groups = [None] * len(units)
+    stage_stats = {}
+
+    for stage, spec in EXACT_STAGES:
+        start_time = time.time()
+        key_fn = resolve(spec)
+        print(f"{stage}ステージ: {len(units)}件の代表テキストを処理...")
+        keys = [texts[unit[0]] if key_fn is None else key_fn(texts[unit[0]]) for unit in units]
+        merged_units = merge_units(units, keys)
+
+        next_groups = []
+        for unit, key, sources in merged_units:
+            if len(sources) > 1:
+                next_groups.append(add_group(groups, stage, unit, key, 1.0, [unit_groups[s] for s in sources]))
+            else:
+                next_groups.append(unit_groups[sources[0]])
+
+        stage_stats[stage] = {
+            "input_units": len(units),
+            "absorbed": len(units) - len(merged_units),
+            "groups": sum(1 for _, _, sources in merged_units if len(sources) > 1),
+            "seconds": round(time.time() - start_time, 3),
+        }
+        units = [unit for unit, _, _ in merged_units]
+        keys = [key for _, key, _ in merged_units]
+        unit_groups = next_groups
+
+        if stage == 'normalized' and templates_file:
+            from containment_index import read_templates
+            from template_matcher import TemplateMatcher
+
+            start_time = time.time()
+            templates = read_templates(templates_file)
+            matcher = TemplateMatcher(templates, key_fn)
+            print(f"templateステージ: {len(templates)}件のテンプレート（{matcher.patterns}文）と照合...")
+            input_units = len(units)
+            remaining, matched, tagged = template_stage(units, keys, matcher, template_coverage, ids,
+                                                        output_file + ".templates.csv")
+            for template_id in sorted(matched):
+                positions, coverages = matched[template_id]
+                rows = row_array()
+                total_coverage = 0.0
+                for position, coverage in zip(positions, coverages):
+                    rows.extend(units[position])
+                    total_coverage += coverage * len(units[position])
+                add_group(groups, 'template', rows, templates[template_id], total_coverage / len(rows),
+                          [unit_groups[position] for position in positions])
+            units = [units[position] for position in remaining]
+            keys = [keys[position] for position in remaining]
+            unit_groups = [unit_groups[position] for position in remaining]
+            stage_stats['template'] = {
+                "input_units": input_units,
+                "absorbed": input_units - len(units),
+                "groups": len(matched),
+                "templates": len(templates),
+                "sentences": matcher.patterns,
+                "automaton_states": len(matcher.automaton),
+                "tagged_rows": tagged,
+                "seconds": round(time.time() - start_time, 3),
+            }
+
+    # 形態素解析のキーが空のユニットは類似度の判定から除外する
+    candidates_units = [(position, key) for position, key in enumerate(keys) if key]
+    unique_keys = [key for _, key in candidates_units]
+
+    start_time = time.time()
+    print(f"類似度ステージ: {len(unique_keys)}件の代表テキストを処理...")
+    scorer_spec = SCORERS[scorer]
+    score_fn = resolve(scorer_spec['function'])
+    assigned = bytearray(len(unique_keys))
+    pair_counts = {"candidate_pairs": 0, "scored_pairs": 0}
+
+    def counted_candidates():
+        # 近似ステージ（ブロッカー）が残した候補ペア数を数える
+        candidates = resolve(BLOCKERS[blocker])(unique_keys, scorer_spec, similarity_threshold, key='morphological')
+        for i, others in generate_candidates(candidates, len(unique_keys)):
+            others = list(others)
+            pair_counts["candidate_pairs"] += len(others)
+            yield i, others
+
+    def counted_score(key1, key2):
+        pair_counts["scored_pairs"] += 1
+        return score_fn(key1, key2)
+
+    scored = score_candidates(counted_candidates(), unique_keys, counted_score, similarity_threshold, assigned)
+
+    similar_count = 0
+    absorbed = 0
+    for cluster in cluster_greedy(scored, assigned):
+        if len(cluster) <= 1:
+            continue
+        rows = row_array()
+        item_scores = []
+        positions = [candidates_units[i][0] for i, _ in cluster]
+        for position, (_, score) in zip(positions, cluster):
+            unit = units[position]
+            rows.extend(unit)
+            item_scores.extend([score] * len(unit))
+        # 代表テキスト以外のアイテムの類似度の平均
+        avg_similarity = sum(item_scores[1:]) / (len(item_scores) - 1)
+        add_group(groups, 'similar', rows, unique_keys[cluster[0][0]], avg_similarity,
+                  [unit_groups[position] for position in positions])
+        similar_count += 1
+        absorbed += len(cluster) - 1
+
+    stage_stats['similar'] = {
+        "input_units": len(unique_keys),
+        "absorbed": absorbed,
+        "groups": similar_count,
+        "candidate_pairs": pair_counts["candidate_pairs"],
+        "scored_pairs": pair_counts["scored_pairs"],
+        "seconds": round(time.time() - start_time, 3),
+    }
+
+    output_groups = [group for group in groups if group is not None]
+    for stage in stage_stats:
+        stage_stats[stage]["output_groups"] = sum(1 for group in output_groups if group[0] == stage)
+
+    print("結果の出力...")
+    with open_text(output_file, 'w', io_stats['output'], newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['group_id', 'match_type', 'count', 'representative_text', 'matched_text', 'similarity_score', 'ids', 'original_texts', 'sub_groups'])
+
+        counters = {}
+        for stage, rows, key, score, sub_groups in output_groups:
+            group_id = counters.get(stage, 0)
+            counters[stage] = group_id + 1
+            writer.writerow([
+                f"{stage}_{group_id}",
+                stage,
+                len(rows),
+                texts[rows[0]],
+                key,
+                "1.0" if stage not in ('similar', 'template') else f"{score:.4f}",
+                '|'.join(ids[row] for row in rows),
+                '|'.join(texts[row] for row in rows),
+                ';'.join(f"{stage_before}:{count}" for stage_before, count in sub_groups)
+            ])
+
+    stats = {
+        "total_items": len(texts),
+        # 出力したグループと、どのグループにも入らなかった行の数（空のテキストの行は除く）
+        "remaining_units": len(output_groups) + sum(1 for row in range(len(texts)) if texts.raw(row))
+                           - sum(len(group[1]) for group in output_groups),
+        "stages": stage_stats,
+        "similarity_threshold": similarity_threshold,
+        "scorer": scorer,
+        "blocker": blocker,
+        "template_coverage": template_coverage if templates_file else None,
+        "io": {name: rounded(value) for name, value in io_stats.items()},
+    }
+
+    with open(output_file + ".stats.json", 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    print(f"処理が完了しました。結果は{output_file}に保存されています。")
+    for stage, stage_stat in stage_stats.items():
+        print(f"  {stage}: {stage_stat['input_units']}件中{stage_stat['absorbed']}件を吸収（{stage_stat['groups']}グループ、{stage_stat['seconds']}秒）")
+
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='原文・正規化・形態素解析・類似度の段階的判定による類似テキストグループ化ツール')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('output_file', help='出力CSVファイルのパス')
+    parser.add_argument('--similarity', type=float, default=0.5, help='類似度のしきい値（0.0〜1.0）')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+    parser.add_argument('--sample', type=int, default=None, help='処理するサンプル数（指定しない場合は全件処理）')
+    parser.add_argument('--scorer', choices=sorted(SCORERS), default='jaccard', help='最終ステージの類似度の計算方法')
+    parser.add_argument('--blocker', choices=sorted(BLOCKERS), default='length', help='候補ペアの絞り込み方法')
+    parser.add_argument('--templates', default=None,
+                        help='既知のテンプレートのCSV（1列目がテキスト）。正規化の後に照合し、一致したコメントを先にまとめる')
+    parser.add_argument('--template-coverage', type=float, default=0.8,
+                        help='テンプレートにまとめるのに必要な、テンプレートの文が含まれている割合（0.0〜1.0）')
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    stats = process_file(args.input_file, args.output_file, args.similarity, args.id_col, args.text_col, args.sample,
+                         args.scorer, args.blocker, args.templates, args.template_coverage)
+    end_time = time.time()
+
+    print(f"処理時間: {end_time - start_time:.2f}秒")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+from pipeline import PRESETS, run_pipeline
+
+# 全ての組（all）と同じ結果になるべきブロッカー（取りこぼしのない絞り込み）
+LOSSLESS_BLOCKERS = [
+    ('length', {}),
+    ('idf', {'mode': 'prefix'}),
+]
+
+def check_blockers(input_file, presets=None, sample_size=2000, id_col=0, text_col=1):
+    """各プリセットで、取りこぼしのないブロッカーの出力がallの出力と一致するかを確かめ、一致しない組み合わせを返す"""
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for preset in presets or sorted(PRESETS):
+            options = dict(PRESETS[preset])
+            similarity = options.pop('similarity')
+            expected = os.path.join(work_dir, f"{preset}_all.csv")
+            run_pipeline(input_file, expected, similarity, id_col, text_col, sample_size, blocker='all', **options)
+            for blocker, blocker_options in LOSSLESS_BLOCKERS:
+                output = os.path.join(work_dir, f"{preset}_{blocker}.csv")
+                run_pipeline(input_file, output, similarity, id_col, text_col, sample_size, blocker=blocker,
+                             blocker_options=blocker_options, **options)
+                same = filecmp.cmp(expected, output, shallow=False)
+                print(f"{preset}/{blocker}: {'一致' if same else '不一致'}")
+                if not same:
+                    failures.append((preset, blocker))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='取りこぼしのないブロッカーの出力が全ペア比較と一致するかを確かめる回帰チェック')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('--presets', nargs='+', choices=sorted(PRESETS), default=None, help='確かめるプリセット')
+    parser.add_argument('--sample', type=int, default=2000, help='処理するサンプル数')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+
+    args = parser.parse_args()
+    start_time = time.time()
+    failures = check_blockers(args.input_file, args.presets, args.sample, args.id_col, args.text_col)
+    print(f"確認時間: {time.time() - start_time:.2f}秒")
+    if failures:
+        print("allと出力が異なるブロッカー: " + '、'.join(f"{preset}/{blocker}" for preset, blocker in failures))
+        sys.exit(1)
+    print("全てのプリセットでallと同じ出力でした")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+from array import array
+
+from comment_table import CommentTable, ExactGroups, StringColumn
+
+MANIFEST = 'manifest.json'
+TABLE_COLUMNS = ('ids', 'texts', 'normalized', 'morphological')
+EXACT_ARRAYS = (('first_rows', 'i'), ('rows', 'i'), ('offsets', 'q'), ('group_of_row', 'i'))
+
+def input_fingerprint(input_file):
+    """入力ファイルが変更されていないかを確かめるための情報"""
+    info = os.stat(input_file)
+    return {"path": os.path.abspath(input_file), "size": info.st_size, "mtime_ns": info.st_mtime_ns}
+
+def skip_rows(batches, count):
+    """先頭からcount行を読み飛ばしたバッチを返す（再開時に処理済みの行を除く）"""
+    for batch in batches:
+        size = len(batch['ids'])
+        if count >= size:
+            count -= size
+            continue
+        if count:
+            batch = {name: values[count:] for name, values in batch.items()}
+            count = 0
+        yield batch
+
+class RunCheckpoint:
+    """実行ディレクトリに各ステージの途中結果を保存し、中断した実行を再開する
+
+    表の列と類似グループは追記し、書き込み済みの長さをmanifest.jsonに記録する。
+    manifest.jsonは一時ファイルからの置き換えで更新するため、保存中に中断されても
+    直前に完了したチェックポイントまでの内容で再開できる。
+    """
+
+    def __init__(self, run_dir, config, resume=False, interval=60.0):
+        self.run_dir = run_dir
+        self.interval = interval
+        self.last_save = time.time()
+        os.makedirs(run_dir, exist_ok=True)
+
+        manifest = None
+        if resume and os.path.exists(self.path(MANIFEST)):
+            with open(self.path(MANIFEST), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest['config'] != config:
+                changed = sorted(name for name in set(config) | set(manifest['config'])
+                                 if config.get(name) != manifest['config'].get(name))
+                raise ValueError(f"実行ディレクトリの設定が現在の指定と異なるため再開できません: {', '.join(changed)}")
+        elif resume:
+            print(f"{run_dir}にチェックポイントがないため最初から実行します")
+
+        if manifest is None:
+            manifest = {"config": config, "table": {"rows": 0, "lengths": {}, "done": False},
+                        "exact": False, "edges": False,
+                        "similar": {"next_leader": 0, "next_group": 0, "length": 0, "done": False}}
+            for name in os.listdir(run_dir):
+                if name != MANIFEST and name.split('.', 1)[0] in ('table', 'exact', 'edges', 'similar'):
+                    os.remove(self.path(name))
+        self.manifest = manifest
+        self.save_manifest()
+
+    def path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def save_manifest(self):
+        tmp_path = self.path(MANIFEST + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path(MANIFEST))
+        self.last_save = time.time()
+
+    def due(self):
+        """前回の保存からinterval秒以上経過したか"""
+        return time.time() - self.last_save >= self.interval
+
+    def append(self, name, data, length):
+        """ファイルを記録済みの長さlengthに切り詰めてからdataを追記する"""
+        with open(self.path(name), 'ab') as f:
+            f.truncate(length)
+            f.write(data)
+        return length + len(data)
+
+    def read(self, name, length):
+        with open(self.path(name), 'rb') as f:
+            return f.read(length)
+
+    # --- 読み込み・正規化・形態素解析 ---
+
+    def load_table(self):
+        """保存済みの行を復元したCommentTableと、読み込みが完了しているかを返す"""
+        state = self.manifest['table']
+        if not state['rows']:
+            return None, False
+        table = CommentTable()
+        for name in TABLE_COLUMNS:
+            if name + '.data' not in state['lengths']:
+                continue
+            column = StringColumn()
+            column.data = bytearray(self.read(f'table.{name}.data', state['lengths'][name + '.data']))
+            column.offsets = array('q')
+            column.offsets.frombytes(self.read(f'table.{name}.offsets', state['lengths'][name + '.offsets']))
+            setattr(table, name, column)
+        return table, state['done']
+
+    def save_table(self, table, done=False):
+        """前回の保存以降に追加された行を列ごとのファイルに追記する"""
+        state = self.manifest['table']
+        saved_rows = state['rows']
+        lengths = state['lengths']
+        for name in TABLE_COLUMNS:
+            column = getattr(table, name)
+            if column is None:
+                continue
+            data_length = lengths.get(name + '.data', 0)
+            offsets_length = lengths.get(name + '.offsets', 0)
+            # 先頭のオフセット0は最初の保存でだけ書き込む
+            first = saved_rows + 1 if offsets_length else 0
+            lengths[name + '.data'] = self.append(f'table.{name}.data', column.data[data_length:], data_length)
+            lengths[name + '.offsets'] = self.append(f'table.{name}.offsets', column.offsets[first:].tobytes(),
+                                                     offsets_length)
+        state['rows'] = len(table)
+        state['done'] = done
+        self.save_manifest()
+
+    # --- 完全一致グループ ---
+
+    def load_exact(self, column):
+        if not self.manifest['exact']:
+            return None
+        groups = ExactGroups.__new__(ExactGroups)
+        groups.column = column
+        for name, typecode in EXACT_ARRAYS:
+            values = array(typecode)
+            with open(self.path(f'exact.{name}'), 'rb') as f:
+                values.frombytes(f.read())
+            setattr(groups, name, values)
+        return groups
+
+    def save_exact(self, groups):
+        for name, _ in EXACT_ARRAYS:
+            with open(self.path(f'exact.{name}'), 'wb') as f:
+                getattr(groups, name).tofile(f)
+        self.manifest['exact'] = True
+        self.save_manifest()
+
+    # --- 並列実行時の類似ペア ---
+
+    def load_edges(self):
+        if not self.manifest['edges']:
+            return None
+        edges = {}
+        with open(self.path('edges.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                i, matches = json.loads(line)
+                edges[i] = [tuple(match) for match in matches]
+        return edges
+
+    def save_edges(self, edges):
+        with open(self.path('edges.jsonl'), 'w', encoding='utf-8') as f:
+            for i, matches in edges.items():
+                f.write(json.dumps([i, matches]) + '\n')
+        self.manifest['edges'] = True
+        self.save_manifest()
+
+    # --- 類似グループ ---
+
+    def load_similar(self, n):
+        """処理済みフラグ、保存済みの (グループ番号, クラスタ) のリスト、再開位置と次のグループ番号を返す"""
+        state = self.manifest['similar']
+        # 再開位置より前は代表かメンバーとして処理済みで、それ以降はクラスタのメンバーだけが処理済み
+        assigned = bytearray(b'\x01' * state['next_leader'] + bytes(n - state['next_leader']))
+        clusters = []
+        if state['length']:
+            for line in self.read('similar.jsonl', state['length']).decode('utf-8').splitlines():
+                group_id, cluster = json.loads(line)
+                cluster = [tuple(member) for member in cluster]
+                for i, _ in cluster:
+                    assigned[i] = 1
+                clusters.append((group_id, cluster))
+        return assigned, clusters, state['next_leader'], state['next_group'], state['done']
+
+    def save_similar(self, clusters, next_leader, next_group, done=False):
+        """前回の保存以降に確定したクラスタを追記し、再開位置を記録する
+
+        処理済みフラグは再開位置とクラスタのメンバーから復元できるため保存しない。
+        """
+        state = self.manifest['similar']
+        lines = ''.join(json.dumps([group_id, cluster]) + '\n' for group_id, cluster in clusters)
+        state['length'] = self.append('similar.jsonl', lines.encode('utf-8'), state['length'])
+        state['next_leader'] = next_leader
+        state['next_group'] = next_group
+        state['done'] = done
+        self.save_manifest()
@@ -0,0 +1,175 @@
+import hashlib
+from array import array
+
+class StringColumn:
+    """文字列の列をUTF-8の連結バイト列とオフセット配列で保持する"""
+
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].decode('utf-8')
+
+    def raw(self, row):
+        """デコードせずにUTF-8のバイト列を返す"""
+        return self.data[self.offsets[row]:self.offsets[row + 1]]
+
+    def __iter__(self):
+        data = self.data
+        offsets = self.offsets
+        for row in range(len(offsets) - 1):
+            yield data[offsets[row]:offsets[row + 1]].decode('utf-8')
+
+    def append(self, value):
+        self.data += value.encode('utf-8')
+        self.offsets.append(len(self.data))
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def extend_column(self, other):
+        """別の列の値を末尾に連結する"""
+        base = len(self.data)
+        self.data += other.data
+        self.offsets.extend(base + offset for offset in other.offsets[1:])
+
+    def nbytes(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+class CommentTable:
+    """コメントのID・原文・正規化テキスト・形態素解析結果を列ごとに保持する表
+
+    各コメントは行番号（int32）で参照し、グループは行番号の配列として持つ。
+    """
+
+    __slots__ = ('ids', 'texts', 'normalized', 'morphological')
+
+    def __init__(self):
+        self.ids = StringColumn()
+        self.texts = StringColumn()
+        self.normalized = StringColumn()
+        self.morphological = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, batch):
+        """ステージから受け取ったバッチを末尾に追加する"""
+        self.ids.extend(batch['ids'])
+        self.texts.extend(batch['texts'])
+        self.normalized.extend(batch['normalized'])
+        if 'morphological' in batch:
+            if self.morphological is None:
+                self.morphological = StringColumn()
+            self.morphological.extend(batch['morphological'])
+
+    def extend_table(self, other):
+        """別の表の行を末尾に連結する"""
+        self.ids.extend_column(other.ids)
+        self.texts.extend_column(other.texts)
+        self.normalized.extend_column(other.normalized)
+        if other.morphological is not None:
+            if self.morphological is None:
+                self.morphological = StringColumn()
+            self.morphological.extend_column(other.morphological)
+
+    def keys(self, key):
+        """完全一致・類似度計算に使う列を返す"""
+        if key == 'normalized':
+            return self.normalized
+        if self.morphological is None:
+            raise ValueError("形態素解析の結果がありません")
+        return self.morphological
+
+    def nbytes(self):
+        columns = [self.ids, self.texts, self.normalized, self.morphological]
+        return sum(column.nbytes() for column in columns if column is not None)
+
+def key_digest(key):
+    """キーのダイジェストを計算する（空のキーはNone）"""
+    if not key:
+        return None
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+class ExactGroups:
+    """キーが完全一致する行のグループを、行番号の連続配列とオフセット配列で保持する
+
+    キー文字列は表の列を参照し、グループごとには代表行の行番号だけを持つ。
+    グループは代表行（最初に出現した行）の順に並ぶ。
+    """
+
+    __slots__ = ('column', 'first_rows', 'rows', 'offsets', 'group_of_row')
+
+    def __init__(self, column, digests=None):
+        self.column = column
+        group_of_row = self.group_of_row = array('i', bytes(4 * len(column)))
+        self.first_rows = array('i')
+        group_index = {}
+
+        for row in range(len(column)):
+            # 分割処理で計算済みのダイジェストがあればそれを使う
+            digest = digests[row] if digests is not None else key_digest(column.raw(row))
+            if digest is None:  # 空のテキストはスキップ
+                group_of_row[row] = -1
+                continue
+            group = group_index.get(digest)
+            if group is None:
+                group = group_index[digest] = len(self.first_rows)
+                self.first_rows.append(row)
+            group_of_row[row] = group
+        del group_index
+
+        # グループごとの件数からオフセットを求め、行番号をグループ順に並べ直す
+        self.offsets = array('q', bytes(8 * (len(self.first_rows) + 1)))
+        for group in group_of_row:
+            if group >= 0:
+                self.offsets[group + 1] += 1
+        for group in range(len(self.first_rows)):
+            self.offsets[group + 1] += self.offsets[group]
+
+        cursor = array('q', self.offsets[:-1])
+        self.rows = array('i', bytes(4 * self.offsets[-1]))
+        for row, group in enumerate(group_of_row):
+            if group >= 0:
+                self.rows[cursor[group]] = row
+                cursor[group] += 1
+
+    def __len__(self):
+        return len(self.first_rows)
+
+    def group_of(self, row):
+        """行が属するグループの番号を返す（空のキーの行は-1）"""
+        return self.group_of_row[row]
+
+    def key(self, group):
+        return self.column[self.first_rows[group]]
+
+    def group_rows(self, group):
+        return self.rows[self.offsets[group]:self.offsets[group + 1]]
+
+    def size(self, group):
+        return self.offsets[group + 1] - self.offsets[group]
+
+    def keys(self):
+        return [self.key(group) for group in range(len(self))]
+
+    def values(self):
+        for group in range(len(self)):
+            yield self.group_rows(group)
+
+    def items(self):
+        for group in range(len(self)):
+            yield self.key(group), self.group_rows(group)
+
+def row_array(rows=()):
+    """行番号を保持するint32配列を作る"""
+    return array('i', rows)
@@ -0,0 +1,214 @@
+import io
+import os
+import queue
+import threading
+import time
+import zlib
+
+READ_BYTES = 1024 * 1024
+QUEUE_BLOCKS = 8
+
+def gzip_decompressor():
+    return zlib.decompressobj(wbits=31)
+
+def gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+def xz_decompressor():
+    import lzma
+    return lzma.LZMADecompressor()
+
+def xz_compressor():
+    import lzma
+    return lzma.LZMACompressor()
+
+def zstandard_module():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(".zstファイルの読み書きにはzstandardが必要です（pip install zstandard）") from None
+    return zstandard
+
+def zst_decompressor():
+    return zstandard_module().ZstdDecompressor().decompressobj()
+
+def zst_compressor():
+    return zstandard_module().ZstdCompressor().compressobj()
+
+# 拡張子ごとの (圧縮オブジェクト, 展開オブジェクト) の生成関数
+CODECS = {
+    '.gz': ('gzip', gzip_compressor, gzip_decompressor),
+    '.xz': ('xz', xz_compressor, xz_decompressor),
+    '.zst': ('zstd', zst_compressor, zst_decompressor),
+}
+
+def codec_of(path):
+    """拡張子から圧縮形式を返す（非圧縮ならNone）"""
+    return CODECS.get(os.path.splitext(path)[1].lower())
+
+def is_compressed(path):
+    return codec_of(path) is not None
+
+def new_io_stats(path, codec):
+    return {"path": path, "codec": codec, "file_bytes": 0, "bytes": 0, "codec_seconds": 0.0}
+
+class ThreadedDecompressor(io.RawIOBase):
+    """別スレッドで圧縮ファイルを読み込んで展開し、展開済みのバイト列を順に返す
+
+    展開はスレッドで行うため、呼び出し側のCSV解析と重なって進む。
+    連結された複数のストリーム（gzipのメンバーなど）も続けて展開する。
+    """
+
+    def __init__(self, path, new_decompressor, stats):
+        self.stats = stats
+        self.file = open(path, 'rb')
+        self.new_decompressor = new_decompressor
+        self.blocks = queue.Queue(QUEUE_BLOCKS)
+        self.pending = b''
+        self.error = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            decompressor = self.new_decompressor()
+            started = False
+            while not self.stopped:
+                data = self.file.read(READ_BYTES)
+                if not data:
+                    if started and not decompressor.eof:
+                        raise EOFError(f"圧縮ファイルが途中で終わっています: {self.file.name}")
+                    break
+                started = True
+                self.stats["file_bytes"] += len(data)
+                while data:
+                    start = time.perf_counter()
+                    block = decompressor.decompress(data)
+                    self.stats["codec_seconds"] += time.perf_counter() - start
+                    if block:
+                        self.stats["bytes"] += len(block)
+                        self.blocks.put(block)
+                    data = b''
+                    if decompressor.eof:
+                        # 続くストリームは新しい展開オブジェクトで展開する
+                        data = decompressor.unused_data
+                        decompressor = self.new_decompressor()
+                        started = bool(data)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.blocks.put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            block = self.blocks.get()
+            if block is None:
+                self.blocks.put(None)
+                if self.error is not None:
+                    raise self.error
+                return 0
+            self.pending = memoryview(block)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+            # 展開スレッドが満杯のキューで止まらないよう読み捨てる
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.file.close()
+        super().close()
+
+class CompressingWriter(io.RawIOBase):
+    """書き込まれたバイト列を圧縮してファイルに書き出す"""
+
+    def __init__(self, path, new_compressor, stats):
+        self.stats = stats
+        self.compressor = new_compressor()
+        self.file = open(path, 'wb')
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        start = time.perf_counter()
+        block = self.compressor.compress(bytes(data))
+        self.stats["codec_seconds"] += time.perf_counter() - start
+        self.stats["bytes"] += len(data)
+        if block:
+            self.file.write(block)
+            self.stats["file_bytes"] += len(block)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            start = time.perf_counter()
+            block = self.compressor.flush()
+            self.stats["codec_seconds"] += time.perf_counter() - start
+            self.file.write(block)
+            self.stats["file_bytes"] += len(block)
+            self.file.close()
+        super().close()
+
+class CountingFile(io.RawIOBase):
+    """非圧縮ファイルの読み書きしたバイト数を数える"""
+
+    def __init__(self, path, mode, stats):
+        self.stats = stats
+        self.file = open(path, mode + 'b')
+
+    def readable(self):
+        return self.file.readable()
+
+    def writable(self):
+        return self.file.writable()
+
+    def readinto(self, buffer):
+        size = self.file.readinto(buffer)
+        self.stats["file_bytes"] += size
+        self.stats["bytes"] += size
+        return size
+
+    def write(self, data):
+        size = self.file.write(data)
+        self.stats["file_bytes"] += size
+        self.stats["bytes"] += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+def open_text(path, mode='r', stats=None, newline=None):
+    """拡張子（.gz/.xz/.zst）に応じて圧縮ファイルをテキストとして開く
+
+    stats（辞書）を渡すと、ファイル上のバイト数、展開後のバイト数、圧縮・展開にかかった秒数を記録する。
+    """
+    codec = codec_of(path)
+    io_stats = new_io_stats(path, codec[0] if codec else None)
+    if stats is not None:
+        stats.update(io_stats)
+        io_stats = stats
+
+    if mode == 'r':
+        raw = ThreadedDecompressor(path, codec[2], io_stats) if codec else CountingFile(path, 'r', io_stats)
+        return io.TextIOWrapper(io.BufferedReader(raw, READ_BYTES), encoding='utf-8', newline=newline)
+    if mode == 'w':
+        raw = CompressingWriter(path, codec[1], io_stats) if codec else CountingFile(path, 'w', io_stats)
+        return io.TextIOWrapper(io.BufferedWriter(raw, READ_BYTES), encoding='utf-8', newline=newline)
+    raise ValueError(f"対応していないモード: {mode}")
+
+def rounded(stats):
+    """統計情報に書き出すため秒数を丸める"""
+    return {name: round(value, 3) if isinstance(value, float) else value for name, value in stats.items()}
@@ -0,0 +1,190 @@
+import argparse
+import csv
+import json
+import math
+import time
+from array import array
+
+from comment_table import ExactGroups
+from compressed_io import open_text, rounded
+from idf_index import document_frequencies, posting_histogram, key_tokens
+from pipeline import ANALYZERS, KEY_COLUMNS, NORMALIZERS, analyze_batches, collect, normalize_batches, read_batches, resolve
+
+def required_overlap(size, threshold):
+    """包含率がthreshold以上になるために、テンプレートのsize個のトークンのうち含まれるべき数"""
+    return max(1, math.ceil(threshold * size - 1e-9))
+
+class ContainmentIndex:
+    """文書のトークン集合の転置インデックスで、テンプレートのトークンを一定の割合以上含む文書を探す
+
+    包含率 |T∩D|/|T| がthreshold以上の文書は、テンプレートのトークンを文書頻度の昇順に並べたときの
+    先頭 |T| - ceil(threshold|T|) + 1 個（珍しいトークン）のどれかを必ず含む。この接頭辞のポスティングだけを
+    読んで候補を集め、トークン数の足りない文書を除いてから実際の包含率を確かめるため、取りこぼしはなく、
+    頻出語の長いポスティングを読まずに済む。
+    """
+
+    def __init__(self, token_sets):
+        self.token_sets = token_sets
+        self.sizes = array('i', (len(tokens) for tokens in token_sets))
+        self.df = document_frequencies(token_sets)
+        self.postings = {}
+        for i, tokens in enumerate(token_sets):
+            for token in tokens:
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = array('i')
+                posting.append(i)
+        self.searched = {"queries": 0, "postings_read": 0, "candidates": 0, "verified": 0, "matches": 0}
+
+    def search(self, tokens, threshold, min_size=0):
+        """tokensのthreshold以上の割合を含み、トークン数がmin_size以上の文書の (番号, 包含率) を返す"""
+        if not tokens:
+            return []
+        needed = required_overlap(len(tokens), threshold)
+        min_size = max(min_size, needed)
+        ordered = sorted(tokens, key=lambda token: (self.df.get(token, 0), token))
+        prefix = ordered[:len(ordered) - needed + 1]
+
+        candidates = set()
+        for token in prefix:
+            posting = self.postings.get(token, ())
+            self.searched["postings_read"] += len(posting)
+            candidates.update(posting)
+
+        matches = []
+        for i in candidates:
+            if self.sizes[i] < min_size:
+                continue
+            self.searched["verified"] += 1
+            overlap = len(tokens & self.token_sets[i])
+            if overlap >= needed:
+                matches.append((i, overlap / len(tokens)))
+        self.searched["queries"] += 1
+        self.searched["candidates"] += len(candidates)
+        self.searched["matches"] += len(matches)
+        matches.sort()
+        return matches
+
+    def stats(self):
+        return {
+            "documents": len(self.token_sets),
+            "vocabulary": len(self.df),
+            "postings": posting_histogram(len(posting) for posting in self.postings.values()),
+            **self.searched,
+        }
+
+def token_set(key, key_name):
+    """キーをトークンの集合にする（形態素キーは単語、正規化キーは文字bigram）"""
+    if key_name != 'morphological':
+        key = key.replace(' ', '')
+    return key_tokens(key, key_name)
+
+def read_templates(path):
+    """テンプレートのCSV（1列目がテキスト、ヘッダーあり）を読み込む"""
+    with open_text(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [row[0] for row in reader if row and row[0]]
+
+def find_containment(input_file, output_file, threshold=0.8, id_col=0, text_col=1, sample_size=None, key='morphological',
+                     templates_file=None, min_count=3, max_template_tokens=40, min_length_ratio=1.0):
+    """短いテンプレートを一定の割合以上含む、より長いコメントを探す
+
+    テンプレートはtemplates_fileのテキスト、省略時はキーが完全一致する行がmin_count件以上あり、
+    トークン数がmax_template_tokens以下のテキストとする。見つかった組は1組1行のCSVに出力する。
+    """
+    from tqdm import tqdm
+
+    print("テキストの読み込み・正規化・形態素解析を開始...")
+    io_stats = {"input": {}, "output": {}}
+    normalize = resolve(NORMALIZERS['neologdn'])
+    analyzer = resolve(ANALYZERS['morph']) if key == 'morphological' else None
+    batches = read_batches(input_file, id_col, text_col, sample_size, io_stats=io_stats['input'])
+    batches = analyze_batches(normalize_batches(batches, normalize), analyzer)
+    table = collect(tqdm(batches, desc="バッチ処理", unit="batch"))
+    print(f"読み込み完了: {len(table)}件のテキスト")
+
+    start_time = time.time()
+    groups = ExactGroups(table.keys(key))
+    unique_keys = groups.keys()
+    token_sets = [token_set(unique_key, key) for unique_key in unique_keys]
+    index = ContainmentIndex(token_sets)
+    index_seconds = time.time() - start_time
+
+    # テンプレートは (表示用のテキスト, トークン集合, 自身の代表テキストの番号) とする
+    if templates_file:
+        templates = []
+        for text in read_templates(templates_file):
+            template_key = normalize(text) if analyzer is None else analyzer(text)
+            templates.append((text, token_set(template_key, key), None))
+    else:
+        templates = [(table.texts[groups.group_rows(i)[0]], token_sets[i], i) for i in range(len(unique_keys))
+                     if groups.size(i) >= min_count and 0 < len(token_sets[i]) <= max_template_tokens]
+    print(f"{len(templates)}件のテンプレートで、{len(unique_keys)}件の代表テキストを検索します")
+
+    start_time = time.time()
+    found = 0
+    with open_text(output_file, 'w', io_stats['output'], newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['template_id', 'template_text', 'containment', 'row_index', 'id', 'text'])
+        for template_id, (text, tokens, own) in enumerate(tqdm(templates, desc="包含検索")):
+            min_size = math.ceil(len(tokens) * min_length_ratio)
+            for i, containment in index.search(tokens, threshold, min_size):
+                if i == own:
+                    continue
+                for row in groups.group_rows(i):
+                    writer.writerow([f"template_{template_id}", text, f"{containment:.4f}", row, table.ids[row],
+                                     table.texts[row]])
+                    found += 1
+    search_seconds = time.time() - start_time
+
+    stats = {
+        "total_items": len(table),
+        "unique_keys": len(unique_keys),
+        "templates": len(templates),
+        "matched_rows": found,
+        "threshold": threshold,
+        "key": key,
+        "min_length_ratio": min_length_ratio,
+        # 全ての組を比較した場合のペア数との比較用
+        "brute_force_pairs": len(templates) * len(unique_keys),
+        "index": index.stats(),
+        "index_seconds": round(index_seconds, 3),
+        "search_seconds": round(search_seconds, 3),
+        "io": {name: rounded(value) for name, value in io_stats.items()},
+    }
+    with open(output_file + ".stats.json", 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    print(f"処理が完了しました。結果は{output_file}に保存されています。")
+    print(f"統計情報: テンプレート{len(templates)}件を含む{found}行（候補{index.searched['candidates']}件を確認、"
+          f"全組み合わせ{stats['brute_force_pairs']}組）")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='短いテンプレートを一定の割合以上含む長いコメントを探すツール')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('output_file', help='出力CSVファイルのパス')
+    parser.add_argument('--containment', type=float, default=0.8,
+                        help='テンプレートのトークンのうち含まれるべき割合（0.0〜1.0）')
+    parser.add_argument('--templates', default=None,
+                        help='テンプレートのCSV（1列目がテキスト）。省略時は入力中の完全一致が多いテキストを使う')
+    parser.add_argument('--min-count', type=int, default=3, help='テンプレートとみなす完全一致の件数の下限')
+    parser.add_argument('--max-template-tokens', type=int, default=40, help='テンプレートとみなすトークン数の上限')
+    parser.add_argument('--min-length-ratio', type=float, default=1.0,
+                        help='検索対象のトークン数のテンプレートに対する比の下限（1.0ならテンプレート以上の長さ）')
+    parser.add_argument('--key', choices=sorted(KEY_COLUMNS), default='morphological',
+                        help='トークンにするキー（morphological: 形態素、normalized: 正規化テキストの文字bigram）')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+    parser.add_argument('--sample', type=int, default=None, help='処理するサンプル数（指定しない場合は全件処理）')
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    find_containment(args.input_file, args.output_file, args.containment, args.id_col, args.text_col, args.sample,
+                     args.key, args.templates, args.min_count, args.max_template_tokens, args.min_length_ratio)
+    print(f"処理時間: {time.time() - start_time:.2f}秒")
+
+if __name__ == "__main__":
+    main()
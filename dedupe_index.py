@@ -0,0 +1,174 @@
+import csv
+import argparse
+import hashlib
+import json
+import time
+from collections import defaultdict, Counter
+
+from optimized_morphological_processor import normalize_text, morphological_analysis
+from word_based_similarity_processor import calculate_word_similarity
+
+def text_hash(normalized_text):
+    """正規化テキストのハッシュ値を計算する"""
+    return hashlib.blake2b(normalized_text.encode('utf-8'), digest_size=16).hexdigest()
+
+def analyze(text):
+    """テキストを正規化と形態素解析にかける"""
+    return normalize_text(text), morphological_analysis(text)
+
+class DedupeIndex:
+    """正規化テキストのハッシュ表と形態素トークンの候補インデックスを保持するグループ索引"""
+
+    def __init__(self, similarity_threshold=0.5, max_candidates=50):
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+        self.groups = []
+        self.exact_index = {}
+        self.postings = defaultdict(set)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def _add_postings(self, group_index, morph_text):
+        for word in set(morph_text.split()):
+            self.postings[word].add(group_index)
+
+    def candidates(self, morph_text):
+        """共有トークン数の多い順に候補グループを返す"""
+        counter = Counter()
+        for word in set(morph_text.split()):
+            for group_index in self.postings.get(word, ()):
+                counter[group_index] += 1
+        return [group_index for group_index, _ in counter.most_common(self.max_candidates)]
+
+    def exact(self, normalized_text):
+        """完全一致するグループを検索する（形態素解析より前に呼ぶ。該当なしの場合はNone）"""
+        group_index = self.exact_index.get(text_hash(normalized_text)) if normalized_text else None
+        if group_index is None:
+            return None
+        return {"group_index": group_index, "match_type": "exact", "score": 1.0}
+
+    def lookup(self, normalized_text, morph_text):
+        """正規化済みテキストが属するグループを検索する（該当なしの場合はNone）"""
+        if not normalized_text:
+            return None
+
+        group_index = self.exact_index.get(text_hash(normalized_text))
+        if group_index is not None:
+            return {"group_index": group_index, "match_type": "exact", "score": 1.0}
+
+        best_index = None
+        best_score = 0.0
+        for group_index in self.candidates(morph_text):
+            score = calculate_word_similarity(morph_text, self.groups[group_index]["morphological_text"])
+            if score > best_score:
+                best_index, best_score = group_index, score
+
+        if best_index is not None and best_score >= self.similarity_threshold:
+            return {"group_index": best_index, "match_type": "similar", "score": best_score}
+        return None
+
+    def insert(self, id_value, text, normalized_text, morph_text):
+        """コメントをインデックスに追加し、所属グループの検索結果を返す"""
+        result = self.lookup(normalized_text, morph_text)
+        if not normalized_text:
+            return result
+
+        if result is None:
+            group_index = len(self.groups)
+            self.groups.append({
+                "group_id": f"group_{group_index}",
+                "representative_id": id_value,
+                "representative_text": text,
+                "morphological_text": morph_text,
+                "ids": [id_value],
+            })
+            self.exact_index[text_hash(normalized_text)] = group_index
+            self._add_postings(group_index, morph_text)
+            return {"group_index": group_index, "match_type": "new", "score": 1.0}
+
+        group_index = result["group_index"]
+        self.groups[group_index]["ids"].append(id_value)
+        # 類似一致したテキストも以降は完全一致で引けるようにする
+        self.exact_index.setdefault(text_hash(normalized_text), group_index)
+        return result
+
+    def describe(self, result):
+        """検索結果をグループ情報付きの辞書に変換する"""
+        if result is None:
+            return {"group_id": None, "match_type": "none", "score": 0.0}
+        group = self.groups[result["group_index"]]
+        return {
+            "group_id": group["group_id"],
+            "match_type": result["match_type"],
+            "score": round(result["score"], 4),
+            "count": len(group["ids"]),
+            "representative_id": group["representative_id"],
+            "representative_text": group["representative_text"],
+        }
+
+    def save(self, path):
+        """インデックスをJSONファイルに保存する"""
+        data = {
+            "similarity_threshold": self.similarity_threshold,
+            "max_candidates": self.max_candidates,
+            "groups": self.groups,
+            "exact_index": self.exact_index,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """JSONファイルからインデックスを読み込み、候補インデックスを再構築する"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        index = cls(data["similarity_threshold"], data.get("max_candidates", 50))
+        index.groups = data["groups"]
+        index.exact_index = data["exact_index"]
+        for group_index, group in enumerate(index.groups):
+            index._add_postings(group_index, group["morphological_text"])
+        return index
+
+def build_index(input_file, index_file, similarity_threshold=0.5, id_col=0, text_col=1):
+    """CSVファイルからグループ索引を構築して保存する"""
+    from tqdm import tqdm
+
+    index = DedupeIndex(similarity_threshold)
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)  # ヘッダーをスキップ
+
+        for row in tqdm(reader, desc="インデックス構築"):
+            if len(row) <= max(id_col, text_col):
+                continue
+
+            id_value = row[id_col]
+            text = row[text_col]
+            normalized_text, morph_text = analyze(text)
+            index.insert(id_value, text, normalized_text, morph_text)
+
+    index.save(index_file)
+    print(f"インデックスを{index_file}に保存しました（{len(index)}グループ、{len(index.exact_index)}ハッシュ）")
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description='重複検索サービス用のグループ索引を構築するツール')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('index_file', help='出力するインデックスファイル（JSON）のパス')
+    parser.add_argument('--similarity', type=float, default=0.5, help='類似度のしきい値（0.0〜1.0）')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    build_index(args.input_file, args.index_file, args.similarity, args.id_col, args.text_col)
+    end_time = time.time()
+
+    print(f"処理時間: {end_time - start_time:.2f}秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dedupe_index import DedupeIndex
+from optimized_morphological_processor import get_tokenizer, normalize_text, morphological_analysis
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+class DedupeService:
+    """メモリ上のグループ索引に対して検索・追加を行うサービス"""
+
+    def __init__(self, index, index_file=None, workers=4):
+        self.index = index
+        self.index_file = index_file
+        # 形態素解析はワーカープールで実行し、janomeのTokenizerはプール内で共有する
+        # （辞書の設定とTokenizerの生成は、ワーカーが同時に行わないよう待ち受けの前に済ませる）
+        get_tokenizer()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analyzer")
+        self.request_count = 0
+        self.insert_count = 0
+        self.started_at = time.time()
+
+    async def analyze(self, text):
+        """正規化し、完全一致するグループがない場合だけ形態素解析する（完全一致なら形態素テキストはNone）"""
+        normalized_text = normalize_text(text)
+        if self.index.exact(normalized_text) is not None:
+            return normalized_text, None
+        loop = asyncio.get_running_loop()
+        return normalized_text, await loop.run_in_executor(self.executor, morphological_analysis, text)
+
+    async def lookup(self, text):
+        normalized_text, morph_text = await self.analyze(text)
+        return self.index.describe(self.index.lookup(normalized_text, morph_text))
+
+    async def insert(self, id_value, text):
+        normalized_text, morph_text = await self.analyze(text)
+        # 索引の更新はイベントループ上で await を挟まずに行うため、検索と追加の間に他の要求は割り込まない
+        # （完全一致の確認から追加までも await を挟まないため、morph_textがNoneなら必ず完全一致になる）
+        result = self.index.insert(id_value, text, normalized_text, morph_text)
+        self.insert_count += 1
+        return self.index.describe(result)
+
+    def stats(self):
+        return {
+            "groups": len(self.index),
+            "hashes": len(self.index.exact_index),
+            "tokens": len(self.index.postings),
+            "requests": self.request_count,
+            "inserts": self.insert_count,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+    def save(self):
+        if not self.index_file:
+            return {"saved": False}
+        tmp_file = self.index_file + ".tmp"
+        self.index.save(tmp_file)
+        os.replace(tmp_file, self.index_file)
+        return {"saved": True, "index_file": self.index_file}
+
+    async def dispatch(self, method, path, body):
+        """リクエストを処理して (ステータス, 応答) を返す"""
+        if path == "/stats":
+            return 200, self.stats()
+
+        if method != "POST":
+            return 405, {"error": "POSTを使用してください"}
+
+        if path == "/lookup":
+            return 200, await self.lookup(body.get("text", ""))
+
+        if path == "/lookup_batch":
+            texts = body.get("texts", [])
+            results = await asyncio.gather(*(self.lookup(text) for text in texts))
+            return 200, {"results": results}
+
+        if path == "/insert":
+            items = body.get("items", [body])
+            # 途中の要素で失敗して一部だけが追加されないよう、追加の前に全ての要素を確かめる
+            if not isinstance(items, list):
+                return 400, {"error": "itemsは配列で指定してください"}
+            for position, item in enumerate(items):
+                if not isinstance(item, dict) or not isinstance(item.get("text", ""), str):
+                    return 400, {"error": f"items[{position}]は文字列のtextを持つオブジェクトで指定してください"}
+            results = []
+            for item in items:
+                results.append(await self.insert(str(item.get("id", "")), item.get("text", "")))
+            return 200, {"results": results}
+
+        if path == "/save":
+            return 200, self.save()
+
+        return 404, {"error": f"不明なパス: {path}"}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                try:
+                    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "不正なリクエスト行"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "不正なContent-Length"}, keep_alive=False)
+                    break
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": "リクエストが大きすぎます"}, keep_alive=False)
+                    break
+
+                start_time = time.perf_counter()
+                try:
+                    body = json.loads(await reader.readexactly(length)) if length else {}
+                    status, payload = await self.dispatch(method, path.split('?', 1)[0], body)
+                except (ValueError, AttributeError, TypeError) as e:
+                    status, payload = 400, {"error": str(e)}
+
+                self.request_count += 1
+                payload["elapsed_ms"] = round((time.perf_counter() - start_time) * 1000, 3)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        header = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(header.encode('latin-1') + data)
+        await writer.drain()
+
+async def serve(service, host="127.0.0.1", port=8765, unix_socket=None):
+    if unix_socket:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_socket)
+        print(f"{unix_socket} で待ち受けを開始しました")
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        print(f"http://{host}:{port} で待ち受けを開始しました")
+
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='メモリ上のグループ索引で所属グループを返す重複検索サービス')
+    parser.add_argument('index_file', help='dedupe_index.pyで構築したインデックスファイルのパス')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるホスト')
+    parser.add_argument('--port', type=int, default=8765, help='待ち受けるポート番号')
+    parser.add_argument('--unix', default=None, help='TCPの代わりに待ち受けるUnixソケットのパス')
+    parser.add_argument('--workers', type=int, default=4, help='形態素解析のワーカー数')
+    parser.add_argument('--no-save', action='store_true', help='終了時にインデックスを保存しない')
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    index = DedupeIndex.load(args.index_file)
+    print(f"インデックスを読み込みました: {len(index)}グループ（{time.time() - start_time:.2f}秒）")
+
+    service = DedupeService(index, args.index_file, args.workers)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.executor.shutdown()
+        if not args.no_save and service.insert_count:
+            service.save()
+            print(f"インデックスを{args.index_file}に保存しました")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from dedupe_index import DedupeIndex, text_hash
+from optimized_morphological_processor import normalize_text, morphological_analysis
+
+LATENCY_SAMPLES = 100000
+
+class StreamingDedupeIndex(DedupeIndex):
+    """グループを追加しながら、最後に一致してから長く経ったグループを追い出して件数を抑える索引
+
+    グループはgroup_indexをキーとする辞書で保持し、追い出したグループのgroup_idは再利用しない。
+    メンバーは件数だけを数え、類似一致で増える完全一致用のハッシュは1グループmax_hashes個までにする。
+    """
+
+    def __init__(self, similarity_threshold=0.5, max_candidates=50, max_groups=100000, max_hashes=1000):
+        super().__init__(similarity_threshold, max_candidates)
+        self.max_groups = max_groups
+        self.max_hashes = max_hashes
+        self.groups = {}
+        self.hashes = {}
+        # 一致した順（先頭ほど長く一致していない）
+        self.recent = OrderedDict()
+        self.next_index = 0
+        self.evicted = 0
+
+    def exact(self, normalized_text):
+        """完全一致するグループを検索し、あれば一致として数える（形態素解析より前に呼ぶ）"""
+        group_index = self.exact_index.get(text_hash(normalized_text)) if normalized_text else None
+        if group_index is None:
+            return None
+        self.hit(group_index)
+        return {"group_index": group_index, "match_type": "exact", "score": 1.0}
+
+    def hit(self, group_index, hash_value=None):
+        self.groups[group_index]["count"] += 1
+        self.recent.move_to_end(group_index)
+        if hash_value is not None and hash_value not in self.exact_index:
+            hashes = self.hashes[group_index]
+            if len(hashes) < self.max_hashes:
+                hashes.append(hash_value)
+                self.exact_index[hash_value] = group_index
+
+    def insert(self, id_value, text, normalized_text, morph_text):
+        result = self.lookup(normalized_text, morph_text)
+        if not normalized_text:
+            return result
+
+        hash_value = text_hash(normalized_text)
+        if result is not None:
+            self.hit(result["group_index"], hash_value)
+            return result
+
+        group_index = self.next_index
+        self.next_index += 1
+        self.groups[group_index] = {
+            "group_id": f"group_{group_index}",
+            "representative_id": id_value,
+            "representative_text": text,
+            "morphological_text": morph_text,
+            "count": 1,
+        }
+        self.hashes[group_index] = [hash_value]
+        self.exact_index[hash_value] = group_index
+        self._add_postings(group_index, morph_text)
+        self.recent[group_index] = None
+        while len(self.groups) > self.max_groups:
+            self.evict(next(iter(self.recent)))
+        return {"group_index": group_index, "match_type": "new", "score": 1.0}
+
+    def evict(self, group_index):
+        """グループとそのハッシュ・ポスティングを索引から取り除く"""
+        group = self.groups.pop(group_index)
+        del self.recent[group_index]
+        for hash_value in self.hashes.pop(group_index):
+            del self.exact_index[hash_value]
+        for word in set(group["morphological_text"].split()):
+            postings = self.postings.get(word)
+            if postings is not None:
+                postings.discard(group_index)
+                if not postings:
+                    del self.postings[word]
+        self.evicted += 1
+
+    def describe(self, result):
+        if result is None:
+            return {"group_id": None, "match_type": "none", "score": 0.0}
+        group = self.groups[result["group_index"]]
+        return {
+            "group_id": group["group_id"],
+            "match_type": result["match_type"],
+            "score": round(result["score"], 4),
+            "count": group["count"],
+            "representative_id": group["representative_id"],
+        }
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+class StreamDeduper:
+    """1件ずつ正規化・検索・追加を行い、処理件数と1件あたりの処理時間を記録する"""
+
+    def __init__(self, index):
+        from preview import Reservoir
+        self.index = index
+        self.match_types = Counter()
+        self.items = 0
+        self.errors = 0
+        # 処理時間は一様に抽出した一部から分位点を求める（長時間の実行でもメモリを増やさない）
+        self.latencies = Reservoir(LATENCY_SAMPLES)
+        self.started_at = time.time()
+
+    def process(self, id_value, text):
+        start_time = time.perf_counter()
+        normalized_text = normalize_text(text)
+        # 完全一致なら形態素解析を省く
+        result = self.index.exact(normalized_text)
+        if result is None:
+            result = self.index.insert(id_value, text, normalized_text, morphological_analysis(text))
+        described = self.index.describe(result)
+        self.latencies.offer(self.items, time.perf_counter() - start_time)
+        self.items += 1
+        self.match_types[described["match_type"]] += 1
+        return described
+
+    def stats(self):
+        elapsed = time.time() - self.started_at
+        latencies = sorted(self.latencies.items)
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "match_types": dict(self.match_types),
+            "groups": len(self.index.groups),
+            "groups_created": self.index.next_index,
+            "evicted_groups": self.index.evicted,
+            "hashes": len(self.index.exact_index),
+            "tokens": len(self.index.postings),
+            "seconds": round(elapsed, 3),
+            "throughput_per_second": round(self.items / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.5) * 1000, 3),
+                "p90": round(percentile(latencies, 0.9) * 1000, 3),
+                "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+                "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            },
+        }
+
+def jsonl_records(lines, id_field, text_field):
+    """JSONLの各行を (元のレコード, ID, テキスト) にする（解析できない行はレコードをNoneにする）"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("オブジェクトではありません")
+        except ValueError as e:
+            yield None, str(number), str(e)
+            continue
+        yield record, str(record.get(id_field, number)), str(record.get(text_field) or '')
+
+def csv_records(reader, id_col, text_col):
+    """csv.readerの残りの行を (行, ID, テキスト) で返す（ヘッダーは呼び出し側で読んでおく）"""
+    for row in reader:
+        if len(row) <= max(id_col, text_col):
+            yield None, str(reader.line_num), "列が足りません"
+            continue
+        yield row, row[id_col], row[text_col]
+
+def run_stream(deduper, records, output, fmt, stats_file=None, stats_interval=60.0, header=None):
+    """入力を1件ずつ処理し、所属グループを付けてすぐに出力する（CSVでheaderを指定した場合は先に見出し行を書く）"""
+    writer = csv.writer(output) if fmt == 'csv' else None
+    if writer is not None and header is not None:
+        writer.writerow(header + ["group_id", "match_type", "score"])
+        output.flush()
+    last_stats = time.time()
+    for record, id_value, text in records:
+        if record is None:
+            deduper.errors += 1
+            print(f"行{id_value}を読み飛ばしました: {text}", file=sys.stderr)
+            continue
+        result = deduper.process(id_value, text)
+        if writer is not None:
+            writer.writerow(record + [result["group_id"] or '', result["match_type"], result["score"]])
+        else:
+            record.update({name: result.get(name) for name in ("group_id", "match_type", "score", "count")})
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        output.flush()
+
+        if stats_file and time.time() - last_stats >= stats_interval:
+            write_stats(stats_file, deduper.stats())
+            last_stats = time.time()
+    return deduper.stats()
+
+def write_stats(path, stats):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description='標準入力のコメントを1件ずつ重複判定し、所属グループを付けて標準出力に書き出す')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='入出力の形式')
+    parser.add_argument('--id-field', default='id', help='JSONLのIDのキー')
+    parser.add_argument('--text-field', default='text', help='JSONLのテキストのキー')
+    parser.add_argument('--id-col', type=int, default=0, help='CSVのIDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='CSVのテキストの列番号（0始まり）')
+    parser.add_argument('--header', action='store_true',
+                        help='CSVの先頭行をヘッダーとして読み、出力の先頭にグループの列を加えた見出し行を書く')
+    parser.add_argument('--similarity', type=float, default=0.5, help='類似度のしきい値（0.0〜1.0）')
+    parser.add_argument('--max-candidates', type=int, default=50, help='類似度を計算する候補グループの数の上限')
+    parser.add_argument('--max-groups', type=int, default=100000,
+                        help='メモリに保持するグループ数の上限（超えたら最後に一致してから長く経ったグループを追い出す）')
+    parser.add_argument('--max-hashes', type=int, default=1000, help='1グループが保持する完全一致用のハッシュの数の上限')
+    parser.add_argument('--stats-file', default=None, help='統計情報（スループット・処理時間の分位点）を書き出すJSONファイル')
+    parser.add_argument('--stats-interval', type=float, default=60.0, help='統計情報を書き出す間隔（秒）')
+
+    args = parser.parse_args()
+    sys.stdin.reconfigure(encoding='utf-8', newline='' if args.format == 'csv' else None)
+    sys.stdout.reconfigure(encoding='utf-8', newline='' if args.format == 'csv' else None)
+
+    index = StreamingDedupeIndex(args.similarity, args.max_candidates, args.max_groups, args.max_hashes)
+    deduper = StreamDeduper(index)
+    header = None
+    if args.format == 'csv':
+        reader = csv.reader(sys.stdin)
+        if args.header:
+            header = next(reader, [])
+        records = csv_records(reader, args.id_col, args.text_col)
+    else:
+        records = jsonl_records(sys.stdin, args.id_field, args.text_field)
+
+    try:
+        stats = run_stream(deduper, records, sys.stdout, args.format, args.stats_file, args.stats_interval, header)
+    except KeyboardInterrupt:
+        stats = deduper.stats()
+    if args.stats_file:
+        write_stats(args.stats_file, stats)
+    latency = stats["latency_ms"]
+    print(f"{stats['items']}件を処理しました（{stats['throughput_per_second']}件/秒、"
+          f"p50 {latency['p50']}ms・p99 {latency['p99']}ms、{stats['groups']}グループを保持、"
+          f"{stats['evicted_groups']}グループを追い出し）", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+from comment_table import ExactGroups, StringColumn
+from compressed_io import open_text
+from pipeline import ANALYZERS, NORMALIZERS, PRESETS, SCORERS, resolve
+from planner import BLOCKING_STRATEGIES, cluster_labels
+
+EVAL_SAMPLE = 1000
+ENV_CACHE = 'PUBCOM_EVAL_CACHE'
+
+def default_cache_dir():
+    """基準の結果の保存先（環境変数PUBCOM_EVAL_CACHEで変更できる）"""
+    if os.environ.get(ENV_CACHE):
+        return os.environ[ENV_CACHE]
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'pubcom', 'eval')
+
+def baseline_digest(unique_keys, scorer, threshold):
+    """代表テキストの列・スコア関数・しきい値から基準の結果を識別するハッシュを求める"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{scorer}\0{SCORERS[scorer]['function']}\0{threshold!r}\0".encode('utf-8'))
+    for key in unique_keys:
+        digest.update(key.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def baseline_edges(unique_keys, scorer, threshold, cache_dir=None):
+    """全ての組を採点し、しきい値以上の組 (i, j, スコア) を返す（結果はキャッシュに保存し、次回から読み込む）"""
+    path = None
+    if cache_dir != '':
+        path = os.path.join(cache_dir or default_cache_dir(),
+                            f"{baseline_digest(unique_keys, scorer, threshold)}.json.gz")
+        if os.path.exists(path):
+            with open_text(path) as f:
+                baseline = json.load(f)
+            baseline['cached'] = True
+            return baseline
+
+    score_fn = resolve(SCORERS[scorer]['function'])
+    n = len(unique_keys)
+    start_time = time.perf_counter()
+    edges = []
+    for i in range(n):
+        key = unique_keys[i]
+        for j in range(i + 1, n):
+            score = score_fn(key, unique_keys[j])
+            if score >= threshold:
+                edges.append([i, j, round(score, 6)])
+    baseline = {
+        "scorer": scorer,
+        "threshold": threshold,
+        "unique_keys": n,
+        "scored_pairs": n * (n - 1) // 2,
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "edges": edges,
+    }
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.gz'
+        with open_text(tmp_path, 'w') as f:
+            json.dump(baseline, f)
+        os.replace(tmp_path, path)
+    baseline['cached'] = False
+    return baseline
+
+def greedy_from_edges(n, edges):
+    """しきい値以上の組から、全ペア比較の貪欲なグループ化（process_fileと同じ結果）を再現する"""
+    neighbors = [[] for _ in range(n)]
+    for i, j, _ in edges:
+        neighbors[i].append(j)
+    cluster_of = list(range(n))
+    assigned = bytearray(n)
+    for i in range(n):
+        if assigned[i]:
+            continue
+        assigned[i] = 1
+        for j in neighbors[i]:
+            if not assigned[j]:
+                assigned[j] = 1
+                cluster_of[j] = i
+    return cluster_of
+
+def row_labels(groups, cluster_of, rows):
+    """代表テキストのグループ番号を行ごとのラベルにする（空のキーの行はそれぞれ単独のグループ）"""
+    return [cluster_of[groups.group_of(row)] if groups.group_of(row) >= 0 else -1 - row for row in range(rows)]
+
+def pairs(count):
+    return count * (count - 1) // 2
+
+def pair_metrics(reference, labels):
+    """同じグループになった行の組についての適合率・再現率・F1と、調整ランド指数"""
+    reference_pairs = sum(pairs(count) for count in Counter(reference).values())
+    predicted_pairs = sum(pairs(count) for count in Counter(labels).values())
+    common_pairs = sum(pairs(count) for count in Counter(zip(reference, labels)).values())
+    precision = common_pairs / predicted_pairs if predicted_pairs else 1.0
+    recall = common_pairs / reference_pairs if reference_pairs else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    total_pairs = pairs(len(reference))
+    expected = reference_pairs * predicted_pairs / total_pairs if total_pairs else 0.0
+    maximum = (reference_pairs + predicted_pairs) / 2
+    ari = (common_pairs - expected) / (maximum - expected) if maximum != expected else 1.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4), "ari": round(ari, 4),
+            "reference_pairs": reference_pairs, "predicted_pairs": predicted_pairs}
+
+def anytime_labels(keys, scorer, threshold, budget, key='normalized'):
+    """時間予算付きのグループ化（--time-budget）を抽出した行で実行する"""
+    from anytime_grouping import cluster_anytime
+
+    column = StringColumn()
+    column.extend(keys)
+    groups = ExactGroups(column)
+    unique_keys = groups.keys()
+    scorer_spec = SCORERS[scorer]
+    start_time = time.perf_counter()
+    clusters, stats = cluster_anytime(unique_keys, scorer_spec, resolve(scorer_spec['function']), threshold,
+                                      time.time() + budget, key=key)
+    seconds = time.perf_counter() - start_time
+    cluster_of = list(range(len(unique_keys)))
+    for cluster in clusters:
+        for i, _ in cluster:
+            cluster_of[i] = cluster[0][0]
+    return row_labels(groups, cluster_of, len(keys)), {
+        "unique_keys": len(unique_keys), "candidate_pairs": stats['processed_pairs'],
+        "scored_pairs": stats['scored_pairs'], "block_seconds": 0.0, "score_seconds": seconds}
+
+def sample_keys(texts, presets):
+    """抽出したテキストから、各プリセットが使うキー（正規化・形態素解析の結果）を作る"""
+    normalize = resolve(NORMALIZERS['neologdn'])
+    keys = {'normalized': [normalize(text) for text in texts]}
+    if any(PRESETS[preset]['key'] == 'morphological' for preset in presets):
+        analyzer = resolve(ANALYZERS['morph'])
+        keys['morphological'] = [analyzer(text) for text in texts]
+    return keys
+
+def evaluate_engines(input_file, id_col=0, text_col=1, sample_size=EVAL_SAMPLE, presets=None, blockings=None,
+                     time_budgets=(), seed=0, cache_dir=None):
+    """抽出した行で全ペア比較（基準）と各エンジンを実行し、グループ化の一致度と処理時間・採点したペア数を比べる"""
+    from preview import preview_file
+
+    presets = presets or sorted(PRESETS)
+    _, sample = preview_file(input_file, id_col, text_col, sample_size, seed=seed)
+    texts = [text for _, _, text, _ in sample]
+    keys = sample_keys(texts, presets)
+
+    references = []
+    results = []
+    for preset in presets:
+        config = PRESETS[preset]
+        key_values = keys[config['key']]
+        column = StringColumn()
+        column.extend(key_values)
+        groups = ExactGroups(column)
+        unique_keys = groups.keys()
+        baseline = baseline_edges(unique_keys, config['scorer'], config['similarity'], cache_dir)
+        reference = row_labels(groups, greedy_from_edges(len(unique_keys), baseline['edges']), len(key_values))
+        references.append({"preset": preset, "scorer": config['scorer'], "similarity": config['similarity'],
+                            "unique_keys": len(unique_keys), "edges": len(baseline['edges']),
+                            "scored_pairs": baseline['scored_pairs'], "seconds": baseline['seconds'],
+                            "cached": baseline['cached']})
+
+        runs = [(name, lambda blocker=blocker, options=options: cluster_labels(
+                    key_values, config['scorer'], config['similarity'], blocker, options, config['key']))
+                for name, blocker, options in BLOCKING_STRATEGIES if blockings is None or name in blockings]
+        runs += [(f"anytime-{budget:g}s", lambda budget=budget: anytime_labels(
+                    key_values, config['scorer'], config['similarity'], budget, config['key']))
+                 for budget in time_budgets]
+        for name, run in runs:
+            try:
+                labels, measured = run()
+            except ImportError as e:
+                print(f"{preset}/{name}: 必要なパッケージがないため評価しません（{e}）")
+                continue
+            results.append({
+                "preset": preset,
+                "engine": name,
+                "seconds": round(measured['block_seconds'] + measured['score_seconds'], 4),
+                "candidate_pairs": measured['candidate_pairs'],
+                "scored_pairs": measured['scored_pairs'],
+                **pair_metrics(reference, labels),
+            })
+    return {"sample_rows": len(texts), "seed": seed, "references": references, "results": results}
+
+RESULT_COLUMNS = ['preset', 'engine', 'seconds', 'candidate_pairs', 'scored_pairs', 'precision', 'recall', 'f1', 'ari']
+
+def print_evaluation(evaluation):
+    print(f"抽出{evaluation['sample_rows']}件での評価（基準は同じスコア関数・しきい値での全ペア比較）:")
+    for reference in evaluation['references']:
+        source = 'キャッシュ' if reference['cached'] else '計算'
+        print(f"  基準 {reference['preset']}: 代表テキスト{reference['unique_keys']}件、"
+              f"{reference['scored_pairs']}組を採点、しきい値以上{reference['edges']}組、{reference['seconds']}秒（{source}）")
+    print(f"  {'プリセット':<14}{'エンジン':<14}{'時間(秒)':>10}{'採点ペア':>12}{'適合率':>8}{'再現率':>8}{'F1':>8}{'ARI':>8}")
+    for result in evaluation['results']:
+        print(f"  {result['preset']:<14}{result['engine']:<14}{result['seconds']:>10.3f}{result['scored_pairs']:>12}"
+              f"{result['precision']:>8.3f}{result['recall']:>8.3f}{result['f1']:>8.3f}{result['ari']:>8.3f}")
+
+def plot_evaluation(evaluation, path):
+    """再現率を処理時間・採点したペア数に対して描く（matplotlibが必要）"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlibがインストールされていないため、図は作成しません")
+        return False
+
+    figure, axes = plt.subplots(1, 2, figsize=(12, 5))
+    for preset in sorted({result['preset'] for result in evaluation['results']}):
+        results = [result for result in evaluation['results'] if result['preset'] == preset]
+        for ax, field in zip(axes, ('seconds', 'scored_pairs')):
+            ax.scatter([result[field] for result in results], [result['recall'] for result in results], label=preset)
+            for result in results:
+                ax.annotate(result['engine'], (result[field], result['recall']), fontsize=7)
+    for ax, label in zip(axes, ('seconds', 'scored pairs')):
+        ax.set_xscale('log')
+        ax.set_xlabel(label)
+        ax.set_ylabel('pairwise recall')
+        ax.legend()
+    figure.tight_layout()
+    figure.savefig(path)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='高速化したエンジンのグループ化を全ペア比較の結果と比べる評価ツール')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('--sample', type=int, default=EVAL_SAMPLE, help='評価に使う抽出件数')
+    parser.add_argument('--seed', type=int, default=0, help='抽出に使う乱数の種')
+    parser.add_argument('--presets', nargs='+', choices=sorted(PRESETS), default=None, help='評価するプリセット')
+    parser.add_argument('--blockings', nargs='+', choices=[name for name, _, _ in BLOCKING_STRATEGIES], default=None,
+                        help='評価するブロッカー（省略時は全て）')
+    parser.add_argument('--time-budgets', nargs='+', type=float, default=[],
+                        help='あわせて評価する時間予算付きのグループ化の予算（秒）')
+    parser.add_argument('--cache-dir', default=None,
+                        help=f'全ペア比較の結果の保存先（既定: 環境変数{ENV_CACHE}または~/.cache/pubcom/eval、空文字で保存しない）')
+    parser.add_argument('--csv', default=None, help='評価結果の表を書き出すCSVファイルのパス')
+    parser.add_argument('--json', default=None, help='評価結果を書き出すJSONファイルのパス')
+    parser.add_argument('--plot', default=None, help='再現率と処理時間・採点ペア数の図を書き出す画像ファイルのパス')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+
+    args = parser.parse_args()
+    start_time = time.time()
+    evaluation = evaluate_engines(args.input_file, args.id_col, args.text_col, args.sample, args.presets,
+                                  args.blockings, args.time_budgets, args.seed, args.cache_dir)
+    print_evaluation(evaluation)
+
+    if args.csv:
+        with open_text(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, RESULT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(evaluation['results'])
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(evaluation, f, ensure_ascii=False, indent=2)
+    if args.plot and plot_evaluation(evaluation, args.plot):
+        print(f"図を{args.plot}に保存しました")
+    print(f"評価時間: {time.time() - start_time:.2f}秒")
+
+if __name__ == "__main__":
+    main()
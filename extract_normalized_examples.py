@@ -1,50 +1,86 @@
+import argparse
 import csv
-import json
 import os
 
-def extract_normalized_examples(input_file, output_file, max_examples=10):
+from compressed_io import open_text, is_compressed
+from group_tables import GroupTables, table_format
+from result_index import ResultIndex
+
+def exact_groups(input_file, order='file'):
+    """
+    Yield (group_id, count, representative_text, original_texts) for each exact-match group.
+
+    original_texts is an iterator over the member texts. Reads either the groups/members tables
+    (SQLite, Parquet, or *.groups.csv; the base output name written with --output-layout tables
+    also works) by group id, or the wide CSV layout through a sidecar offset index, which streams
+    the '|'-joined original_texts cell instead of parsing whole rows. order='size' visits the
+    largest groups first.
+    """
+    if (table_format(input_file) != 'csv' or '.groups.' in os.path.basename(input_file)
+            or not os.path.exists(input_file)):
+        with GroupTables(input_file) as tables:
+            records = tables.groups_with_members(match_type='exact', min_count=2)
+            if order == 'size':
+                records = sorted(records, key=lambda record: -record[0]['count'])
+            for group, members in records:
+                yield (group['group_id'], group['count'], group['representative_text'],
+                       (member['text'] for member in members))
+        return
+
+    if is_compressed(input_file):
+        # 圧縮ファイルは位置を指定して読めないため、先頭から順に読む
+        csv.field_size_limit(2 ** 31 - 1)
+        with open_text(input_file, 'r') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            texts_col = header.index('original_texts')
+            rows = (row for row in reader if len(row) > texts_col and row[1] == 'exact')
+            if order == 'size':
+                rows = sorted(rows, key=lambda row: -int(row[2]))
+            for row in rows:
+                yield row[0], int(row[2]), row[3], iter(row[texts_col].split('|'))
+        return
+
+    index = ResultIndex.open(input_file)
+    for group_id, _, count in index.groups(match_type='exact', min_count=2, order=order):
+        yield group_id, count, index.representative_text(group_id), index.member_texts(group_id)
+
+def extract_normalized_examples(input_file, output_file, max_examples=10, order='file'):
     """
     Extract examples of comments that weren't identical but became the same after neologdn normalization.
     
     Args:
-        input_file: Path to the input CSV file with grouped comments
+        input_file: Path to the input CSV file with grouped comments (.gz/.xz/.zst are decompressed)
         output_file: Path to the output markdown file
         max_examples: Maximum number of examples to extract
+        order: 'file' to scan groups in output order, 'size' to visit the largest groups first
     """
     examples = []
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        header = next(reader)  # Skip header
-        
-        for row in reader:
-            if len(row) < 7 or row[1] != 'exact':
-                continue
-                
-            original_texts = row[6].split('|')
-            if len(original_texts) <= 1:
-                continue
-                
-            first_text = original_texts[0]
-            different_texts = []
-            
-            for text in original_texts[1:]:
-                if text != first_text:
-                    different_texts.append(text)
-                    
-            if different_texts:
-                example = {
-                    'group_id': row[0],
-                    'count': len(original_texts),
-                    'representative_text': row[3],
-                    'first_text': first_text,
-                    'different_texts': different_texts[:3]  # Limit to 3 different texts
-                }
-                examples.append(example)
-                
-            if len(examples) >= max_examples:
-                break
-    
+
+    for group_id, count, representative_text, original_texts in exact_groups(input_file, order):
+        first_text = next(original_texts, None)
+        different_texts = []
+
+        # Stop reading members once enough differing texts are found
+        for text in original_texts:
+            if text != first_text:
+                different_texts.append(text)
+                if len(different_texts) >= 3:  # Limit to 3 different texts
+                    break
+
+        if different_texts:
+            example = {
+                'group_id': group_id,
+                'count': count,
+                'representative_text': representative_text,
+                'first_text': first_text,
+                'different_texts': different_texts
+            }
+            examples.append(example)
+
+        if len(examples) >= max_examples:
+            break
+
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write('# neologdnによる正規化で同一視された例\n\n')
         f.write('元のテキストが異なるが、正規化後に同一と判定された例を表示します。\n\n')
@@ -71,17 +107,25 @@ def extract_normalized_examples(input_file, output_file, max_examples=10):
     print(f'Extracted {len(examples)} examples to {output_file}')
 
 def main():
+    parser = argparse.ArgumentParser(description='Extract examples that became identical after neologdn normalization')
+    parser.add_argument('input_file', nargs='?', default=None, help='Grouped result file (default: first existing known result)')
+    parser.add_argument('--output', default='neologdn_normalized_examples.md', help='Output markdown file')
+    parser.add_argument('--max-examples', type=int, default=10, help='Maximum number of examples')
+    parser.add_argument('--order', choices=['file', 'size'], default='file', help='Visit groups in file order or largest first')
+    args = parser.parse_args()
+
     result_files = [
         'grouped_full_comments.csv',
         'grouped_full_comments_0.7.csv',
         'grouped_full_comments_0.5.csv',
         'exact_matches_sorted.csv'
     ]
+    if args.input_file is not None:
+        result_files = [args.input_file]
     
     for file in result_files:
-        if os.path.exists(file):
-            output_file = 'neologdn_normalized_examples.md'
-            extract_normalized_examples(file, output_file)
+        if os.path.exists(file) or args.input_file is not None:
+            extract_normalized_examples(file, args.output, args.max_examples, args.order)
             return
     
     print('No result files found. Please run the analysis first.')
@@ -0,0 +1,109 @@
+from array import array
+from functools import lru_cache
+
+POS_OTHER = 0
+POS_NOUN = 1
+POS_VERB = 2
+
+class TokenVocabulary:
+    """単語とトークンIDを相互に引く語彙表"""
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+
+    def __len__(self):
+        return len(self.words)
+
+    def id(self, word):
+        token_id = self.ids.get(word)
+        if token_id is None:
+            token_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return token_id
+
+    def encode(self, words):
+        return array('i', [self.id(word) for word in words])
+
+    def decode(self, token_ids):
+        return [self.words[token_id] for token_id in token_ids]
+
+class PosFilterAnalyzer:
+    """品詞文字列ごとの判定結果を表引きして、名詞と動詞の原形だけを取り出す形態素解析器
+
+    janomeのTokenの属性アクセス（__getattr__）と品詞文字列のsplitをトークンごとに行わず、
+    辞書エントリの付加情報を直接参照する。結果はmorphological_analysisと同じになる。
+    同一テキストの解析結果はcache_size件まで保持し、重複コメントでは格子の構築を省く。
+    """
+
+    def __init__(self, tokenizer=None, vocabulary=None, cache_size=65536):
+        self._tokenizer = tokenizer
+        self.vocabulary = vocabulary if vocabulary is not None else TokenVocabulary()
+        self.pos_table = {}
+        self._analyze = lru_cache(maxsize=cache_size)(self._analyze)
+        self._token_ids = lru_cache(maxsize=cache_size)(self._token_ids)
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from optimized_morphological_processor import get_tokenizer
+            self._tokenizer = get_tokenizer()
+        return self._tokenizer
+
+    def pos_code(self, part_of_speech):
+        code = self.pos_table.get(part_of_speech)
+        if code is None:
+            head = part_of_speech.split(',', 1)[0]
+            code = POS_NOUN if head == '名詞' else POS_VERB if head == '動詞' else POS_OTHER
+            self.pos_table[part_of_speech] = code
+        return code
+
+    def words(self, text):
+        """名詞の表層形と動詞の原形のリストを返す"""
+        pos_table = self.pos_table
+        words = []
+        append = words.append
+        for token in self.tokenizer.tokenize(text):
+            # システム辞書の語は付加情報のタプル、未知語はノードから品詞を取る
+            extra = token.extra
+            node = token.node
+            code = pos_table.get(extra[0] if extra else node.part_of_speech)
+            if code is None:
+                code = self.pos_code(extra[0] if extra else node.part_of_speech)
+            if code == POS_NOUN:
+                append(node.surface)
+            elif code == POS_VERB:
+                append(extra[3] if extra else node.base_form)
+        return words
+
+    def _analyze(self, text):
+        return ' '.join(self.words(text))
+
+    def _token_ids(self, text):
+        vocabulary_id = self.vocabulary.id
+        return array('i', [vocabulary_id(word) for word in self.words(text)])
+
+    def analyze(self, text):
+        """morphological_analysisと同じく空白区切りの文字列を返す"""
+        if not text or not isinstance(text, str):
+            return ""
+        return self._analyze(text)
+
+    def token_ids(self, text):
+        """抽出した単語を語彙表のトークンIDの配列として返す（キャッシュと共有するため変更しないこと）"""
+        if not text or not isinstance(text, str):
+            return array('i')
+        return self._token_ids(text)
+
+_analyzer = None
+
+def get_analyzer():
+    """共有のPosFilterAnalyzerを初回呼び出し時に生成して返す"""
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = PosFilterAnalyzer()
+    return _analyzer
+
+def morphological_analysis(text):
+    """形態素解析を行い、名詞と動詞の原形のみを抽出する（品詞表引き版）"""
+    return get_analyzer().analyze(text)
@@ -0,0 +1,230 @@
+import csv
+import os
+import sqlite3
+
+from compressed_io import open_text, codec_of
+
+GROUP_COLUMNS = ['group_id', 'match_type', 'count', 'representative_row', 'representative_text', 'key_text',
+                 'similarity_score']
+MEMBER_COLUMNS = ['group_id', 'row_index', 'id', 'score', 'text']
+PARQUET_ROW_GROUP = 100000
+
+def table_format(path):
+    """出力先の拡張子から形式を決める（.sqlite/.db: SQLite、.parquet: Parquet、それ以外: CSV）"""
+    base = path
+    if codec_of(path) is not None:
+        base = os.path.splitext(path)[0]
+    ext = os.path.splitext(base)[1].lower()
+    if ext in ('.sqlite', '.sqlite3', '.db'):
+        return 'sqlite'
+    if ext == '.parquet':
+        return 'parquet'
+    return 'csv'
+
+def table_paths(path):
+    """CSV・Parquet形式での groups と members の出力先を返す（out.csv → out.groups.csv, out.members.csv）"""
+    suffix = ''
+    base = path
+    if codec_of(path) is not None:
+        base, suffix = os.path.splitext(path)
+    stem, ext = os.path.splitext(base)
+    if stem.endswith('.groups') or stem.endswith('.members'):
+        stem = stem.rsplit('.', 1)[0]
+    return f"{stem}.groups{ext}{suffix}", f"{stem}.members{ext}{suffix}"
+
+class CsvTableWriter:
+    def __init__(self, path, io_stats=None):
+        groups_path, members_path = table_paths(path)
+        self.paths = [groups_path, members_path]
+        self.io_stats = io_stats
+        self.members_stats = {}
+        self.groups_file = open_text(groups_path, 'w', io_stats, newline='')
+        self.members_file = open_text(members_path, 'w', self.members_stats, newline='')
+        self.groups = csv.writer(self.groups_file)
+        self.members = csv.writer(self.members_file)
+        self.groups.writerow(GROUP_COLUMNS)
+        self.members.writerow(MEMBER_COLUMNS)
+
+    def write(self, group, members):
+        self.groups.writerow([group[name] for name in GROUP_COLUMNS])
+        self.members.writerows(members)
+
+    def close(self):
+        self.groups_file.close()
+        self.members_file.close()
+        if self.io_stats is not None:
+            # 2つのファイルの合計を記録する
+            self.io_stats['path'] = self.paths
+            for name in ('file_bytes', 'bytes', 'codec_seconds'):
+                self.io_stats[name] += self.members_stats[name]
+
+class SqliteTableWriter:
+    def __init__(self, path, io_stats=None):
+        self.paths = [path]
+        if os.path.exists(path):
+            os.remove(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE groups (
+                group_id TEXT PRIMARY KEY, match_type TEXT, count INTEGER, representative_row INTEGER,
+                representative_text TEXT, key_text TEXT, similarity_score REAL);
+            CREATE TABLE members (group_id TEXT, row_index INTEGER, id TEXT, score REAL, text TEXT);
+        """)
+
+    def write(self, group, members):
+        self.connection.execute("INSERT INTO groups VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [group[name] for name in GROUP_COLUMNS])
+        self.connection.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?)", members)
+
+    def close(self):
+        # 索引は全件の挿入後にまとめて作る
+        self.connection.executescript("""
+            CREATE INDEX members_group ON members (group_id, row_index);
+            CREATE INDEX members_id ON members (id);
+            CREATE INDEX groups_type_count ON groups (match_type, count);
+        """)
+        self.connection.commit()
+        self.connection.close()
+
+class ParquetTableWriter:
+    def __init__(self, path, io_stats=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet形式での出力にはpyarrowが必要です（pip install pyarrow）") from None
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.paths = list(table_paths(path))
+        self.schemas = [
+            pyarrow.schema([('group_id', pyarrow.string()), ('match_type', pyarrow.string()),
+                            ('count', pyarrow.int32()), ('representative_row', pyarrow.int32()),
+                            ('representative_text', pyarrow.string()), ('key_text', pyarrow.string()),
+                            ('similarity_score', pyarrow.float64())]),
+            pyarrow.schema([('group_id', pyarrow.string()), ('row_index', pyarrow.int32()),
+                            ('id', pyarrow.string()), ('score', pyarrow.float64()), ('text', pyarrow.string())]),
+        ]
+        self.writers = [self.pq.ParquetWriter(p, schema) for p, schema in zip(self.paths, self.schemas)]
+        self.buffers = [[], []]
+
+    def flush(self, k):
+        columns = list(zip(*self.buffers[k]))
+        self.writers[k].write_table(self.pa.Table.from_arrays(
+            [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schemas[k])],
+            schema=self.schemas[k]))
+        self.buffers[k] = []
+
+    def write(self, group, members):
+        self.buffers[0].append([group[name] for name in GROUP_COLUMNS])
+        self.buffers[1].extend(members)
+        for k in (0, 1):
+            if len(self.buffers[k]) >= PARQUET_ROW_GROUP:
+                self.flush(k)
+
+    def close(self):
+        for k in (0, 1):
+            if self.buffers[k]:
+                self.flush(k)
+            self.writers[k].close()
+
+WRITERS = {
+    'csv': CsvTableWriter,
+    'sqlite': SqliteTableWriter,
+    'parquet': ParquetTableWriter,
+}
+
+def write_group_tables(output_file, records, io_stats=None):
+    """グループを groups 表（1グループ1行）と members 表（1メンバー1行）に分けて出力する
+
+    recordsは (グループ, メンバーのリスト) の列で、グループはGROUP_COLUMNSをキーとする辞書、
+    メンバーはMEMBER_COLUMNSの順の値のリスト。書き出したファイルのパスのリストを返す。
+    """
+    writer = WRITERS[table_format(output_file)](output_file, io_stats)
+    try:
+        for group, members in records:
+            writer.write(group, members)
+    finally:
+        writer.close()
+    return writer.paths
+
+class GroupTables:
+    """groups 表と members 表を、グループIDをキーにして読む
+
+    SQLiteとParquetは索引（Parquetはフィルタ）でグループのメンバーを直接引く。
+    CSVは両方の表がグループ順に並んでいることを利用して突き合わせながら読む。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = table_format(path)
+        if self.format == 'sqlite':
+            self.connection = sqlite3.connect(path)
+            self.connection.row_factory = sqlite3.Row
+        elif self.format == 'parquet':
+            import pyarrow.parquet
+            self.pq = pyarrow.parquet
+        self.groups_path, self.members_path = table_paths(path)
+
+    def close(self):
+        if self.format == 'sqlite':
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def groups(self, match_type=None, min_count=0):
+        """条件に合うグループを出力順に返す"""
+        if self.format == 'sqlite':
+            query = "SELECT * FROM groups WHERE count >= ?"
+            params = [min_count]
+            if match_type is not None:
+                query += " AND match_type = ?"
+                params.append(match_type)
+            for row in self.connection.execute(query + " ORDER BY rowid", params):
+                yield dict(row)
+        elif self.format == 'parquet':
+            filters = [('count', '>=', min_count)]
+            if match_type is not None:
+                filters.append(('match_type', '=', match_type))
+            yield from self.pq.read_table(self.groups_path, filters=filters).to_pylist()
+        else:
+            with open_text(self.groups_path, 'r', newline='') as f:
+                for row in csv.DictReader(f):
+                    row['count'] = int(row['count'])
+                    if row['count'] >= min_count and (match_type is None or row['match_type'] == match_type):
+                        yield row
+
+    def members(self, group_id):
+        """1グループのメンバーを行番号順に返す"""
+        if self.format == 'sqlite':
+            rows = self.connection.execute("SELECT * FROM members WHERE group_id = ? ORDER BY row_index",
+                                           [group_id])
+            return [dict(row) for row in rows]
+        if self.format == 'parquet':
+            return self.pq.read_table(self.members_path, filters=[('group_id', '=', group_id)]).to_pylist()
+        return next((members for group, members in self.groups_with_members() if group['group_id'] == group_id), [])
+
+    def groups_with_members(self, match_type=None, min_count=0):
+        """条件に合うグループとそのメンバーの組を順に返す"""
+        if self.format != 'csv':
+            for group in self.groups(match_type, min_count):
+                yield group, self.members(group['group_id'])
+            return
+
+        with open_text(self.members_path, 'r', newline='') as f:
+            members = csv.DictReader(f)
+            member = next(members, None)
+            for group in self.groups(match_type, min_count):
+                # 対象外のグループのメンバーは読み飛ばす
+                while member is not None and member['group_id'] != group['group_id']:
+                    member = next(members, None)
+                found = []
+                while member is not None and member['group_id'] == group['group_id']:
+                    found.append(member)
+                    member = next(members, None)
+                yield group, found
@@ -0,0 +1,155 @@
+import math
+from array import array
+from collections import Counter
+
+def key_tokens(key, key_name='normalized'):
+    """キーをトークンの集合にする（形態素キーは空白区切りの単語、正規化キーは文字bigram）
+
+    キーの種類はキーの中身（空白の有無）からは推測しない。1語だけの形態素キーも単語として扱い、
+    同じ列の中でトークンの種類が混ざらないようにする。
+    """
+    if key_name == 'morphological':
+        return set(key.split())
+    if len(key) < 2:
+        return {key} if key else set()
+    return {key[k:k + 2] for k in range(len(key) - 1)}
+
+def document_frequencies(token_sets):
+    """各トークンが出現する文書数を1回の走査で数える"""
+    df = Counter()
+    for tokens in token_sets:
+        df.update(tokens)
+    return df
+
+def posting_histogram(lengths):
+    """ポスティング長の分布を2のべき乗の区間ごとに集計する"""
+    lengths = list(lengths)
+    buckets = Counter()
+    for length in lengths:
+        if length <= 0:
+            continue
+        low = 1 << (length.bit_length() - 1)
+        buckets[f"{low}-{2 * low - 1}" if low > 1 else "1"] += 1
+    ordered = sorted(buckets.items(), key=lambda item: int(item[0].split('-')[0]))
+    return {
+        "tokens": sum(1 for length in lengths if length > 0),
+        "total_postings": sum(lengths),
+        "max": max(lengths, default=0),
+        "mean": round(sum(lengths) / len(lengths), 2) if lengths else 0.0,
+        "pairs_upper_bound": sum(length * (length - 1) // 2 for length in lengths),
+        "histogram": dict(ordered),
+    }
+
+def word_set(key):
+    """集合のJaccard係数用のトークンの重み（異なる単語ごとに1）"""
+    return Counter(set(key.split()))
+
+def word_counts(key):
+    """多重集合の類似度用のトークンの重み（単語の出現回数）"""
+    return Counter(key.split())
+
+def char_counts(key):
+    """文字列の一致率用のトークンの重み（文字の出現回数）"""
+    return Counter(key)
+
+def prefix_length(weights, overlap):
+    """珍しい順に並べたトークンの重みのうち、残りの重みの合計がoverlap×総重みを下回る最短の接頭辞の長さ
+
+    類似度がしきい値以上の組は、それぞれの総重みのoverlap倍以上の重みのトークンを共有するため、
+    共有するトークンのうち最も珍しいものが両方の接頭辞に含まれる。
+    """
+    total = sum(weights)
+    limit = overlap * total - 1e-9
+    suffix = total
+    for length, weight in enumerate(weights, 1):
+        suffix -= weight
+        if suffix < limit:
+            return length
+    return len(weights)
+
+class IdfPostingIndex:
+    """文書頻度で刈り込んだトークンの転置インデックス
+
+    token_setsは文書ごとのトークンの重み（Counter）とする。
+    mode='stop'  : 出現率がmax_dfを超えるトークンをストップトークンとして除く（近似）
+    mode='prefix': トークンを文書頻度の昇順に並べ、類似度のしきい値から決まる共有すべき重みの割合overlapで
+                   決まる接頭辞（珍しいトークン）だけを索引する（取りこぼしなし）
+    """
+
+    def __init__(self, token_sets, mode='prefix', overlap=0.5, max_df=0.5):
+        self.mode = mode
+        self.n = len(token_sets)
+        self.df = document_frequencies(set(tokens) for tokens in token_sets)
+        self.stop_tokens = set()
+
+        if mode == 'stop':
+            limit = max_df * self.n
+            self.stop_tokens = {token for token, count in self.df.items() if count > limit}
+            self.index_tokens = [sorted(set(tokens) - self.stop_tokens) for tokens in token_sets]
+        elif mode == 'prefix':
+            rank = {token: (count, token) for token, count in self.df.items()}
+            self.index_tokens = []
+            for tokens in token_sets:
+                ordered = sorted(tokens, key=rank.__getitem__)
+                self.index_tokens.append(ordered[:prefix_length([tokens[token] for token in ordered], overlap)])
+        else:
+            raise ValueError(f"不明な刈り込み方法: {mode}")
+
+        self.postings = {}
+        for i, tokens in enumerate(self.index_tokens):
+            for token in tokens:
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = array('i')
+                posting.append(i)
+
+    def candidates(self, i):
+        """iより後ろで、索引トークンを1つ以上共有する番号を昇順で返す"""
+        found = set()
+        for token in self.index_tokens[i]:
+            posting = self.postings[token]
+            # ポスティングは昇順なので、i以下の部分は読み飛ばせる
+            low, high = 0, len(posting)
+            while low < high:
+                mid = (low + high) // 2
+                if posting[mid] <= i:
+                    low = mid + 1
+                else:
+                    high = mid
+            found.update(posting[low:])
+        return sorted(found)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "documents": self.n,
+            "vocabulary": len(self.df),
+            "stop_tokens": len(self.stop_tokens),
+            "top_tokens": [[token, count] for token, count in self.df.most_common(10)],
+            "before": posting_histogram(self.df.values()),
+            "after": posting_histogram(len(posting) for posting in self.postings.values()),
+        }
+
+def block_idf(unique_keys, scorer, threshold, mode='prefix', max_df=0.5, stats=None, key='normalized', **options):
+    """文書頻度で刈り込んだ転置インデックスから候補ペアを作る
+
+    prefixモードのトークンと共有すべき重みの割合はスコア関数ごとに決める（scorerの'tokens'と'overlap'）。
+    stopモードのトークンはキーの種類（key）で決める。
+    """
+    if mode == 'prefix':
+        if 'tokens' not in scorer:
+            raise ValueError("このスコア関数には取りこぼしのない接頭辞の条件がないため、idfブロッカーはstopモードで使ってください")
+        overlap = scorer['overlap'](threshold) if threshold > 0 else 0.0
+        if overlap <= 0:
+            # どの組もしきい値に届き得るため全ての組を候補とする
+            n = len(unique_keys)
+            return lambda i: range(i + 1, n)
+        from pipeline import resolve
+        tokens = resolve(scorer['tokens'])
+        index = IdfPostingIndex([tokens(key) for key in unique_keys], mode, overlap)
+    else:
+        index = IdfPostingIndex([Counter(key_tokens(unique_key, key)) for unique_key in unique_keys], mode,
+                                max_df=max_df)
+    if stats is not None:
+        stats['idf_index'] = index.stats()
+    return index.candidates
@@ -0,0 +1,256 @@
+import argparse
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import types
+from array import array
+
+MAGIC = b'PCJANOME'
+ARTIFACT_VERSION = 2
+ALIGN = 8
+ENV_PATH = 'PUBCOM_JANOME_ARTIFACT'
+DICTIONARY_FILES = [f'entries_{kind}{i}.py' for kind in ('compact', 'extra') for i in range(10)]
+
+_attached = None
+_attach_lock = threading.Lock()
+
+def default_path():
+    """成果物の保存先（環境変数PUBCOM_JANOME_ARTIFACTで変更できる。offなら成果物を使わない）"""
+    if os.environ.get(ENV_PATH):
+        return os.environ[ENV_PATH]
+    from janome import __version__
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'pubcom', f'janome-{__version__}-sysdic.bin')
+
+def sysdic_dir():
+    """janome.sysdicをimportせずに、システム辞書のディレクトリを返す"""
+    import janome
+    return os.path.join(os.path.dirname(os.path.abspath(janome.__file__)), 'sysdic')
+
+def dictionary_fingerprint(base_dir):
+    """成果物が参照する辞書ファイル（エントリ本体）が変更されていないかを確かめるための情報"""
+    from janome import __version__
+    files = {}
+    for name in DICTIONARY_FILES:
+        info = os.stat(os.path.join(base_dir, name))
+        files[name] = [info.st_size, info.st_mtime_ns]
+    return {"janome": __version__, "path": base_dir, "files": files}
+
+def build_artifact(path):
+    """janomeのシステム辞書を読み込み、mmapで共有できる1つのファイルに書き出す
+
+    接続コスト表は行優先の整数配列、FSTは展開済みのバイト列、エントリの位置表は整数配列、文字種と未知語の
+    定義はmarshal形式（読み込んでもコードを実行しない）として格納する。
+    エントリ本体はjanomeの辞書ファイルをそのままmmapするため、成果物には位置だけを記録する。
+    """
+    import base64
+    from importlib import import_module
+    from janome import sysdic
+
+    sections = []
+    offset = 0
+
+    def add(data):
+        nonlocal offset
+        data = bytes(data)
+        start = offset
+        sections.append(data)
+        padding = -len(data) % ALIGN
+        if padding:
+            sections.append(b'\0' * padding)
+        offset += len(data) + padding
+        return [start, len(data)]
+
+    rows = len(sysdic.connections)
+    cols = len(sysdic.connections[0])
+    low = min(min(row) for row in sysdic.connections)
+    high = max(max(row) for row in sysdic.connections)
+    typecode = 'h' if -32768 <= low and high <= 32767 else 'i'
+    table = array(typecode)
+    for row in sysdic.connections:
+        table.extend(row)
+    header = {
+        "version": ARTIFACT_VERSION,
+        "dictionary": dictionary_fingerprint(sysdic.base_dir),
+        "connections": {"section": add(table.tobytes()), "rows": rows, "cols": cols, "typecode": typecode},
+        "fst": [add(base64.b64decode(import_module(f'janome.sysdic.fst_data{i}').DATA)) for i in range(2)],
+        "chardef": add(marshal.dumps(sysdic.chardef.DATA)),
+        "unknowns": add(marshal.dumps(sysdic.unknowns.DATA)),
+    }
+    buckets = import_module('janome.sysdic.entries_buckets').DATA
+    for kind in ('compact', 'extra'):
+        header[kind] = []
+        for i in range(10):
+            index = import_module(f'janome.sysdic.entries_{kind}{i}_idx').DATA
+            header[kind].append({"bucket": list(buckets[i]), "offset": index['offset'],
+                                 "positions": add(array('I', index['positions']).tobytes())})
+
+    encoded = json.dumps(header).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(encoded)) + encoded
+    prefix += b'\0' * (-len(prefix) % ALIGN)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # 並行して作成されても壊れたファイルを読まないよう、一時ファイルから置き換える
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(prefix)
+            for data in sections:
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+class ArtifactDictionary:
+    """mmapした成果物の各セクションを、janome.sysdicと同じ形で参照する"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"janome辞書の成果物ではありません: {path}")
+        size = struct.unpack('<I', self.mm[len(MAGIC):len(MAGIC) + 4])[0]
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.mm[start:start + size])
+        self.base = start + size + (-(start + size) % ALIGN)
+        self.view = memoryview(self.mm)
+
+    def section(self, location):
+        start, length = location
+        return self.view[self.base + start:self.base + start + length]
+
+    def connections(self):
+        """接続コスト表（connections[左文脈ID][右文脈ID]で参照できる行のリスト）"""
+        info = self.header['connections']
+        table = self.section(info['section']).cast(info['typecode'])
+        cols = info['cols']
+        return [table[r * cols:(r + 1) * cols] for r in range(info['rows'])]
+
+    def fstdata(self):
+        return [self.section(location) for location in self.header['fst']]
+
+    def data(self, name):
+        return marshal.loads(self.section(self.header[name]))
+
+    def entry_index(self, kind):
+        """辞書ファイルのバケットごとの {offset, positions}（positionsはmmap上の整数配列）"""
+        return [(tuple(item['bucket']), {"offset": item['offset'],
+                                         "positions": self.section(item['positions']).cast('I')})
+                for item in self.header[kind]]
+
+def sysdic_module(dictionary, base_dir):
+    """成果物を参照するjanome.sysdicの代わりのモジュールを作る"""
+    from janome.dic import LoadingDictionaryError
+
+    module = types.ModuleType('janome.sysdic')
+    module.base_dir = base_dir
+    module.connections = dictionary.connections()
+    module.chardef = types.SimpleNamespace(DATA=dictionary.data('chardef'))
+    module.unknowns = types.SimpleNamespace(DATA=dictionary.data('unknowns'))
+
+    def entries(compact=False):
+        # 全エントリをメモリに展開するモード（Tokenizer(mmap=False)）には対応しない
+        raise LoadingDictionaryError()
+
+    def mmap_entries(compact=False):
+        open_files = []
+
+        def mapped(kind):
+            result = {}
+            for (bucket, index), i in zip(dictionary.entry_index(kind), range(10)):
+                fp = open(os.path.join(base_dir, f'entries_{kind}{i}.py'), 'rb')
+                open_files.append(fp)
+                result[bucket] = (mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ), index)
+            return result
+
+        return mapped('compact'), None if compact else mapped('extra'), open_files
+
+    def all_fstdata():
+        return dictionary.fstdata()
+
+    module.entries = entries
+    module.mmap_entries = mmap_entries
+    module.all_fstdata = all_fstdata
+    return module
+
+def load_module(path, base_dir, build):
+    """成果物を開き（ない・古い場合はbuild=Trueなら作成して）、janome.sysdicの代わりのモジュールを返す"""
+    try:
+        dictionary = ArtifactDictionary(path) if os.path.exists(path) else None
+    except (ValueError, struct.error):
+        dictionary = None
+
+    if dictionary is not None and dictionary.header.get('version') == ARTIFACT_VERSION:
+        if dictionary.header['dictionary'] != dictionary_fingerprint(base_dir):
+            dictionary = None
+    else:
+        dictionary = None
+
+    if dictionary is None:
+        if not build:
+            return None
+        build_artifact(path)
+        # 作成のために読み込んだ辞書は破棄し、成果物を参照する
+        import janome
+        for name in [name for name in sys.modules if name == 'janome.sysdic' or name.startswith('janome.sysdic.')]:
+            del sys.modules[name]
+        if hasattr(janome, 'sysdic'):
+            del janome.sysdic
+        dictionary = ArtifactDictionary(path)
+    return sysdic_module(dictionary, base_dir)
+
+def attach(path=None, build=True):
+    """janomeのシステム辞書として成果物を使うよう設定する（janome.tokenizerのimport前に呼ぶ）
+
+    成果物がない・古い場合はbuild=Trueなら作成する。すでにjanome.sysdicが読み込まれている場合や
+    janomeがない場合、成果物の確認・作成・読み込みのいずれかに失敗した場合は何もせず、janomeは通常の
+    辞書を読み込む。成果物を使うよう設定できたかを返す。
+    """
+    global _attached
+    if _attached is not None:
+        return _attached
+    # 複数のスレッドから同時に呼ばれても、設定が終わるまで他のスレッドを待たせる（成果物の作成も1回にする）
+    with _attach_lock:
+        if _attached is None:
+            _attached = attach_module(path, build)
+    return _attached
+
+def attach_module(path, build):
+    """attachの本体（成果物をjanome.sysdicとして設定できたかを返す）"""
+    if 'janome.sysdic' in sys.modules or os.environ.get(ENV_PATH) == 'off':
+        return False
+    try:
+        import janome
+    except ImportError:
+        return False
+    try:
+        module = load_module(path or default_path(), sysdic_dir(), build)
+    except Exception as e:
+        # 書き込めない保存先や壊れた成果物などでは、成果物を使わずに通常の辞書で続ける
+        print(f"janome辞書の成果物を使わずに続けます: {e}", file=sys.stderr)
+        module = None
+    if module is None:
+        return False
+
+    sys.modules['janome.sysdic'] = module
+    janome.sysdic = module
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='janomeのシステム辞書をmmapで共有できる成果物に変換する')
+    parser.add_argument('--output', help=f'成果物の保存先（既定: 環境変数{ENV_PATH}または~/.cache/pubcom/）')
+
+    args = parser.parse_args()
+    start_time = time.time()
+    path = build_artifact(args.output or default_path())
+    print(f"{path}を作成しました（{os.path.getsize(path) / 1024 / 1024:.1f}MB、{time.time() - start_time:.1f}秒）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline import BATCH_SIZE, new_batch
+
+CHUNK_BYTES = 16 * 1024 * 1024
+SCAN_BYTES = 8 * 1024 * 1024
+
+def record_end(f, start, parity=0):
+    """startから読み進め、引用符の外にある最初の改行の直後の位置を返す（見つからなければファイル末尾）
+
+    RFC 4180形式では引用符内の引用符は "" と2つ続けて書くため、
+    レコードの先頭から数えた引用符の数が偶数の位置の改行だけがレコードの区切りになる。
+    """
+    f.seek(start)
+    position = start
+    while True:
+        block = f.read(SCAN_BYTES)
+        if not block:
+            return position
+        offset = 0
+        while True:
+            newline = block.find(b'\n', offset)
+            if newline < 0:
+                parity ^= block.count(b'"', offset) & 1
+                break
+            parity ^= block.count(b'"', offset, newline) & 1
+            if not parity:
+                return position + newline + 1
+            offset = newline + 1
+        position += len(block)
+
+def split_ranges(input_file, chunk_bytes=CHUNK_BYTES):
+    """ヘッダーを除いた本体を、レコードの境界で区切ったおおよそchunk_bytesごとのバイト範囲を順に返す
+
+    境界は前の範囲の終端（レコードの先頭）から引用符の偶奇を数えて決めるため、
+    引用符内の改行で区切られることはない。
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, 'rb') as f:
+        start = record_end(f, 0)  # ヘッダーをスキップ
+        while start < size:
+            # 目標位置までの引用符の偶奇を数えてから、次の区切りを探す
+            target = min(size, start + chunk_bytes)
+            f.seek(start)
+            parity = 0
+            position = start
+            while position < target:
+                block = f.read(min(SCAN_BYTES, target - position))
+                parity ^= block.count(b'"') & 1
+                position += len(block)
+            end = record_end(f, target, parity) if target < size else size
+            yield start, end
+            start = end
+
+def parse_range(task):
+    """バイト範囲をCSVとして解析し、IDとテキスト（とソースファイル名）の列を返す（ワーカープロセスで実行）"""
+    input_file, start, end, id_col, text_col, source_col = task
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # 逐次版と同じく改行コードを\nにそろえてから解析する
+    text = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+    min_columns = max(id_col, text_col, source_col if source_col is not None else 0)
+    ids, texts, sources = [], [], []
+    for row in csv.reader(io.StringIO(text, newline='')):
+        if len(row) <= min_columns:
+            continue
+        ids.append(row[id_col])
+        texts.append(row[text_col])
+        if source_col is not None:
+            sources.append(row[source_col])
+    return ids, texts, sources
+
+def read_batches_parallel(input_file, id_col=0, text_col=1, sample_size=None, batch_size=BATCH_SIZE, source_col=None,
+                          workers=4, chunk_bytes=CHUNK_BYTES):
+    """CSVファイルをバイト範囲ごとに並列に解析し、read_batchesと同じバッチを入力順に返す"""
+    batch = new_batch(source_col)
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 解析済みの範囲を溜め込まないよう、同時に投入する範囲の数を抑える
+        futures = deque()
+        ranges = split_ranges(input_file, chunk_bytes)
+        for start, end in ranges:
+            futures.append(executor.submit(parse_range, (input_file, start, end, id_col, text_col, source_col)))
+            if len(futures) >= workers * 2:
+                break
+
+        while futures:
+            # 先頭の範囲から順に受け取るため、行の順序は逐次読み込みと変わらない
+            ids, texts, sources = futures.popleft().result()
+            for start, end in ranges:
+                futures.append(executor.submit(parse_range, (input_file, start, end, id_col, text_col, source_col)))
+                break
+
+            position = 0
+            while position < len(ids):
+                take = min(batch_size - len(batch['ids']), len(ids) - position)
+                if sample_size:
+                    take = min(take, sample_size - count)
+                batch['ids'].extend(ids[position:position + take])
+                batch['texts'].extend(texts[position:position + take])
+                if source_col is not None:
+                    batch['sources'].extend(sources[position:position + take])
+                position += take
+                count += take
+
+                if sample_size and count >= sample_size:
+                    if batch['ids']:
+                        yield batch
+                    executor.shutdown(cancel_futures=True)
+                    return
+
+                if len(batch['ids']) >= batch_size:
+                    yield batch
+                    batch = new_batch(source_col)
+
+    if batch['ids']:
+        yield batch
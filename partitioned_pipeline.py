@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from comment_table import CommentTable, ExactGroups, key_digest
+from pipeline import NORMALIZERS, ANALYZERS, SCORERS, BLOCKERS, generate_candidates, new_batch, resolve
+
+BLOCKS_PER_WORKER = 16
+# 構築に時間がかかり、候補の数が代表テキスト数に比例するブロッカー（親プロセスで1回だけ構築し、候補をワーカーに配る）
+SHARED_BLOCKERS = {'ann'}
+
+def split_partitions(batches, partition_by, batch_size):
+    """行をソースファイルごと（または読み込み順の塊ごと）の分割単位にまとめて返す
+
+    各分割単位は (行番号のリスト, IDのリスト, テキストのリスト) で、行番号は入力全体での通し番号。
+    """
+    buffers = {}
+    row = 0
+    for batch in batches:
+        for k, (id_value, text) in enumerate(zip(batch['ids'], batch['texts'])):
+            name = batch['sources'][k] if partition_by == 'source' else None
+            buffer = buffers.setdefault(name, ([], [], []))
+            buffer[0].append(row)
+            buffer[1].append(id_value)
+            buffer[2].append(text)
+            row += 1
+
+            if len(buffer[0]) >= batch_size:
+                yield buffers.pop(name)
+
+    yield from buffers.values()
+
+def process_partition(task):
+    """分割単位ごとに正規化・形態素解析・キーのダイジェスト計算を行う（ワーカープロセスで実行）"""
+    rows, ids, texts, normalizer, analyzer, key = task
+    normalize = resolve(NORMALIZERS[normalizer])
+    analyze = resolve(ANALYZERS[analyzer])
+
+    normalized = [normalize(text) for text in texts]
+    morphological = [analyze(text) for text in texts] if analyze is not None else None
+    keys = normalized if key == 'normalized' else morphological
+    digests = [key_digest(k) for k in keys]
+    return rows, ids, texts, normalized, morphological, digests
+
+def build_table_parallel(batches, normalizer, analyzer, key, workers, partition_by='chunk', batch_size=1000):
+    """分割単位をプロセスプールで並列処理し、行番号順に並べ直してCommentTableと完全一致グループを作る"""
+    table = CommentTable()
+    digests = []
+    pending = {}
+    next_row = 0
+    max_in_flight = workers * 4
+
+    def merge(result):
+        nonlocal next_row
+        rows, ids, texts, normalized, morphological, row_digests = result
+        for k, row in enumerate(rows):
+            pending[row] = (ids[k], texts[k], normalized[k], morphological[k] if morphological else None, row_digests[k])
+
+        # 分割をまたいで届いた結果を、入力の行順に表へ追加する
+        batch = new_batch()
+        batch['normalized'] = []
+        if morphological is not None:
+            batch['morphological'] = []
+        while next_row in pending:
+            id_value, text, norm_text, morph_text, digest = pending.pop(next_row)
+            batch['ids'].append(id_value)
+            batch['texts'].append(text)
+            batch['normalized'].append(norm_text)
+            if morph_text is not None:
+                batch['morphological'].append(morph_text)
+            digests.append(digest)
+            next_row += 1
+        if batch['ids']:
+            table.extend(batch)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = set()
+        for rows, ids, texts in split_partitions(batches, partition_by, batch_size):
+            futures.add(executor.submit(process_partition, (rows, ids, texts, normalizer, analyzer, key)))
+            if len(futures) >= max_in_flight:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(future.result())
+        for future in futures:
+            merge(future.result())
+
+    # 完全一致グループはダイジェストで分割をまたいで突き合わせる
+    return table, ExactGroups(table.keys(key), digests)
+
+_scoring_state = {}
+
+def init_scoring(unique_keys, scorer, blocker, threshold, blocker_options, score_backend='auto', candidate_lists=None):
+    _scoring_state.update(unique_keys=unique_keys, scorer=scorer, blocker=blocker, threshold=threshold,
+                          blocker_options=blocker_options, score_backend=score_backend, candidates=None, batch=None,
+                          candidate_lists=candidate_lists)
+
+def score_block(bounds):
+    """代表テキストの範囲についてしきい値以上の類似ペアを求める（ワーカープロセスで実行）"""
+    start, stop = bounds
+    unique_keys = _scoring_state['unique_keys']
+    threshold = _scoring_state['threshold']
+    scorer_spec = SCORERS[_scoring_state['scorer']]
+    score_fn = resolve(scorer_spec['function'])
+
+    # ブロッカーとまとめて採点する実装の前処理はワーカーごとに1回だけ行う
+    if _scoring_state['candidates'] is None:
+        from score_kernels import batch_scorer
+        if _scoring_state['candidate_lists'] is not None:
+            _scoring_state['candidates'] = _scoring_state['candidate_lists'].__getitem__
+        else:
+            _scoring_state['candidates'] = resolve(BLOCKERS[_scoring_state['blocker']])(
+                unique_keys, scorer_spec, threshold, **_scoring_state['blocker_options'])
+        _scoring_state['batch'] = batch_scorer(unique_keys, scorer_spec, score_fn, _scoring_state['score_backend'])
+    batch = _scoring_state['batch']
+
+    edges = []
+    for i, others in generate_candidates(_scoring_state['candidates'], len(unique_keys), start, stop):
+        key = unique_keys[i]
+        if batch is not None:
+            others = list(others)
+            scores = batch.score_many(i, others)
+        else:
+            scores = (score_fn(key, unique_keys[j]) for j in others)
+        matches = [(j, score) for j, score in zip(others, scores) if score >= threshold]
+        if matches:
+            edges.append((i, matches))
+    return edges
+
+def score_parallel(unique_keys, scorer, blocker, threshold, workers, blocker_options=None, score_backend='auto',
+                   stats=None):
+    """類似ペアをブロックごとに並列に求め、1つの辺集合にまとめる
+
+    ワーカーはそれぞれ全ての代表テキストからブロッカーを作る。SHARED_BLOCKERS（ann）は親プロセスで
+    全ての代表テキストから1回だけ索引を作り、候補のリストをワーカーに渡す（索引の構築を繰り返さず、
+    逐次実行と同じ候補になる）。その場合のブロッカーの統計はstatsに記録する。
+    """
+    n = len(unique_keys)
+    candidate_lists = None
+    if blocker in SHARED_BLOCKERS:
+        candidates = resolve(BLOCKERS[blocker])(unique_keys, SCORERS[scorer], threshold, stats=stats,
+                                                **(blocker_options or {}))
+        candidate_lists = [list(candidates(i)) for i in range(n)]
+    block_size = max(1, -(-n // (workers * BLOCKS_PER_WORKER)))
+    blocks = [(start, min(n, start + block_size)) for start in range(0, n, block_size)]
+
+    edges = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_scoring,
+                             initargs=(unique_keys, scorer, blocker, threshold, blocker_options or {},
+                                       score_backend, candidate_lists)) as executor:
+        for block_edges in executor.map(score_block, blocks):
+            edges.update(block_edges)
+    return edges
+
+def scored_from_edges(n, edges, assigned):
+    """辺集合を、逐次処理と同じ順序・同じ割り当て判定で貪欲法に渡す"""
+    for i in range(n):
+        if assigned[i]:
+            continue
+        yield i, [(j, score) for j, score in edges.get(i, ()) if not assigned[j]]
@@ -0,0 +1,649 @@
+import csv
+import argparse
+import importlib
+import json
+import math
+import time
+from bisect import bisect_left, bisect_right
+
+from comment_table import CommentTable, ExactGroups, row_array
+from score_cache import PairScoreCache
+from compressed_io import open_text, is_compressed, rounded
+
+BATCH_SIZE = 1000
+
+def resolve(spec):
+    """'モジュール名:関数名' 形式の指定から関数を取得する"""
+    if spec is None or callable(spec):
+        return spec
+    module_name, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+# 各ステージの実装は既存のプロセッサから遅延して読み込む
+NORMALIZERS = {
+    'neologdn': 'optimized_processor:normalize_text',
+}
+
+ANALYZERS = {
+    'none': None,
+    'morph': 'optimized_morphological_processor:morphological_analysis',
+    'morph-fast': 'fast_morph:morphological_analysis',
+}
+
+KEY_COLUMNS = {
+    'normalized': 'normalized_text',
+    'morphological': 'morphological_text',
+}
+
+# size: 長さ比による上限の計算に使う大きさ、min_ratio: しきい値を満たし得る最小の長さ比
+# tokens: idfブロッカー（prefix）で使うトークンの重み、overlap: しきい値以上の組が共有する重みの割合の下限
+SCORERS = {
+    'sequence': {
+        'function': 'optimized_processor:calculate_similarity',
+        'size': len,
+        'min_ratio': lambda t: t / (2 - t),
+        # 一致した文字数Mについて 2M/(|a|+|b|) >= t かつ M <= |b| から M >= t|a|/(2-t)
+        'tokens': 'idf_index:char_counts',
+        'overlap': lambda t: t / (2 - t),
+    },
+    'jaccard': {
+        'function': 'word_based_similarity_processor:calculate_word_similarity',
+        'size': lambda key: len(set(key.split())),
+        'min_ratio': lambda t: t,
+        'tokens': 'idf_index:word_set',
+        'overlap': lambda t: t,
+        'batch': 'jaccard',
+    },
+    'weighted': {
+        'function': 'word_based_similarity_processor:calculate_weighted_similarity',
+        'size': lambda key: len(key.split()),
+        'min_ratio': lambda t: t,
+        'tokens': 'idf_index:word_counts',
+        'overlap': lambda t: t,
+        'batch': 'weighted',
+    },
+    'extended': {
+        'function': 'enhanced_similarity_processor:calculate_word_similarity',
+        'size': lambda key: len(key.split()),
+        'min_ratio': lambda t: (math.sqrt(1 + 8 * t) - 1) / 2,
+        # 長さ比による補正は1以下なので、補正前の多重集合のJaccard係数もしきい値以上になる
+        'tokens': 'idf_index:word_counts',
+        'overlap': lambda t: t,
+        'batch': 'extended',
+    },
+}
+
+PRESETS = {
+    'optimized': {'analyzer': 'none', 'key': 'normalized', 'scorer': 'sequence', 'similarity': 0.8, 'with_score': False},
+    'morphological': {'analyzer': 'morph', 'key': 'morphological', 'scorer': 'sequence', 'similarity': 0.8, 'with_score': False},
+    'word': {'analyzer': 'morph', 'key': 'morphological', 'scorer': 'jaccard', 'similarity': 0.5, 'with_score': True},
+    'enhanced': {'analyzer': 'morph', 'key': 'morphological', 'scorer': 'extended', 'similarity': 0.2, 'with_score': True},
+}
+
+# --- reader ---
+
+def new_batch(source_col=None):
+    batch = {'ids': [], 'texts': []}
+    if source_col is not None:
+        batch['sources'] = []
+    return batch
+
+def read_batches(input_file, id_col=0, text_col=1, sample_size=None, batch_size=BATCH_SIZE, source_col=None,
+                 io_stats=None):
+    """CSVファイル（.gz/.xz/.zstも可）を読み込み、IDとテキスト（指定時はソースファイル名も）のバッチを順に返す"""
+    batch = new_batch(source_col)
+    count = 0
+    min_columns = max(id_col, text_col, source_col if source_col is not None else 0)
+
+    with open_text(input_file, 'r', io_stats) as f:
+        reader = csv.reader(f)
+        header = next(reader)  # ヘッダーをスキップ
+
+        for row in reader:
+            if len(row) <= min_columns:
+                continue
+
+            batch['ids'].append(row[id_col])
+            batch['texts'].append(row[text_col])
+            if source_col is not None:
+                batch['sources'].append(row[source_col])
+            count += 1
+
+            if len(batch['ids']) >= batch_size:
+                yield batch
+                batch = new_batch(source_col)
+
+            if sample_size and count >= sample_size:
+                break
+
+    if batch['ids']:
+        yield batch
+
+# --- normalizer / analyzer ---
+
+def normalize_batches(batches, normalizer):
+    """バッチの各テキストを正規化する"""
+    for batch in batches:
+        batch['normalized'] = [normalizer(text) for text in batch['texts']]
+        yield batch
+
+def analyze_batches(batches, analyzer):
+    """バッチの各テキストを形態素解析する"""
+    for batch in batches:
+        if analyzer is not None:
+            batch['morphological'] = [analyzer(text) for text in batch['texts']]
+        yield batch
+
+def collect(batches, table=None, checkpoint=None):
+    """ストリームを読み切ってCommentTableにまとめる（checkpoint指定時は一定間隔で途中結果を保存する）"""
+    if table is None:
+        table = CommentTable()
+    for batch in batches:
+        table.extend(batch)
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save_table(table)
+    return table
+
+def group_exact(keys):
+    """キーが完全一致する行をまとめる（空のキーは除外）"""
+    return ExactGroups(keys)
+
+# --- blocker ---
+
+# ブロッカーは前処理を行い、代表テキストの番号iからiより後ろの候補番号（昇順）を返す関数を作る
+
+def block_all(unique_keys, scorer, threshold, **options):
+    """全ての組を候補とする"""
+    n = len(unique_keys)
+    return lambda i: range(i + 1, n)
+
+def block_length(unique_keys, scorer, threshold, **options):
+    """長さ比の上限からしきい値に届かない組を除外する"""
+    size = scorer['size']
+    min_ratio = scorer['min_ratio'](threshold) if threshold > 0 else 0.0
+    sizes = [size(key) for key in unique_keys]
+    order = sorted(range(len(unique_keys)), key=sizes.__getitem__)
+    sorted_sizes = [sizes[i] for i in order]
+
+    def candidates(i):
+        s = sizes[i]
+        # 浮動小数点の丸めで境界上の組を落とさないよう少し広めに取る
+        low = bisect_left(sorted_sizes, s * min_ratio * (1 - 1e-9))
+        high = bisect_right(sorted_sizes, s / min_ratio * (1 + 1e-9)) if min_ratio > 0 else len(order)
+        return sorted(j for j in order[low:high] if j > i)
+
+    return candidates
+
+def generate_candidates(candidates, n, start=0, stop=None):
+    """代表テキストの範囲について (i, 候補番号) を順に返す"""
+    for i in range(start, n if stop is None else stop):
+        yield i, candidates(i)
+
+BLOCKERS = {
+    'all': block_all,
+    'length': block_length,
+    'idf': 'idf_index:block_idf',
+    'ann': 'ann_index:block_ann',
+}
+
+# --- scorer ---
+
+def score_candidates(candidates, unique_keys, score_fn, threshold, assigned, score_many=None):
+    """未割り当ての候補だけを採点し、しきい値以上の組を返す
+
+    score_many(i, 候補の番号のリスト)を渡すと、候補をまとめて採点する（score_kernels.BatchScorer）。
+    """
+    for i, others in candidates:
+        if assigned[i]:
+            continue
+
+        if score_many is not None:
+            others = [j for j in others if not assigned[j]]
+            yield i, [(j, score) for j, score in zip(others, score_many(i, others)) if score >= threshold]
+            continue
+
+        key = unique_keys[i]
+        matches = []
+        for j in others:
+            if assigned[j]:
+                continue
+            score = score_fn(key, unique_keys[j])
+            if score >= threshold:
+                matches.append((j, score))
+        yield i, matches
+
+# --- clusterer ---
+
+def cluster_greedy(scored, assigned):
+    """先頭から順に代表を決め、代表に類似するものを同じグループにまとめる"""
+    for i, matches in scored:
+        assigned[i] = 1
+        cluster = [(i, 1.0)]
+        for j, score in matches:
+            assigned[j] = 1
+            cluster.append((j, score))
+        yield cluster
+
+def cluster_none(scored, assigned):
+    """類似グループ化を行わない（完全一致のみ）"""
+    return iter(())
+
+CLUSTERERS = {
+    'greedy': cluster_greedy,
+    'none': cluster_none,
+}
+
+# --- writer ---
+
+def group_records(table, key, exact_match_groups, similarity_groups):
+    """出力するグループを (グループID, 判定種別, 行番号の配列, 代表のキー) の順に返す"""
+    for group_id, (key_text, rows) in enumerate(exact_match_groups.items()):
+        if len(rows) <= 1:  # 1件のみのグループはスキップ
+            continue
+        yield f"exact_{group_id}", "exact", rows, key_text
+
+    keys = table.keys(key)
+    for group_id, rows in similarity_groups:
+        yield f"similar_{group_id}", "similar", rows, keys[rows[0]]
+
+def member_scores(rows, keys, exact_match_groups, score_fn, score_cache):
+    """類似グループの代表と2件目以降の各メンバーとの類似度を返す"""
+    representative_key = keys[rows[0]]
+    representative_group = exact_match_groups.group_of(rows[0])
+    return [
+        score_cache.score(representative_group, exact_match_groups.group_of(row),
+                          score_fn, representative_key, keys[row])
+        for row in rows[1:]
+    ]
+
+def write_groups(output_file, table, key, exact_match_groups, similarity_groups, score_fn=None, with_score=False,
+                 score_cache=None, io_stats=None):
+    """グループ化の結果をCSV（拡張子が.gz/.xz/.zstなら圧縮）に出力する
+
+    類似グループの類似度はグループ化の際にscore_cacheへ登録した値を再利用する。
+    """
+    key_column = KEY_COLUMNS[key]
+    keys = table.keys(key)
+    header = ['group_id', 'match_type', 'count', 'representative_text', key_column]
+    if with_score:
+        header.append('similarity_score')
+    header += ['ids', 'original_texts']
+    if score_cache is None:
+        score_cache = PairScoreCache()
+
+    with open_text(output_file, 'w', io_stats, newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+
+        for group_id, match_type, rows, key_text in group_records(table, key, exact_match_groups, similarity_groups):
+            record = [group_id, match_type, len(rows), table.texts[rows[0]], key_text]
+            if with_score:
+                if match_type == 'exact':
+                    record.append("1.0")  # 完全一致の類似度は1.0
+                else:
+                    similarity_scores = member_scores(rows, keys, exact_match_groups, score_fn, score_cache)
+                    avg_similarity = sum(similarity_scores) / len(similarity_scores) if similarity_scores else 0
+                    record.append(f"{avg_similarity:.4f}")
+            record += ['|'.join(table.ids[row] for row in rows), '|'.join(table.texts[row] for row in rows)]
+            writer.writerow(record)
+
+def table_records(table, key, exact_match_groups, similarity_groups, score_fn, score_cache):
+    """group_tables.write_group_tablesに渡す (グループ, メンバーのリスト) を順に返す"""
+    keys = table.keys(key)
+    for group_id, match_type, rows, key_text in group_records(table, key, exact_match_groups, similarity_groups):
+        if match_type == 'exact':
+            scores = [1.0] * len(rows)
+        else:
+            scores = [1.0] + member_scores(rows, keys, exact_match_groups, score_fn, score_cache)
+        group = {
+            'group_id': group_id,
+            'match_type': match_type,
+            'count': len(rows),
+            'representative_row': rows[0],
+            'representative_text': table.texts[rows[0]],
+            'key_text': key_text,
+            'similarity_score': round(sum(scores[1:]) / (len(scores) - 1), 4) if len(scores) > 1 else 0.0,
+        }
+        members = [[group_id, row, table.ids[row], round(score, 4), table.texts[row]]
+                   for row, score in zip(rows, scores)]
+        yield group, members
+
+def run_pipeline(input_file, output_file, similarity_threshold=0.8, id_col=0, text_col=1, sample_size=None,
+                 normalizer='neologdn', analyzer='none', key='normalized', blocker='all', scorer='sequence',
+                 clusterer='greedy', with_score=False, batch_size=BATCH_SIZE, workers=1, partition_by='chunk',
+                 source_col=None, score_cache_size=1000000, blocker_options=None, run_dir=None, resume=False,
+                 checkpoint_interval=60.0, reader_workers=1, output_layout='wide', preview=False, time_budget=None,
+                 score_backend='auto'):
+    """各ステージを組み立ててファイルを処理し、類似テキストをグループ化する
+
+    workersが2以上の場合は、行単位の処理と類似ペアの計算をプロセスプールで分割して実行する。
+    reader_workersが2以上の場合は、CSVをバイト範囲に分けて並列に解析する。
+    output_layout='tables'の場合は、groups表とmembers表に分けて出力する（形式は出力先の拡張子で決まる）。
+    run_dirを指定すると各ステージの途中結果を保存し、resume=Trueで中断した位置から再開する。
+    preview=Trueの場合は、ファイル全体を1回走査して重複の規模を推定し、先頭ではなく全体から
+    一様に抽出したsample_size件（省略時は10000件）を処理する。
+    time_budgetを指定した場合は、完全一致までを全件処理した後、珍しいトークンを共有する組から順に
+    類似グループ化し、開始からtime_budget秒で打ち切る。
+    score_backendは単語ベースの類似度を候補ごとにまとめて計算する実装（auto/numba/numpy/python）。
+    """
+    from tqdm import tqdm
+
+    started_at = time.time()
+
+    if key == 'morphological' and ANALYZERS[analyzer] is None:
+        raise ValueError("形態素解析のキーを使うにはanalyzerを指定してください")
+
+    scorer_spec = SCORERS[scorer]
+    score_fn = resolve(scorer_spec['function'])
+
+    checkpoint = None
+    if run_dir is not None and time_budget is not None:
+        raise ValueError("時間予算を指定した実行は途中結果から再開できないため、run_dirと同時に指定できません")
+    if run_dir is not None:
+        from checkpoint import RunCheckpoint, input_fingerprint
+        config = {
+            "input": input_fingerprint(input_file), "id_col": id_col, "text_col": text_col,
+            "sample_size": sample_size, "source_col": source_col, "normalizer": normalizer, "analyzer": analyzer,
+            "key": key, "blocker": blocker, "blocker_options": blocker_options or {}, "scorer": scorer,
+            "clusterer": clusterer, "similarity_threshold": similarity_threshold,
+        }
+        if preview:
+            config["preview"] = True
+        checkpoint = RunCheckpoint(run_dir, config, resume, checkpoint_interval)
+
+    print("テキストの読み込み・正規化・形態素解析を開始...")
+    if partition_by == 'source' and source_col is None:
+        raise ValueError("ソースファイルでの分割にはsource_colを指定してください")
+
+    io_stats = {"input": {}, "output": {}}
+    preview_stats = None
+    table, table_done = checkpoint.load_table() if checkpoint is not None else (None, False)
+    exact_match_groups = None
+    if table_done:
+        print(f"実行ディレクトリから{len(table)}件の読み込み結果を復元しました")
+    else:
+        if reader_workers > 1 and is_compressed(input_file):
+            print("圧縮された入力はバイト範囲に分割できないため、1プロセスで読み込みます")
+            reader_workers = 1
+        if preview:
+            from preview import PREVIEW_SAMPLE, preview_file, print_preview, sample_batches
+            preview_stats, sample = preview_file(input_file, id_col, text_col, sample_size or PREVIEW_SAMPLE, normalizer,
+                                                 source_col, reader_workers=reader_workers, io_stats=io_stats['input'])
+            print_preview(preview_stats)
+            batches = sample_batches(sample, batch_size, source_col)
+        elif reader_workers > 1:
+            from parallel_reader import read_batches_parallel
+            batches = read_batches_parallel(input_file, id_col, text_col, sample_size, batch_size, source_col,
+                                            reader_workers)
+        else:
+            batches = read_batches(input_file, id_col, text_col, sample_size, batch_size, source_col,
+                                   io_stats['input'])
+        if table is not None:
+            from checkpoint import skip_rows
+            print(f"処理済みの{len(table)}件を読み飛ばして再開します")
+            batches = skip_rows(batches, len(table))
+        if workers > 1:
+            from partitioned_pipeline import build_table_parallel
+            print(f"{workers}プロセスで分割処理します（分割方法: {partition_by}）")
+            rest, exact_match_groups = build_table_parallel(tqdm(batches, desc="バッチ読み込み", unit="batch"),
+                                                            normalizer, analyzer, key, workers, partition_by, batch_size)
+            if table is not None:
+                table.extend_table(rest)
+                exact_match_groups = None  # 復元した行も含めて作り直す
+            else:
+                table = rest
+        else:
+            batches = normalize_batches(batches, resolve(NORMALIZERS[normalizer]))
+            batches = analyze_batches(batches, resolve(ANALYZERS[analyzer]))
+            table = collect(tqdm(batches, desc="バッチ処理", unit="batch"), table, checkpoint)
+        if checkpoint is not None:
+            checkpoint.save_table(table, done=True)
+    print(f"読み込み完了: {len(table)}件のテキスト")
+
+    print("完全一致テキストのグループ化...")
+    if exact_match_groups is None and checkpoint is not None:
+        exact_match_groups = checkpoint.load_exact(table.keys(key))
+    if exact_match_groups is None:
+        exact_match_groups = group_exact(table.keys(key))
+    if checkpoint is not None and not checkpoint.manifest['exact']:
+        checkpoint.save_exact(exact_match_groups)
+    unique_keys = list(exact_match_groups.keys())
+
+    print("類似テキストのグループ化...")
+    # ブロッカーのトークンはキーの種類で決める（キーの中身からは推測しない）
+    blocker_options = {'key': key, **(blocker_options or {})}
+    blocker_stats = {}
+    # グループ化で計算した代表との類似度を出力時に再利用する
+    score_cache = PairScoreCache(score_cache_size)
+    similarity_groups = []
+
+    def add_group(group_id, cluster):
+        leader = cluster[0][0]
+        for i, score in cluster[1:]:
+            score_cache.put(leader, i, score)
+        rows = row_array()
+        for i, _ in cluster:
+            rows.extend(exact_match_groups.group_rows(i))
+        similarity_groups.append((group_id, rows))
+
+    assigned = bytearray(len(unique_keys))
+    next_leader = next_group = 0
+    similar_done = False
+    if checkpoint is not None:
+        assigned, restored, next_leader, next_group, similar_done = checkpoint.load_similar(len(unique_keys))
+        for group_id, cluster in restored:
+            add_group(group_id, cluster)
+        if next_leader:
+            print(f"類似グループ化を{next_leader}/{len(unique_keys)}件目から再開します")
+
+    budget_stats = None
+    batch = None
+    if time_budget is not None and clusterer != 'none':
+        from anytime_grouping import cluster_anytime
+        remaining = started_at + time_budget - time.time()
+        print(f"時間予算の残り{max(0.0, remaining):.1f}秒で、珍しいトークンを共有する組から類似グループ化します")
+        clusters, budget_stats = cluster_anytime(unique_keys, scorer_spec, score_fn, similarity_threshold,
+                                                 started_at + time_budget, key=key)
+        for group_id, cluster in enumerate(clusters):
+            add_group(group_id, cluster)
+        budget_stats = {"budget_seconds": time_budget, "seconds_before_similarity": round(time_budget - remaining, 3),
+                        **budget_stats}
+        if budget_stats["stopped_early"]:
+            print(f"時間予算に達したため打ち切りました（調べた組 {budget_stats['processed_fraction'] * 100:.1f}%、"
+                  f"推定再現率 {budget_stats['estimated_recall'] * 100:.1f}%）")
+        scored = iter(())
+    elif similar_done or clusterer == 'none':
+        scored = iter(())
+    elif workers > 1:
+        from partitioned_pipeline import score_parallel, scored_from_edges
+        edges = checkpoint.load_edges() if checkpoint is not None else None
+        if edges is None:
+            edges = score_parallel(unique_keys, scorer, blocker, similarity_threshold, workers, blocker_options,
+                                   score_backend, blocker_stats)
+            if checkpoint is not None:
+                checkpoint.save_edges(edges)
+        scored = scored_from_edges(len(unique_keys), edges, assigned)
+    else:
+        candidates = resolve(BLOCKERS[blocker])(unique_keys, scorer_spec, similarity_threshold, stats=blocker_stats, **blocker_options)
+        candidates = generate_candidates(candidates, len(unique_keys), next_leader)
+        candidates = tqdm(candidates, total=len(unique_keys), initial=next_leader, desc="類似グループ化")
+        from score_kernels import batch_scorer
+        batch = batch_scorer(unique_keys, scorer_spec, score_fn, score_backend)
+        scored = score_candidates(candidates, unique_keys, score_fn, similarity_threshold, assigned,
+                                  batch.score_many if batch is not None else None)
+
+    pending = []
+    for group_id, cluster in enumerate(CLUSTERERS[clusterer](scored, assigned), next_group):
+        next_group = group_id + 1
+        if len(cluster) > 1:  # 他と類似しないグループは出力しない
+            add_group(group_id, cluster)
+            pending.append((group_id, cluster))
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save_similar(pending, cluster[0][0] + 1, next_group)
+            pending = []
+    if checkpoint is not None and not similar_done:
+        checkpoint.save_similar(pending, len(unique_keys), next_group, done=True)
+
+    print("結果の出力...")
+    if output_layout == 'tables':
+        from group_tables import write_group_tables
+        output_paths = write_group_tables(output_file, table_records(table, key, exact_match_groups, similarity_groups,
+                                                                     score_fn, score_cache), io_stats['output'])
+        print(f"groups表とmembers表を出力しました: {', '.join(output_paths)}")
+    else:
+        write_groups(output_file, table, key, exact_match_groups, similarity_groups, score_fn, with_score,
+                     score_cache, io_stats['output'])
+
+    exact_match_count = sum(1 for rows in exact_match_groups.values() if len(rows) > 1)
+    similar_match_count = len(similarity_groups)
+    total_exact_items = sum(len(rows) for rows in exact_match_groups.values() if len(rows) > 1)
+    total_similar_items = sum(len(rows) for _, rows in similarity_groups)
+
+    stats = {
+        "total_items": len(table),
+        "exact_match_groups": exact_match_count,
+        "similar_match_groups": similar_match_count,
+        "total_exact_items": total_exact_items,
+        "total_similar_items": total_similar_items,
+        "pipeline": {
+            "normalizer": normalizer,
+            "analyzer": analyzer,
+            "key": key,
+            "blocker": blocker,
+            "scorer": scorer,
+            "clusterer": clusterer,
+            "similarity_threshold": similarity_threshold,
+            "workers": workers,
+            "reader_workers": reader_workers,
+            "output_layout": output_layout,
+            "partition_by": partition_by if workers > 1 else None,
+            "score_backend": batch.backend if batch is not None else 'python',
+        },
+        "score_cache": score_cache.stats(),
+        "blocker": blocker_stats,
+        "batch_scoring": batch.stats() if batch is not None else None,
+        "io": {name: rounded(value) for name, value in io_stats.items()},
+    }
+    if preview_stats is not None:
+        stats["preview"] = preview_stats
+    if budget_stats is not None:
+        stats["time_budget"] = budget_stats
+
+    with open(output_file + ".stats.json", 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    label = "形態素解析による完全一致グループ" if key == 'morphological' else "完全一致グループ"
+    print(f"処理が完了しました。結果は{output_file}に保存されています。")
+    print(f"統計情報: 全{len(table)}件中、{label}{exact_match_count}件（{total_exact_items}アイテム）、類似グループ{similar_match_count}件（{total_similar_items}アイテム）")
+
+    return stats
+
+def add_checkpoint_arguments(parser):
+    """チェックポイントと再開のCLIオプションを追加する"""
+    parser.add_argument('--run-dir', default=None, help='途中結果を保存する実行ディレクトリ')
+    parser.add_argument('--resume', action='store_true', help='実行ディレクトリに保存した途中結果から再開する')
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0, help='途中結果を保存する間隔（秒）')
+
+def checkpoint_options(args):
+    if args.resume and args.run_dir is None:
+        raise SystemExit("--resumeには--run-dirを指定してください")
+    return {'run_dir': args.run_dir, 'resume': args.resume, 'checkpoint_interval': args.checkpoint_interval}
+
+def add_stage_arguments(parser):
+    """ステージ切り替え用のCLIオプションを追加する"""
+    parser.add_argument('--normalizer', choices=sorted(NORMALIZERS), default=None, help='正規化ステージ')
+    parser.add_argument('--analyzer', choices=sorted(ANALYZERS), default=None, help='形態素解析ステージ')
+    parser.add_argument('--key', choices=sorted(KEY_COLUMNS), default=None, help='完全一致・類似度計算に使うキー')
+    parser.add_argument('--blocker', choices=sorted(BLOCKERS), default='length', help='候補ペアの絞り込み方法')
+    parser.add_argument('--idf-mode', choices=['prefix', 'stop'], default='prefix',
+                        help='idfブロッカーの刈り込み方法（prefix: 珍しいトークンの接頭辞、stop: 頻出トークンの除外）')
+    parser.add_argument('--max-df', type=float, default=0.5, help='stopモードで除外するトークンの出現率（0.0〜1.0）')
+    parser.add_argument('--ann-k', type=int, default=10, help='annブロッカーで候補にする近傍の数')
+    parser.add_argument('--ann-dim', type=int, default=128, help='annブロッカーのランダム射影後の次元数')
+    parser.add_argument('--ann-ef', type=int, default=64, help='annブロッカーの探索幅（大きいほど再現率が上がり遅くなる）')
+    parser.add_argument('--ann-min-cosine', type=float, default=0.0, help='annブロッカーで候補にする近傍のコサイン類似度の下限')
+    parser.add_argument('--ann-backend', choices=['auto', 'numpy', 'hnswlib'], default='auto',
+                        help='近傍探索の実装（auto: hnswlibがあれば使う）')
+    parser.add_argument('--scorer', choices=sorted(SCORERS), default=None, help='類似度の計算方法')
+    parser.add_argument('--clusterer', choices=sorted(CLUSTERERS), default='greedy', help='グループ化の方法')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='ステージ間で受け渡すバッチの件数')
+    parser.add_argument('--score-cache-size', type=int, default=1000000, help='類似度キャッシュに保持するペア数の上限')
+    parser.add_argument('--score-backend', choices=['auto', 'numba', 'numpy', 'python'], default='auto',
+                        help='単語ベースの類似度をまとめて計算する実装（auto: numba、numpyの順に使えるものを使う）')
+    parser.add_argument('--workers', type=int, default=1, help='並列処理に使うプロセス数')
+    parser.add_argument('--reader-workers', type=int, default=1,
+                        help='CSVの解析に使うプロセス数（2以上でファイルをバイト範囲に分けて並列に解析）')
+    parser.add_argument('--partition-by', choices=['chunk', 'source'], default='chunk',
+                        help='並列処理の分割方法（chunk: 読み込み順の塊、source: ソースファイル列）')
+    parser.add_argument('--source-col', type=int, default=None, help='ソースファイル名の列番号（0始まり）')
+    parser.add_argument('--output-layout', choices=['wide', 'tables'], default='wide',
+                        help='出力の形式（wide: 1グループ1行のCSV、tables: groups表とmembers表。'
+                             '出力先が.sqlite/.dbならSQLite、.parquetならParquet、それ以外はCSV）')
+    add_checkpoint_arguments(parser)
+
+def add_preview_argument(parser):
+    parser.add_argument('--preview', action='store_true',
+                        help='全件を1回走査して異なり数・重複率・重複の多いテンプレートを推定し、'
+                             '先頭ではなく全体から一様に抽出した--sample件（省略時は10000件）を処理する')
+
+def add_time_budget_argument(parser):
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='処理時間の上限（秒）。完全一致までを処理した後、珍しいトークンを共有する組から順に'
+                             '類似グループ化し、上限に達したら打ち切る')
+
+def stage_options(args, preset):
+    """プリセットとCLIオプションからステージ構成を決める"""
+    options = dict(PRESETS[preset])
+    for name in ('analyzer', 'key', 'scorer'):
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+    similarity = options.pop('similarity')
+    options['normalizer'] = args.normalizer or 'neologdn'
+    options['blocker'] = args.blocker
+    options['clusterer'] = args.clusterer
+    options['batch_size'] = args.batch_size
+    options['workers'] = args.workers
+    options['reader_workers'] = args.reader_workers
+    options['output_layout'] = args.output_layout
+    options['score_cache_size'] = args.score_cache_size
+    options['score_backend'] = args.score_backend
+    options['preview'] = args.preview
+    options['time_budget'] = args.time_budget
+    if args.blocker == 'idf':
+        options['blocker_options'] = {'mode': args.idf_mode, 'max_df': args.max_df}
+    elif args.blocker == 'ann':
+        options['blocker_options'] = {'k': args.ann_k, 'dim': args.ann_dim, 'ef': args.ann_ef,
+                                      'min_cosine': args.ann_min_cosine, 'backend': args.ann_backend}
+    options['partition_by'] = args.partition_by
+    options['source_col'] = args.source_col
+    options.update(checkpoint_options(args))
+    return similarity, options
+
+def main():
+    parser = argparse.ArgumentParser(description='ステージを組み替えられる類似テキストグループ化パイプライン')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('output_file', help='出力CSVファイルのパス')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='word', help='既存プロセッサに相当するステージ構成')
+    parser.add_argument('--similarity', type=float, default=None, help='類似度のしきい値（0.0〜1.0、省略時はプリセットの値）')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+    parser.add_argument('--sample', type=int, default=None, help='処理するサンプル数（指定しない場合は全件処理）')
+    add_preview_argument(parser)
+    add_time_budget_argument(parser)
+    add_stage_arguments(parser)
+
+    args = parser.parse_args()
+    similarity, options = stage_options(args, args.preset)
+    if args.similarity is not None:
+        similarity = args.similarity
+
+    start_time = time.time()
+    stats = run_pipeline(args.input_file, args.output_file, similarity, args.id_col, args.text_col, args.sample, **options)
+    end_time = time.time()
+
+    print(f"処理時間: {end_time - start_time:.2f}秒")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import argparse
+import json
+import time
+from collections import Counter
+
+from comment_table import ExactGroups, StringColumn
+from pipeline import (ANALYZERS, BLOCKERS, NORMALIZERS, PRESETS, SCORERS, cluster_greedy, generate_candidates,
+                      resolve, run_pipeline, score_candidates)
+
+PLAN_SAMPLE = 1000
+PRESET_SCRIPTS = {
+    'optimized': 'optimized_processor.py',
+    'morphological': 'optimized_morphological_processor.py',
+    'word': 'word_based_similarity_processor.py',
+    'enhanced': 'enhanced_similarity_processor.py',
+}
+# (表示名, ブロッカー, ブロッカーのオプション)
+BLOCKING_STRATEGIES = [
+    ('all', 'all', {}),
+    ('length', 'length', {}),
+    ('idf-prefix', 'idf', {'mode': 'prefix'}),
+    ('idf-stop', 'idf', {'mode': 'stop', 'max_df': 0.5}),
+    ('ann', 'ann', {}),
+]
+# 候補ペア数が代表テキスト数にほぼ比例するブロッカー（それ以外は2乗で増えるとみなす）
+LINEAR_BLOCKERS = {'ann'}
+
+def quantile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def corpus_statistics(normalized, morphological, preview):
+    """長さの分布、語彙数、トークンの文書頻度、完全一致の重複率をまとめる"""
+    lengths = sorted(len(text) for text in normalized)
+    document_frequency = Counter()
+    token_count = 0
+    for text in morphological:
+        tokens = text.split()
+        token_count += len(tokens)
+        document_frequency.update(set(tokens))
+    documents = max(1, len(morphological))
+    return {
+        "rows": preview["rows"],
+        "distinct_normalized_estimate": preview["distinct_normalized_estimate"],
+        "duplicate_rate_estimate": preview["duplicate_rate_estimate"],
+        "sample_rows": len(normalized),
+        "length": {"p50": quantile(lengths, 0.5), "p90": quantile(lengths, 0.9), "p99": quantile(lengths, 0.99),
+                   "max": lengths[-1] if lengths else 0},
+        "vocabulary": len(document_frequency),
+        "tokens_per_text": round(token_count / documents, 1),
+        "top_document_frequency": [{"token": token, "df": round(count / documents, 3)}
+                                   for token, count in document_frequency.most_common(10)],
+    }
+
+def cluster_labels(keys, scorer, threshold, blocker, blocker_options, key='normalized'):
+    """抽出した行を1つのプランでグループ化し、各行のグループ番号と候補ペア数・処理時間を返す（keyはキーの種類）"""
+    column = StringColumn()
+    column.extend(keys)
+    groups = ExactGroups(column)
+    unique_keys = groups.keys()
+    scorer_spec = SCORERS[scorer]
+    score_fn = resolve(scorer_spec['function'])
+
+    start_time = time.perf_counter()
+    candidates = resolve(BLOCKERS[blocker])(unique_keys, scorer_spec, threshold, stats={}, key=key,
+                                            **blocker_options)
+    lists = [candidates(i) for i in range(len(unique_keys))]
+    block_seconds = time.perf_counter() - start_time
+    candidate_pairs = sum(len(others) for others in lists)
+
+    scored_pairs = 0
+
+    def counted(a, b):
+        nonlocal scored_pairs
+        scored_pairs += 1
+        return score_fn(a, b)
+
+    start_time = time.perf_counter()
+    assigned = bytearray(len(unique_keys))
+    scored = score_candidates(generate_candidates(lambda i: lists[i], len(unique_keys)), unique_keys, counted,
+                              threshold, assigned)
+    cluster_of = list(range(len(unique_keys)))
+    for cluster in cluster_greedy(scored, assigned):
+        for i, _ in cluster:
+            cluster_of[i] = cluster[0][0]
+    score_seconds = time.perf_counter() - start_time
+
+    # 空のキーの行はそれぞれ単独のグループとする
+    labels = [cluster_of[groups.group_of(row)] if groups.group_of(row) >= 0 else -1 - row for row in range(len(keys))]
+    return labels, {"unique_keys": len(unique_keys), "candidate_pairs": candidate_pairs, "scored_pairs": scored_pairs,
+                    "block_seconds": block_seconds, "score_seconds": score_seconds}
+
+def estimate_plans(input_file, id_col=0, text_col=1, sample_size=PLAN_SAMPLE, presets=None, seed=0):
+    """コーパスを抽出して各エンジンとブロッカーの組み合わせの候補ペア数と実行時間を見積もる
+
+    抽出した行で実際にグループ化して候補ペア数・採点したペア数・処理時間を測り、代表テキスト数の比で全件に
+    拡大する（annは比例、それ以外は2乗）。再現率と適合率は、同じプリセット（スコア関数・しきい値）を
+    全ペア比較（all）で実行した結果に対する、同じグループになった行の組の割合とする。
+    """
+    from evaluate import pair_metrics
+    from preview import preview_file
+
+    preview, sample = preview_file(input_file, id_col, text_col, sample_size, seed=seed)
+    texts = [text for _, _, text, _ in sample]
+    rows = preview["rows"]
+
+    start_time = time.perf_counter()
+    normalize = resolve(NORMALIZERS['neologdn'])
+    keys = {'normalized': [normalize(text) for text in texts]}
+    row_seconds = {'none': (time.perf_counter() - start_time) / max(1, len(texts))}
+    for name, spec in ANALYZERS.items():
+        if spec is None or not any(PRESETS[p]['analyzer'] == name for p in presets or PRESETS):
+            continue
+        analyzer = resolve(spec)
+        start_time = time.perf_counter()
+        keys['morphological'] = [analyzer(text) for text in texts]
+        row_seconds[name] = row_seconds['none'] + (time.perf_counter() - start_time) / max(1, len(texts))
+    corpus = corpus_statistics(keys['normalized'], keys.get('morphological', []), preview)
+
+    # 全件の代表テキスト数は、正規化テキストの異なり数の推定値を抽出内での異なり数の比で補正して求める
+    sample_distinct = {name: len(set(filter(None, values))) for name, values in keys.items()}
+
+    plans = []
+    for preset in presets or sorted(PRESETS):
+        config = PRESETS[preset]
+        key_values = keys[config['key']]
+        distinct = max(1, sample_distinct[config['key']])
+        full_distinct = preview["distinct_normalized_estimate"] * distinct / max(1, sample_distinct['normalized'])
+        scale = max(1.0, full_distinct / distinct)
+        # 同じスコア関数・しきい値の全ペア比較を基準にして、ブロッカーによる取りこぼしだけを測る
+        reference_labels = None
+        for name, blocker, options in BLOCKING_STRATEGIES:
+            try:
+                labels, measured = cluster_labels(key_values, config['scorer'], config['similarity'], blocker, options,
+                                                  config['key'])
+            except ImportError as e:
+                print(f"{preset}/{name}: 必要なパッケージがないため見積もりません（{e}）")
+                continue
+            if reference_labels is None:
+                reference_labels = labels if blocker == 'all' else cluster_labels(
+                    key_values, config['scorer'], config['similarity'], 'all', {}, config['key'])[0]
+            metrics = pair_metrics(reference_labels, labels)
+            growth = scale if blocker in LINEAR_BLOCKERS else scale * scale
+            seconds = (rows * row_seconds[config['analyzer']] + measured['block_seconds'] * growth
+                       + measured['score_seconds'] * growth)
+            plans.append({
+                "preset": preset,
+                "blocking": name,
+                "blocker": blocker,
+                "blocker_options": options,
+                "similarity": config['similarity'],
+                "recall": metrics['recall'],
+                "precision": metrics['precision'],
+                "reference_pairs": metrics['reference_pairs'],
+                "predicted_pairs": metrics['predicted_pairs'],
+                "estimated_unique_keys": round(full_distinct),
+                "estimated_candidate_pairs": round(measured['candidate_pairs'] * growth),
+                "estimated_scored_pairs": round(measured['scored_pairs'] * growth),
+                "estimated_seconds": round(seconds, 1),
+                "sample": {field: round(value, 4) if isinstance(value, float) else value
+                           for field, value in measured.items()},
+            })
+    return {"corpus": corpus, "plans": plans}
+
+def choose_plan(plans, recall, preset):
+    """presetのプランのうち、再現率がrecall以上で見積もり時間が最短のものを選ぶ（なければ再現率が最大のもの）
+
+    プリセットごとに類似度の定義（スコア関数・しきい値）が異なるため、プリセットは変えずにブロッカーだけを選ぶ。
+    """
+    plans = [plan for plan in plans if plan['preset'] == preset]
+    meeting = [plan for plan in plans if plan['recall'] >= recall]
+    if meeting:
+        # 見積もり時間が同じなら採点するペアの少ないプランを選ぶ
+        return min(meeting, key=lambda plan: (plan['estimated_seconds'], plan['estimated_scored_pairs'],
+                                              -plan['recall'])), True
+    return max(plans, key=lambda plan: (plan['recall'], -plan['estimated_seconds'])), False
+
+def format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}分"
+    return f"{seconds / 3600:.1f}時間"
+
+def plan_command(plan, input_file, output_file):
+    command = f"python pipeline.py {input_file} {output_file or 'output.csv'} --preset {plan['preset']} --blocker {plan['blocker']}"
+    if plan['blocker'] == 'idf':
+        command += f" --idf-mode {plan['blocker_options']['mode']}"
+    return command
+
+def print_plans(estimates, chosen, met, recall):
+    corpus = estimates['corpus']
+    length = corpus['length']
+    print(f"コーパス: 全{corpus['rows']}件、正規化テキストの異なり数 約{corpus['distinct_normalized_estimate']}件、"
+          f"完全一致の重複率 {corpus['duplicate_rate_estimate'] * 100:.1f}%")
+    print(f"  抽出{corpus['sample_rows']}件: 文字数 p50 {length['p50']}・p90 {length['p90']}・最大 {length['max']}、"
+          f"語彙 {corpus['vocabulary']}語、1件あたり{corpus['tokens_per_text']}トークン")
+    if corpus['top_document_frequency']:
+        frequent = '、'.join(f"{item['token']}({item['df'] * 100:.0f}%)" for item in corpus['top_document_frequency'][:5])
+        print(f"  文書頻度の高いトークン: {frequent}")
+    print("見積もり（再現率・適合率は同じプリセットの全ペア比較に対する、同じグループになった行の組の割合）:")
+    print(f"  {'プリセット':<14}{'ブロッカー':<12}{'しきい値':>6}{'候補ペア':>14}{'採点ペア':>14}{'再現率':>8}{'適合率':>8}"
+          f"{'組(抽出)':>10}{'時間':>10}")
+    for plan in sorted(estimates['plans'], key=lambda plan: (plan['estimated_seconds'], plan['estimated_scored_pairs'])):
+        mark = '*' if plan is chosen else ' '
+        print(f"{mark} {plan['preset']:<14}{plan['blocking']:<12}{plan['similarity']:>6}"
+              f"{plan['estimated_candidate_pairs']:>14}{plan['estimated_scored_pairs']:>14}"
+              f"{plan['recall']:>8.3f}{plan['precision']:>8.3f}{plan['predicted_pairs']:>10}"
+              f"{format_seconds(plan['estimated_seconds']):>10}")
+    compared = sorted({plan['preset'] for plan in estimates['plans']} - {chosen['preset']})
+    if compared:
+        print(f"  {'、'.join(compared)}は比較のための見積もりで、選択の対象にはしません")
+    if not met:
+        print(f"再現率{recall}以上のプランがないため、再現率が最大のプランを選びました")
+    print(f"選択したプラン: {chosen['preset']}（{PRESET_SCRIPTS[chosen['preset']]}相当）、ブロッカー {chosen['blocking']}、"
+          f"見積もり {format_seconds(chosen['estimated_seconds'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description='コーパスの統計から類似グループ化のブロッカーを選ぶプランナー')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('output_file', nargs='?', default=None, help='指定すると選んだプランでそのまま実行する')
+    parser.add_argument('--recall', type=float, default=0.95, help='満たすべき再現率（0.0〜1.0）')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='word',
+                        help='実行するプリセット（このプリセットのままブロッカーだけを選ぶ）')
+    parser.add_argument('--compare', nargs='+', choices=sorted(PRESETS), default=[],
+                        help='比較のために見積もりだけを表示するプリセット（選択の対象にはしない）')
+    parser.add_argument('--sample', type=int, default=PLAN_SAMPLE, help='見積もりに使う抽出件数')
+    parser.add_argument('--seed', type=int, default=0, help='抽出に使う乱数の種')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+
+    args = parser.parse_args()
+    start_time = time.time()
+    presets = [args.preset] + [preset for preset in args.compare if preset != args.preset]
+    estimates = estimate_plans(args.input_file, args.id_col, args.text_col, args.sample, presets, args.seed)
+    chosen, met = choose_plan(estimates['plans'], args.recall, args.preset)
+    estimates['chosen'] = chosen
+    estimates['recall_target'] = args.recall
+    print_plans(estimates, chosen, met, args.recall)
+    print(f"見積もり時間: {time.time() - start_time:.2f}秒")
+    print(f"実行コマンド: {plan_command(chosen, args.input_file, args.output_file)}")
+
+    if args.output_file is None:
+        return estimates
+    with open(args.output_file + ".plan.json", 'w', encoding='utf-8') as f:
+        json.dump(estimates, f, ensure_ascii=False, indent=2)
+    options = dict(PRESETS[chosen['preset']])
+    similarity = options.pop('similarity')
+    start_time = time.time()
+    run_pipeline(args.input_file, args.output_file, similarity, args.id_col, args.text_col, blocker=chosen['blocker'],
+                 blocker_options=chosen['blocker_options'], **options)
+    print(f"処理時間: {time.time() - start_time:.2f}秒（見積もり {format_seconds(chosen['estimated_seconds'])}）")
+    return estimates
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import csv
+import heapq
+import json
+import math
+import random
+import time
+from array import array
+
+from comment_table import key_digest
+from pipeline import BATCH_SIZE, NORMALIZERS, new_batch, read_batches, resolve
+from compressed_io import open_text
+
+PREVIEW_SAMPLE = 10000
+TOP_K = 20
+HLL_PRECISION = 14
+CMS_WIDTH = 1 << 17
+CMS_DEPTH = 4
+DIGEST_CACHE_SIZE = 200000
+
+class HyperLogLog:
+    """異なり数を一定のメモリ（2^precisionバイト）で推定する（標準誤差はおよそ1.04/√2^precision）"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.rest_bits = 64 - precision
+        self.rest_mask = (1 << self.rest_bits) - 1
+
+    def add(self, digest):
+        value = int.from_bytes(digest[:8], 'little')
+        index = value >> self.rest_bits
+        # 残りのビットの先頭から続く0の数 + 1
+        rank = self.rest_bits - (value & self.rest_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # 要素が少ない間は空のレジスタの数から数える（linear counting）
+            return m * math.log(m / zeros)
+        return raw
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+class CountMinSketch:
+    """キーの出現回数を過大側にだけ誤差のある形で数える（誤差は全件数のおよそe/width倍以内）"""
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counts = [array('I', bytes(4 * width)) for _ in range(depth)]
+
+    def add(self, digest):
+        """キーの出現を1回数え、更新後の推定回数を返す"""
+        estimate = None
+        for row in range(self.depth):
+            column = int.from_bytes(digest[4 * row:4 * row + 4], 'little') % self.width
+            counts = self.counts[row]
+            counts[column] += 1
+            if estimate is None or counts[column] < estimate:
+                estimate = counts[column]
+        return estimate
+
+class TopK:
+    """推定回数の多いk個のキーをヒープで保持する（更新されたキーの古い要素は取り出すときに読み捨てる）"""
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.counts = {}
+        self.texts = {}
+        self.heap = []
+
+    def discard_stale(self):
+        while self.heap and self.counts.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def offer(self, key, count, text):
+        if key not in self.counts:
+            if len(self.counts) >= self.k:
+                self.discard_stale()
+                if count <= self.heap[0][0]:
+                    return
+                _, evicted = heapq.heappop(self.heap)
+                del self.counts[evicted], self.texts[evicted]
+            self.texts[key] = text
+        self.counts[key] = count
+        heapq.heappush(self.heap, (count, key))
+        if len(self.heap) > 8 * self.k:
+            self.heap = [(c, k) for k, c in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def items(self):
+        """(推定回数, テキスト) を回数の多い順に返す"""
+        return sorted(((count, self.texts[key]) for key, count in self.counts.items()), key=lambda item: -item[0])
+
+class Reservoir:
+    """全体から一様にsize件を抽出する（Algorithm L: 置き換える行までを乱数で読み飛ばす）"""
+
+    def __init__(self, size, seed=0):
+        if size < 1:
+            raise ValueError(f"抽出件数は1以上で指定してください: {size}")
+        self.size = size
+        self.random = random.Random(seed)
+        self.items = []
+        self.weight = math.exp(math.log(1.0 - self.random.random()) / size)
+        self.next_index = size + self.skip()
+
+    def skip(self):
+        return math.floor(math.log(1.0 - self.random.random()) / math.log(1.0 - self.weight)) if self.weight < 1.0 else 0
+
+    def offer(self, index, item):
+        if index < self.size:
+            self.items.append(item)
+        elif index == self.next_index:
+            self.items[self.random.randrange(self.size)] = item
+            self.weight *= math.exp(math.log(1.0 - self.random.random()) / self.size)
+            self.next_index += self.skip() + 1
+
+def preview_file(input_file, id_col=0, text_col=1, sample_size=PREVIEW_SAMPLE, normalizer='neologdn',
+                 source_col=None, top_k=TOP_K, precision=HLL_PRECISION, seed=0, reader_workers=1, io_stats=None):
+    """ファイルを1回走査して、正規化テキストの異なり数・重複の多いテンプレート・重複率を推定し、一様な抽出を行う
+
+    抽出した行は (行番号, ID, テキスト, ソースファイル名) のリストとして入力順に返す。
+    """
+    normalize = resolve(NORMALIZERS[normalizer])
+    hll = HyperLogLog(precision)
+    cms = CountMinSketch()
+    top = TopK(top_k)
+    reservoir = Reservoir(sample_size, seed)
+
+    start_time = time.time()
+    if reader_workers > 1:
+        from parallel_reader import read_batches_parallel
+        batches = read_batches_parallel(input_file, id_col, text_col, None, BATCH_SIZE, source_col, reader_workers)
+    else:
+        batches = read_batches(input_file, id_col, text_col, None, BATCH_SIZE, source_col, io_stats)
+
+    rows = empty = 0
+    # 同じ原文は正規化の結果も同じなので、定型文の正規化は1回で済ませる（原文もダイジェストで持ち、メモリを抑える）
+    digests = {}
+    for batch in batches:
+        sources = batch.get('sources') or [None] * len(batch['ids'])
+        for row_id, text, source in zip(batch['ids'], batch['texts'], sources):
+            text_digest = key_digest(text)
+            if text_digest in digests:
+                digest = digests[text_digest]
+            else:
+                digest = key_digest(normalize(text))
+                if len(digests) < DIGEST_CACHE_SIZE:
+                    digests[text_digest] = digest
+            if digest is None:
+                # 正規化すると空になる行はグループ化されないため、それぞれ異なる行として数える
+                empty += 1
+            else:
+                hll.add(digest)
+                count = cms.add(digest)
+                if count > 1:
+                    top.offer(digest, count, text)
+            reservoir.offer(rows, (rows, row_id, text, source))
+            rows += 1
+
+    distinct = min(hll.estimate() + empty, rows)
+    preview = {
+        "rows": rows,
+        "distinct_normalized_estimate": round(distinct),
+        "distinct_relative_error": round(hll.relative_error(), 4),
+        "duplicate_rate_estimate": round(1 - distinct / rows, 4) if rows else 0.0,
+        "top_templates": [{"count_estimate": count, "text": text} for count, text in top.items()],
+        "sample_size": len(reservoir.items),
+        "seed": seed,
+        "seconds": round(time.time() - start_time, 3),
+    }
+    return preview, sorted(reservoir.items)
+
+def sample_batches(sample, batch_size=BATCH_SIZE, source_col=None):
+    """抽出した行をread_batchesと同じ形のバッチにして返す"""
+    for start in range(0, len(sample), batch_size):
+        batch = new_batch(source_col)
+        for _, row_id, text, source in sample[start:start + batch_size]:
+            batch['ids'].append(row_id)
+            batch['texts'].append(text)
+            if source_col is not None:
+                batch['sources'].append(source)
+        yield batch
+
+def print_preview(preview):
+    print(f"プレビュー（{preview['seconds']}秒）: 全{preview['rows']}件")
+    print(f"  正規化テキストの異なり数（推定）: 約{preview['distinct_normalized_estimate']}件"
+          f"（誤差 ±{preview['distinct_relative_error'] * 100:.1f}%程度）")
+    print(f"  完全一致の重複率（推定）: {preview['duplicate_rate_estimate'] * 100:.2f}%")
+    if preview['top_templates']:
+        print("  重複の多いテンプレート（推定件数）:")
+        for template in preview['top_templates'][:10]:
+            text = template['text'].replace('\n', ' ')
+            print(f"    {template['count_estimate']}件: {text[:60]}{'…' if len(text) > 60 else ''}")
+    print(f"  一様抽出: {preview['sample_size']}件")
+
+def main():
+    parser = argparse.ArgumentParser(description='CSVファイルを1回走査して重複の規模を推定するプレビュー')
+    parser.add_argument('input_file', help='入力CSVファイルのパス')
+    parser.add_argument('--id-col', type=int, default=0, help='IDの列番号（0始まり）')
+    parser.add_argument('--text-col', type=int, default=1, help='テキストの列番号（0始まり）')
+    parser.add_argument('--sample', type=int, default=PREVIEW_SAMPLE, help='一様に抽出する件数')
+    parser.add_argument('--top', type=int, default=TOP_K, help='表示する重複の多いテンプレートの数')
+    parser.add_argument('--precision', type=int, default=HLL_PRECISION,
+                        help='HyperLogLogのレジスタ数の指数（大きいほど正確でメモリが増える）')
+    parser.add_argument('--seed', type=int, default=0, help='抽出に使う乱数の種')
+    parser.add_argument('--sample-output', default=None, help='抽出した行を書き出すCSVファイルのパス')
+    parser.add_argument('--json', default=None, help='推定結果を書き出すJSONファイルのパス')
+
+    args = parser.parse_args()
+    if args.sample < 1:
+        parser.error("--sampleは1以上で指定してください")
+    preview, sample = preview_file(args.input_file, args.id_col, args.text_col, args.sample, top_k=args.top,
+                                   precision=args.precision, seed=args.seed)
+    print_preview(preview)
+
+    if args.sample_output:
+        with open_text(args.sample_output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'text'])
+            writer.writerows((row_id, text) for _, row_id, text, _ in sample)
+        print(f"抽出した行を{args.sample_output}に保存しました")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(preview, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
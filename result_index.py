@@ -0,0 +1,163 @@
+import json
+import mmap
+import os
+import re
+
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
+REPRESENTATIVE_COLUMN = 'representative_text'
+STREAM_BYTES = 64 * 1024
+UNQUOTED_END = re.compile(rb'[,\n]')
+
+def scan_field(data, pos):
+    """posから始まるCSVのフィールドを読み飛ばし、(値の開始, 値の終了, 次のフィールドの開始, 引用符付きか, 行末か) を返す"""
+    if data[pos:pos + 1] == b'"':
+        start = pos + 1
+        end = start
+        while True:
+            end = data.find(b'"', end)
+            if end < 0:
+                raise ValueError(f"引用符が閉じられていません（{pos}バイト目）")
+            if data[end + 1:end + 2] == b'"':  # "" は引用符そのもの
+                end += 2
+                continue
+            break
+        after = end + 1
+        quoted = True
+    else:
+        start = pos
+        match = UNQUOTED_END.search(data, pos)
+        end = after = match.start() if match else len(data)
+        quoted = False
+
+    terminator = data[after:after + 1]
+    if terminator == b',':
+        return start, end, after + 1, quoted, False
+    # 行末（\r\nにも対応）またはファイル末尾
+    if terminator == b'\r':
+        after += 1
+    value_end = end - 1 if not quoted and end > start and data[end - 1:end] == b'\r' else end
+    return start, value_end, after + 1, quoted, True
+
+def field_value(data, start, end, quoted):
+    value = bytes(data[start:end])
+    if quoted:
+        value = value.replace(b'""', b'"')
+    return value.decode('utf-8')
+
+def read_record(data, pos):
+    """1行分のフィールドの (値の開始, 値の終了, 引用符付きか) のリストと次の行の開始位置を返す"""
+    fields = []
+    while True:
+        start, end, pos, quoted, line_end = scan_field(data, pos)
+        fields.append((start, end, quoted))
+        if line_end:
+            return fields, pos
+
+class ResultIndex:
+    """グループ化結果（1グループ1行のCSV）の各行の位置を記録した索引
+
+    索引は結果ファイルの隣に「ファイル名.idx.json」として保存し、結果ファイルの大きさと更新時刻が
+    変わっていなければ再利用する。メンバーの原文はoriginal_textsのセルを行ごと読み込まずに、
+    '|'区切りで1件ずつ取り出す。
+    """
+
+    def __init__(self, path, entries, header):
+        self.path = path
+        self.header = header
+        # [group_id, match_type, count, 行の開始, 代表テキストのセルの (開始, 終了, 引用符付きか), 原文のセルの (同)]
+        self.entries = entries
+        self.positions = {entry[0]: k for k, entry in enumerate(entries)}
+
+    @classmethod
+    def open(cls, path, rebuild=False):
+        """索引を読み込む（ない・古い場合は作成して保存する）"""
+        info = os.stat(path)
+        index_path = path + INDEX_SUFFIX
+        if not rebuild and os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if (saved.get('version') == INDEX_VERSION and saved['size'] == info.st_size
+                    and saved['mtime_ns'] == info.st_mtime_ns):
+                return cls(path, saved['entries'], saved['header'])
+
+        index = cls.build(path)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": INDEX_VERSION, "size": info.st_size, "mtime_ns": info.st_mtime_ns,
+                       "header": index.header, "entries": index.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+        return index
+
+    @classmethod
+    def build(cls, path):
+        """結果ファイルを1回走査して索引を作る（大きなセルは読み飛ばす）"""
+        entries = []
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(path, entries, [])
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                fields, pos = read_record(data, 0)
+                header = [field_value(data, *field) for field in fields]
+                header[0] = header[0].lstrip('\ufeff')
+                representative_col = header.index(REPRESENTATIVE_COLUMN)
+                texts_col = header.index('original_texts')
+                size = len(data)
+                while pos < size:
+                    row_start = pos
+                    fields, pos = read_record(data, pos)
+                    if len(fields) <= texts_col:
+                        continue
+                    group_id, match_type, count = (field_value(data, *field) for field in fields[:3])
+                    entries.append([group_id, match_type, int(count), row_start,
+                                    *fields[representative_col], *fields[texts_col]])
+        return cls(path, entries, header)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def groups(self, match_type=None, min_count=0, order='file'):
+        """条件に合うグループの (group_id, match_type, count) を、出力順（order='size'なら件数の多い順）に返す"""
+        entries = [entry for entry in self.entries
+                   if entry[2] >= min_count and (match_type is None or entry[1] == match_type)]
+        if order == 'size':
+            entries.sort(key=lambda entry: -entry[2])
+        return [tuple(entry[:3]) for entry in entries]
+
+    def row(self, group_id):
+        """1グループの行をCSVとして読み込んで返す"""
+        entry = self.entries[self.positions[group_id]]
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                fields, _ = read_record(data, entry[3])
+                return [field_value(data, *field).replace('\r\n', '\n') for field in fields]
+
+    def representative_text(self, group_id):
+        start, end, quoted = self.entries[self.positions[group_id]][4:7]
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return decode_text(f.read(end - start), quoted)
+
+    def member_texts(self, group_id):
+        """1グループのメンバーの原文を、セル全体を読み込まずに先頭から1件ずつ返す"""
+        start, end, quoted = self.entries[self.positions[group_id]][7:10]
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            pending = b''
+            while remaining > 0:
+                chunk = f.read(min(STREAM_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                pieces = (pending + chunk).split(b'|')
+                pending = pieces.pop()
+                for piece in pieces:
+                    yield decode_text(piece, quoted)
+            yield decode_text(pending, quoted)
+
+def decode_text(piece, quoted):
+    if quoted:
+        piece = piece.replace(b'""', b'"')
+    # 逐次のCSV読み込み（改行コードの変換あり）と同じ値にそろえる
+    return piece.decode('utf-8').replace('\r\n', '\n')
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+class PairScoreCache:
+    """(i, j) の行番号の組をキーにした類似度の上限付きLRUキャッシュ
+
+    類似度関数は引数の順序で結果が変わり得るため、組は呼び出し順のまま扱う。
+    """
+
+    def __init__(self, maxsize=1000000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def get(self, i, j):
+        """キャッシュ済みの類似度を返す（未登録の場合はNone）"""
+        score = self._scores.get((i, j))
+        if score is None:
+            self.misses += 1
+            return None
+        self._scores.move_to_end((i, j))
+        self.hits += 1
+        return score
+
+    def put(self, i, j, score):
+        self._scores[(i, j)] = score
+        self._scores.move_to_end((i, j))
+        if len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+    def score(self, i, j, score_fn, *args):
+        """キャッシュにあればそれを返し、なければscore_fn(*args)を計算して登録する"""
+        score = self.get(i, j)
+        if score is None:
+            score = score_fn(*args)
+            self.put(i, j, score)
+        return score
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._scores),
+            "maxsize": self.maxsize,
+        }
+
+def cached_scorer(score_fn, keys, cache):
+    """キーの番号で呼び出せるキャッシュ付きの類似度関数を作る"""
+    def score(i, j):
+        return cache.score(i, j, score_fn, keys[i], keys[j])
+    return score
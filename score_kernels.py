@@ -0,0 +1,182 @@
+from collections import Counter
+
+# numpyの呼び出しの固定費が1組ずつの計算を上回らない件数（これより少ない候補は1組ずつ計算する）
+MIN_BATCH = 8
+KINDS = {'jaccard': 0, 'weighted': 1, 'extended': 2}
+
+def _pair_kernel(offsets, ids, counts, distinct, lengths, left, right, kind, out):
+    """トークン番号の昇順に並んだ2つの列を突き合わせて、組ごとの類似度をoutに書き込む（numbaでコンパイルする）"""
+    for p in range(len(left)):
+        a = left[p]
+        b = right[p]
+        if lengths[a] == 0 or lengths[b] == 0:
+            out[p] = 0.0
+            continue
+        x = offsets[a]
+        x_end = offsets[a + 1]
+        y = offsets[b]
+        y_end = offsets[b + 1]
+        common_distinct = 0
+        common_weight = 0
+        while x < x_end and y < y_end:
+            if ids[x] < ids[y]:
+                x += 1
+            elif ids[x] > ids[y]:
+                y += 1
+            else:
+                common_distinct += 1
+                common_weight += min(counts[x], counts[y])
+                x += 1
+                y += 1
+        if kind == 0:
+            out[p] = common_distinct / (distinct[a] + distinct[b] - common_distinct)
+        else:
+            base = common_weight / (lengths[a] + lengths[b] - common_weight)
+            if kind == 1:
+                out[p] = base
+            else:
+                ratio = min(lengths[a], lengths[b]) / max(lengths[a], lengths[b])
+                out[p] = base * (1 + ratio) / 2
+
+_compiled_kernel = None
+
+def compiled_kernel():
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        import numba
+        _compiled_kernel = numba.njit(cache=True, nogil=True)(_pair_kernel)
+    return _compiled_kernel
+
+class TokenArrays:
+    """代表テキストのキーを、キーごとにトークン番号の昇順に並べた (番号, 出現回数) の連結配列にする"""
+
+    def __init__(self, keys):
+        import numpy as np
+
+        vocabulary = {}
+        offsets = [0]
+        ids = []
+        counts = []
+        distinct = []
+        lengths = []
+        for key in keys:
+            counter = Counter(key.split())
+            pairs = sorted((vocabulary.setdefault(word, len(vocabulary)), count) for word, count in counter.items())
+            ids.extend(token_id for token_id, _ in pairs)
+            counts.extend(count for _, count in pairs)
+            offsets.append(len(ids))
+            distinct.append(len(pairs))
+            lengths.append(sum(counter.values()))
+        self.vocabulary_size = len(vocabulary)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.ids = np.array(ids, dtype=np.int32)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.distinct = np.array(distinct, dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.int64)
+
+class BatchScorer:
+    """1件のキーと候補の配列、または組の配列の類似度をまとめて計算する
+
+    numbaがあればコンパイルした突き合わせのループ、なければ問い合わせ側の出現回数を語彙の長さの配列に
+    書き込んで候補のトークンをまとめて引くnumpyの計算を使う。どちらも元の類似度関数と同じ順序の
+    浮動小数点演算で、1組ずつ計算した場合と同じ値を返す。
+    """
+
+    def __init__(self, unique_keys, kind, score_fn, backend='auto'):
+        import numpy as np
+
+        self.np = np
+        self.unique_keys = unique_keys
+        self.kind = KINDS[kind]
+        self.score_fn = score_fn
+        self.kernel = None
+        if backend in ('auto', 'numba'):
+            try:
+                self.kernel = compiled_kernel()
+            except ImportError:
+                if backend == 'numba':
+                    raise
+        self.backend = 'numba' if self.kernel is not None else 'numpy'
+        self.tokens = TokenArrays(unique_keys)
+        self.query_counts = np.zeros(self.tokens.vocabulary_size, dtype=np.int64)
+        self.batches = 0
+        self.batched_pairs = 0
+
+    def score_pairs(self, left, right):
+        """組 (left[p], right[p]) ごとの類似度のリストを返す"""
+        np = self.np
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        self.batches += 1
+        self.batched_pairs += len(left)
+        if self.kernel is not None:
+            tokens = self.tokens
+            out = np.empty(len(left), dtype=np.float64)
+            self.kernel(tokens.offsets, tokens.ids, tokens.counts, tokens.distinct, tokens.lengths, left, right,
+                        self.kind, out)
+            return out.tolist()
+
+        scores = np.empty(len(left), dtype=np.float64)
+        order = np.argsort(left, kind='stable')
+        heads, starts = np.unique(left[order], return_index=True)
+        for head, start, stop in zip(heads.tolist(), starts.tolist(), starts[1:].tolist() + [len(order)]):
+            positions = order[start:stop]
+            scores[positions] = self._score_query(head, right[positions])
+        return scores.tolist()
+
+    def score_many(self, i, candidates):
+        """キーiと候補の各キーの類似度のリストを返す"""
+        if len(candidates) < MIN_BATCH:
+            key = self.unique_keys[i]
+            return [self.score_fn(key, self.unique_keys[j]) for j in candidates]
+        if self.kernel is not None:
+            return self.score_pairs(self.np.full(len(candidates), i), candidates)
+        self.batches += 1
+        self.batched_pairs += len(candidates)
+        return self._score_query(i, self.np.asarray(candidates, dtype=self.np.int64)).tolist()
+
+    def _score_query(self, i, candidates):
+        np = self.np
+        tokens = self.tokens
+        starts = tokens.offsets[candidates]
+        sizes = tokens.offsets[candidates + 1] - starts
+        # 候補のトークンを連結した位置と、それぞれがどの候補のものか
+        segment = np.repeat(np.arange(len(candidates)), sizes)
+        positions = np.arange(len(segment)) - np.repeat(np.cumsum(sizes) - sizes, sizes) + np.repeat(starts, sizes)
+
+        query = slice(tokens.offsets[i], tokens.offsets[i + 1])
+        query_ids = tokens.ids[query]
+        self.query_counts[query_ids] = tokens.counts[query]
+        shared = self.query_counts[tokens.ids[positions]]
+        self.query_counts[query_ids] = 0
+
+        if self.kind == 0:
+            common = np.bincount(segment, weights=shared > 0, minlength=len(candidates))
+            total = tokens.distinct[i] + tokens.distinct[candidates] - common
+        else:
+            common = np.bincount(segment, weights=np.minimum(shared, tokens.counts[positions]),
+                                 minlength=len(candidates))
+            total = tokens.lengths[i] + tokens.lengths[candidates] - common
+        empty = (tokens.lengths[candidates] == 0) | (tokens.lengths[i] == 0)
+        scores = np.divide(common, total, out=np.zeros(len(candidates)), where=~empty)
+        if self.kind == 2:
+            lengths = tokens.lengths[candidates]
+            ratio = np.divide(np.minimum(lengths, tokens.lengths[i]), np.maximum(lengths, tokens.lengths[i]),
+                              out=np.zeros(len(candidates)), where=~empty)
+            scores = np.where(empty, 0.0, scores * (1 + ratio) / 2)
+        return scores
+
+    def stats(self):
+        return {"backend": self.backend, "batches": self.batches, "batched_pairs": self.batched_pairs}
+
+def batch_scorer(unique_keys, scorer_spec, score_fn, backend='auto'):
+    """スコア関数にまとめて計算する実装があればBatchScorerを、なければ（またはbackend='python'なら）Noneを返す"""
+    kind = scorer_spec.get('batch')
+    if kind is None or backend == 'python':
+        return None
+    try:
+        return BatchScorer(unique_keys, kind, score_fn, backend)
+    except ImportError:
+        if backend != 'auto':
+            raise
+        return None
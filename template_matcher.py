@@ -0,0 +1,129 @@
+import re
+from collections import deque
+
+# 「。」などで区切った文のうち、正規化後にこの文字数に満たないもの（「反対です」など）は照合に使わない
+MIN_SENTENCE_CHARS = 6
+SENTENCE_PATTERN = re.compile(r'[^。．.！？!?\n]+')
+
+class AhoCorasick:
+    """複数のパターンを1つのオートマトンにまとめ、テキストを1回走査して全ての出現を見つける"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.built = False
+
+    def add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append((len(pattern), value))
+        self.built = False
+
+    def build(self):
+        """幅優先で失敗遷移を求め、各状態の出力に失敗遷移先の出力を加える"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+        self.built = True
+
+    def search(self, text):
+        """(終了位置の次の位置, パターンの長さ, 値) を出現順に返す"""
+        if not self.built:
+            self.build()
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in outputs[state]:
+                yield position + 1, length, value
+
+    def __len__(self):
+        return len(self.goto)
+
+def template_sentences(text, normalize, min_chars=MIN_SENTENCE_CHARS):
+    """テンプレートを文に分けて正規化し、重複を除いたリストを返す（全て短い場合はテンプレート全体を1文とする）"""
+    sentences = []
+    for sentence in SENTENCE_PATTERN.findall(text):
+        normalized = normalize(sentence)
+        if len(normalized) >= min_chars and normalized not in sentences:
+            sentences.append(normalized)
+    if not sentences:
+        normalized = normalize(text)
+        if normalized:
+            sentences.append(normalized)
+    return sentences
+
+class TemplateMatcher:
+    """既知のテンプレートの文をAho-Corasickオートマトンにまとめ、正規化テキストに含まれるテンプレートを調べる
+
+    テンプレートの被覆率は、コメントに含まれていたテンプレートの文の文字数の割合、コメントの被覆率は、
+    コメントの正規化テキストのうちいずれかのテンプレートの文と一致した文字の割合とする。
+    """
+
+    def __init__(self, templates, normalize, min_chars=MIN_SENTENCE_CHARS):
+        self.templates = list(templates)
+        self.automaton = AhoCorasick()
+        self.sentence_lengths = []
+        self.total_lengths = []
+        patterns = {}
+        for template_id, text in enumerate(self.templates):
+            sentences = template_sentences(text, normalize, min_chars)
+            self.total_lengths.append(sum(len(sentence) for sentence in sentences))
+            for sentence in sentences:
+                # 複数のテンプレートに共通する文は1つのパターンにまとめる
+                pattern_id = patterns.get(sentence)
+                if pattern_id is None:
+                    pattern_id = patterns[sentence] = len(self.sentence_lengths)
+                    self.sentence_lengths.append((len(sentence), []))
+                    self.automaton.add(sentence, pattern_id)
+                self.sentence_lengths[pattern_id][1].append(template_id)
+        self.automaton.build()
+        self.patterns = len(patterns)
+
+    def match(self, normalized_text):
+        """(テンプレートの番号, テンプレートの被覆率) を被覆率の高い順に並べたリストと、コメントの被覆率を返す"""
+        found = set()
+        spans = []
+        for end, length, pattern_id in self.automaton.search(normalized_text):
+            found.add(pattern_id)
+            spans.append((end - length, end))
+        if not found:
+            return [], 0.0
+
+        matched = {}
+        for pattern_id in found:
+            length, template_ids = self.sentence_lengths[pattern_id]
+            for template_id in template_ids:
+                matched[template_id] = matched.get(template_id, 0) + length
+        matches = sorted(((template_id, length / self.total_lengths[template_id])
+                          for template_id, length in matched.items()), key=lambda item: (-item[1], item[0]))
+
+        covered = 0
+        covered_end = 0
+        for start, end in sorted(spans):
+            start = max(start, covered_end)
+            if end > start:
+                covered += end - start
+                covered_end = end
+        return matches, covered / len(normalized_text)